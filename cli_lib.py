@@ -1,7 +1,17 @@
 """Repeated and useful functionality"""
 
 import os
+import sys
 import argparse
+import contextlib
+
+from unifierlib.archive import StatArchive, ArchiveError
+from unifierlib.aggregate import summarize_archives
+from unifierlib.utility import summarize_stats, show_totals, WAN_TX_KEY, WAN_RX_KEY
+from unifierlib.windows import get_timezone, WindowError
+from unifierlib.profiling import Profiler
+from unifierlib.replay import Recorder, RecordingAdapter, ReplayAdapter, ReplayError
+from unifierlib.controller import DEFAULT_POOL_SIZE
 
 def make_arg_parser(description: str) -> argparse.ArgumentParser:
     """Makes an argument parser with possible defaults from the environment"""
@@ -52,3 +62,90 @@ def make_arg_parser(description: str) -> argparse.ArgumentParser:
                         default=False,
                         help="Show all records in human format")
     return parser
+
+def prompt_for_missing(host: str, user: str, password: str):
+    """Prompts for any connection details not given on the command line or environment"""
+    # Imported here so the argparse helpers don't need click installed
+    import click # pylint: disable=import-outside-toplevel
+    if not host:
+        host = click.prompt("Host")
+    if not user:
+        user = click.prompt("User")
+    if not password:
+        password = click.prompt("Password", hide_input=True)
+    return host, user, password
+
+def summarize_archive(path: str,
+                      site: str,
+                      interval: int,
+                      time_fmt: str,
+                      do_json=False,
+                      do_list=False,
+                      workers=1,
+                      timezone=None):
+    """Summarizes stats from an archive, exiting if it isn't for site and interval
+
+    Plain totals are read straight off the archive columns, split across workers
+    processes, without building a dict per record.
+    """
+    try:
+        tz = get_timezone(timezone)
+        with StatArchive(path, site=site, interval=interval) as archive:
+            stats = archive.read() if do_json or do_list else None
+    except (ArchiveError, WindowError) as err:
+        sys.exit(str(err))
+
+    if stats is not None:
+        summarize_stats(stats,
+                        time_fmt,
+                        do_json=do_json,
+                        do_list=do_list,
+                        tz=tz)
+        return
+
+    aggregate = summarize_archives([path], workers=workers, percentiles=False).get(site)
+    if aggregate:
+        show_totals(aggregate.sums[WAN_TX_KEY], aggregate.sums[WAN_RX_KEY])
+
+@contextlib.contextmanager
+def profiled(report: bool = False, stacks_path: str = None):
+    """Profiles the body when asked to, even if it exits early.
+
+    The phase and function report goes to stderr so it doesn't mix with JSON output,
+    and the folded stacks to stacks_path.
+    """
+    if not report and not stacks_path:
+        yield None
+        return
+    profiler = Profiler()
+    try:
+        with profiler:
+            yield profiler
+    finally:
+        if report:
+            sys.stderr.write(profiler.report())
+        if stacks_path:
+            with open(stacks_path, "w", encoding="utf-8") as stacks:
+                stacks.write(profiler.folded_stacks())
+
+@contextlib.contextmanager
+def transport(record_path: str = None, replay_path: str = None, time_scale: float = 1.0):
+    """Yields the adapter a Controller should use, None for the network as usual.
+
+    A recording is written when the body finishes, even if it exits early.
+    """
+    if replay_path:
+        try:
+            adapter = ReplayAdapter(replay_path, time_scale=time_scale)
+        except ReplayError as err:
+            sys.exit(str(err))
+        yield adapter
+        return
+    if not record_path:
+        yield None
+        return
+    with Recorder(record_path) as recorder:
+        yield RecordingAdapter(recorder,
+                               pool_connections=1,
+                               pool_maxsize=DEFAULT_POOL_SIZE,
+                               pool_block=True)
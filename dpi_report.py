@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""Script to rank applications by traffic across the sites of the local controller"""
+
+import json
+
+try:
+    from dotenv import load_dotenv
+    HAVE_DOT_ENV = True
+except ImportError:
+    HAVE_DOT_ENV = False
+
+import click
+
+from cli_lib import prompt_for_missing, profiled
+from unifierlib import Controller
+from unifierlib.dpi import dpi_report, DpiLookup, BY_APP, BY_CAT, DEFAULT_TOP
+from unifierlib.utility import HumanizedByte
+
+if HAVE_DOT_ENV:
+    load_dotenv()
+
+def show_entry(entry):
+    """Prints one ranked application or category"""
+    print(f"{entry.rank:>3}. {entry.name}: "
+          f"Up: {HumanizedByte(entry.tx_bytes)}; "
+          f"Down: {HumanizedByte(entry.rx_bytes)}; "
+          f"Sites: {entry.sites}")
+
+@click.command()
+@click.option("--host", "-H", "host",
+              envvar="UNIFI_HOST",
+              help="Hostname or IP address of the controller")
+@click.option("--port", "-p", "port",
+              envvar='UNIFI_PORT',
+              default=8443,
+              show_default=True,
+              help="Port number where the controller is hosting the API")
+@click.option("--user", "-u", "user",
+              envvar='UNIFI_USER',
+              help="Username with privileges to the API")
+@click.option("--password", "--pass", "--pwd", "-P", "password",
+              envvar='UNIFI_PASSWD',
+              help="Password for the user")
+@click.option("--site", "-s", "sites",
+              multiple=True,
+              help="Site to include, repeat for more; every site when not given")
+@click.option("--top", "-k", "top",
+              default=DEFAULT_TOP,
+              show_default=True,
+              type=click.IntRange(min=1),
+              help="Number of entries to show")
+@click.option("--by", "-b", "metric",
+              default="total",
+              show_default=True,
+              type=click.Choice(["total", "tx", "rx"]),
+              help="Traffic to rank on")
+@click.option("--categories", "-c", "categories",
+              default=False, is_flag=True,
+              help="Rank categories instead of applications")
+@click.option("--names", "-n", "names",
+              envvar="UNIFI_DPI_NAMES",
+              type=click.Path(exists=True, dir_okay=False),
+              help="JSON table of category and application names")
+@click.option("--json", "-j", "do_json",
+              default=False, is_flag=True,
+              help="Show the ranking in JSON format")
+@click.option("--profile", "profile",
+              default=False, is_flag=True,
+              help="Print time, CPU and allocations per phase and the slowest functions to stderr")
+@click.option("--profile-stacks", "profile_stacks",
+              type=click.Path(dir_okay=False),
+              help="Write folded stacks for a flame graph to this file")
+def main(host, port, user, password, sites, top, metric, categories, names, do_json,
+         profile, profile_stacks):
+    """Rank the applications seen by DPI across the sites of a Unifi Controller."""
+    with profiled(profile, profile_stacks):
+        host, user, password = prompt_for_missing(host, user, password)
+        controller = Controller(host,
+                                port,
+                                user,
+                                password,
+                                ssl_verify=False)
+        if not controller.logged_in:
+            return
+
+        lookup = DpiLookup.load(names) if names else None
+        report = dpi_report(controller,
+                            sites=list(sites) or None,
+                            count=top,
+                            by=BY_CAT if categories else BY_APP,
+                            metric=metric,
+                            lookup=lookup)
+        if report is None:
+            return
+        if do_json:
+            print(json.dumps({"top": [vars(entry) for entry in report.top],
+                              "failed": report.failed}))
+            return
+        for entry in report.top:
+            show_entry(entry)
+        if report.failed:
+            print(f"No DPI stats for: {', '.join(report.failed)}")
+
+if __name__ == "__main__":
+    #pylint: disable=no-value-for-parameter
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""Script to append new events or alarms of the local controller to a file"""
+
+try:
+    from dotenv import load_dotenv
+    HAVE_DOT_ENV = True
+except ImportError:
+    HAVE_DOT_ENV = False
+
+import click
+
+from cli_lib import prompt_for_missing, profiled
+from unifierlib import Controller
+from unifierlib.logs import ingest, JsonLinesSink, SINK_BATCH
+
+if HAVE_DOT_ENV:
+    load_dotenv()
+
+@click.command()
+@click.option("--host", "-H", "host",
+              envvar="UNIFI_HOST",
+              help="Hostname or IP address of the controller")
+@click.option("--port", "-p", "port",
+              envvar='UNIFI_PORT',
+              default=8443,
+              show_default=True,
+              help="Port number where the controller is hosting the API")
+@click.option("--user", "-u", "user",
+              envvar='UNIFI_USER',
+              help="Username with privileges to the API")
+@click.option("--password", "--pass", "--pwd", "-P", "password",
+              envvar='UNIFI_PASSWD',
+              help="Password for the user")
+@click.option("--site", "-s", "site",
+              envvar='UNIFI_SITE',
+              default="default",
+              show_default=True,
+              help="Site name on the controller")
+@click.option("--alarms", "-a", "alarms",
+              default=False, is_flag=True,
+              help="Ingest the alarms instead of the events")
+@click.option("--output", "-o", "output",
+              required=True,
+              type=click.Path(dir_okay=False),
+              help="File the records are appended to as JSON lines")
+@click.option("--cursor", "-c", "cursor",
+              type=click.Path(dir_okay=False),
+              help="File remembering what was ingested, default is the output with .cursor")
+@click.option("--batch-size", "-b", "batch_size",
+              default=SINK_BATCH,
+              show_default=True,
+              type=click.IntRange(min=1),
+              help="Records written between cursor saves")
+@click.option("--profile", "profile",
+              default=False, is_flag=True,
+              help="Print time, CPU and allocations per phase and the slowest functions to stderr")
+@click.option("--profile-stacks", "profile_stacks",
+              type=click.Path(dir_okay=False),
+              help="Write folded stacks for a flame graph to this file")
+def main(host, port, user, password, site, alarms, output, cursor, batch_size, profile,
+         profile_stacks):
+    """Append the events or alarms logged since the last run."""
+    with profiled(profile, profile_stacks):
+        host, user, password = prompt_for_missing(host, user, password)
+        controller = Controller(host,
+                                port,
+                                user,
+                                password,
+                                site=site,
+                                ssl_verify=False)
+        if not controller.logged_in:
+            return
+
+        records = controller.iter_alarms if alarms else controller.iter_events
+        with JsonLinesSink(output) as sink:
+            report = ingest(records,
+                            sink,
+                            cursor_path=cursor or f"{output}.cursor",
+                            batch_size=batch_size)
+        print(f"Ingested {report.ingested} records in {report.batches} batches")
+
+if __name__ == "__main__":
+    #pylint: disable=no-value-for-parameter
+    main()
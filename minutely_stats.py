@@ -12,9 +12,14 @@ except ImportError:
 
 from unifierlib import Controller
 from unifierlib.utility import summarize_stats as summarize_minutes
+from unifierlib.controller import STAT_INTERVALS, MINUTELY_STAT_URL
+from unifierlib.archive import StatArchive
+from unifierlib.export import open_exporter
 
 import click
 
+from cli_lib import prompt_for_missing, summarize_archive, profiled, transport
+
 if HAVE_DOT_ENV:
     load_dotenv()
 
@@ -22,20 +27,30 @@ DATETIME_FORMAT = os.getenv('UNIFI_DT_FMT') or '%y-%m-%d %H:%M:%S'
 
 def summarize_stats(controller: Controller,
                     do_json=False,
-                    do_list=False):
+                    do_list=False,
+                    to_archive=None,
+                    export=None):
     """Collects and summarizes statistics"""
     if not controller.logged_in:
         return
 
     stats = controller.get_minutely_stats()
+    if stats and to_archive:
+        with StatArchive(to_archive,
+                         site=controller.site,
+                         interval=STAT_INTERVALS[MINUTELY_STAT_URL]) as archive:
+            archive.append(stats)
+    if stats and export:
+        with open_exporter(export) as exporter:
+            exporter.export(controller.site, MINUTELY_STAT_URL, stats)
     summarize_minutes(stats,
                       DATETIME_FORMAT,
                       do_json=do_json,
-                      do_list=do_list)
+                      do_list=do_list,
+                      tz=controller.timezone)
 
 @click.command()
 @click.option("--host", "-H", "host",
-              prompt=True,
               envvar="UNIFI_HOST",
               help="Hostname or IP address of the controller")
 @click.option("--port", "-p", "port",
@@ -45,12 +60,9 @@ def summarize_stats(controller: Controller,
               help="Port number where the controller is hosting the API")
 @click.option("--user", "-u", "user",
               envvar='UNIFI_USER',
-              prompt=True,
               help="Username with privileges to the API")
 @click.option("--password", "--pass", "--pwd", "-P", "password",
               envvar='UNIFI_PASSWD',
-              prompt=True,
-              required=True,
               help="Password for the user")
 @click.option("--site", "-s", "site",
               envvar='UNIFI_SITE',
@@ -63,21 +75,78 @@ def summarize_stats(controller: Controller,
 @click.option("--list", "-l", "do_list",
               default=False, is_flag=True,
               help="Show all records in human format")
-def main(host, port, user, password, site, do_json, do_list):
+@click.option("--from-archive", "from_archive",
+              type=click.Path(exists=True, dir_okay=False),
+              help="Summarize stats from a binary archive instead of the controller")
+@click.option("--to-archive", "to_archive",
+              type=click.Path(dir_okay=False),
+              help="Append the fetched stats to a binary archive")
+@click.option("--export", "export",
+              type=click.Path(dir_okay=False),
+              help="Upsert the fetched stats into a SQLite file (.db, .sqlite) "
+                   "or append them as InfluxDB line protocol")
+@click.option("--workers", "-w", "workers",
+              default=1,
+              show_default=True,
+              type=click.IntRange(min=1),
+              help="Processes used to total an archive given with --from-archive")
+@click.option("--timezone", "-z", "timezone",
+              envvar='UNIFI_TZ',
+              help="Site time zone such as Europe/Berlin, read from the controller if not given")
+@click.option("--profile", "profile",
+              default=False, is_flag=True,
+              help="Print time, CPU and allocations per phase and the slowest functions to stderr")
+@click.option("--profile-stacks", "profile_stacks",
+              type=click.Path(dir_okay=False),
+              help="Write folded stacks for a flame graph to this file")
+@click.option("--record", "record",
+              type=click.Path(dir_okay=False),
+              help="Record the controller traffic, without credentials, to this file")
+@click.option("--replay", "replay",
+              type=click.Path(exists=True, dir_okay=False),
+              help="Answer from a file written by --record instead of the controller")
+@click.option("--replay-time-scale", "replay_time_scale",
+              default=1.0,
+              show_default=True,
+              type=click.FloatRange(min=0),
+              help="Multiplier on the recorded response times, 0 replays at full speed")
+def main(host, port, user, password, site, do_json, do_list, from_archive, to_archive,
+         export, workers, timezone, profile, profile_stacks, record, replay,
+         replay_time_scale):
     """Gather minutely data usage stats from a Unfi Controller."""
+    with profiled(profile, profile_stacks), \
+            transport(record, replay, replay_time_scale) as adapter:
+        if from_archive:
+            summarize_archive(from_archive,
+                              site,
+                              STAT_INTERVALS[MINUTELY_STAT_URL],
+                              DATETIME_FORMAT,
+                              do_json=do_json,
+                              do_list=do_list,
+                              workers=workers,
+                              timezone=timezone)
+            return
 
-    controller = Controller(host,
-                            port,
-                            user,
-                            password,
-                            site=site,
-                            ssl_verify=False)
-    if not controller.logged_in:
-        return
+        if replay:
+            # Nothing is sent anywhere, the recording has no credentials to match
+            host, user, password = host or "replay", user or "replay", password or "replay"
+        host, user, password = prompt_for_missing(host, user, password)
+        controller = Controller(host,
+                                port,
+                                user,
+                                password,
+                                site=site,
+                                ssl_verify=False,
+                                timezone=timezone,
+                                adapter=adapter)
+        if not controller.logged_in:
+            return
 
-    summarize_stats(controller,
-                    do_json=do_json,
-                    do_list=do_list)
+        summarize_stats(controller,
+                        do_json=do_json,
+                        do_list=do_list,
+                        to_archive=to_archive,
+                        export=export)
 
 if __name__ == "__main__":
     #pylint: disable=no-value-for-parameter
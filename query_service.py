@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""Script to serve the local controller's stats to other tools over a local JSON API"""
+
+try:
+    from dotenv import load_dotenv
+    HAVE_DOT_ENV = True
+except ImportError:
+    HAVE_DOT_ENV = False
+
+import click
+
+from cli_lib import prompt_for_missing, profiled
+from unifierlib import Controller
+from unifierlib.service import QueryService, make_server, CACHE_TTL, CACHE_ENTRIES, DEFAULT_PORT
+
+if HAVE_DOT_ENV:
+    load_dotenv()
+
+@click.command()
+@click.option("--host", "-H", "host",
+              envvar="UNIFI_HOST",
+              help="Hostname or IP address of the controller")
+@click.option("--port", "-p", "port",
+              envvar='UNIFI_PORT',
+              default=8443,
+              show_default=True,
+              help="Port number where the controller is hosting the API")
+@click.option("--user", "-u", "user",
+              envvar='UNIFI_USER',
+              help="Username with privileges to the API")
+@click.option("--password", "--pass", "--pwd", "-P", "password",
+              envvar='UNIFI_PASSWD',
+              help="Password for the user")
+@click.option("--listen", "-l", "listen",
+              envvar="UNIFIER_LISTEN",
+              default="127.0.0.1",
+              show_default=True,
+              help="Address to serve the query API on")
+@click.option("--listen-port", "-L", "listen_port",
+              envvar="UNIFIER_LISTEN_PORT",
+              default=DEFAULT_PORT,
+              show_default=True,
+              type=click.IntRange(min=0, max=65535),
+              help="Port to serve the query API on")
+@click.option("--ttl", "-t", "ttl",
+              default=CACHE_TTL,
+              show_default=True,
+              type=click.FloatRange(min=0),
+              help="Seconds an answer is served from the cache")
+@click.option("--cache-entries", "cache_entries",
+              default=CACHE_ENTRIES,
+              show_default=True,
+              type=click.IntRange(min=1),
+              help="Answers kept in the cache")
+@click.option("--rate-limit", "rate_limit",
+              type=click.FloatRange(min=0, min_open=True),
+              help="Most requests a second sent to the controller")
+@click.option("--profile", "profile",
+              default=False, is_flag=True,
+              help="Print time, CPU and allocations per phase and the slowest functions to stderr")
+@click.option("--profile-stacks", "profile_stacks",
+              type=click.Path(dir_okay=False),
+              help="Write folded stacks for a flame graph to this file")
+def main(host, port, user, password, listen, listen_port, ttl, cache_entries, rate_limit,
+         profile, profile_stacks):
+    """Serve a Unifi Controller's sites and stats from one login and a shared cache."""
+    with profiled(profile, profile_stacks):
+        host, user, password = prompt_for_missing(host, user, password)
+        controller = Controller(host,
+                                port,
+                                user,
+                                password,
+                                ssl_verify=False,
+                                rate_limit=rate_limit)
+        if not controller.logged_in:
+            return
+
+        server = make_server(QueryService(controller, ttl, cache_entries),
+                             listen,
+                             listen_port)
+        print(f"Serving on http://{listen}:{server.server_address[1]}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+if __name__ == "__main__":
+    #pylint: disable=no-value-for-parameter
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""Script to cross-check the 5 minute, hourly and daily reports of the local controller"""
+
+import os
+import sys
+import datetime
+import json
+
+try:
+    from dotenv import load_dotenv
+    HAVE_DOT_ENV = True
+except ImportError:
+    HAVE_DOT_ENV = False
+
+import click
+
+from cli_lib import prompt_for_missing, profiled
+from unifierlib import Controller
+from unifierlib.reconcile import reconcile, DEFAULT_TOLERANCE, DEFAULT_ABS_TOLERANCE
+from unifierlib.utility import HumanizedByte
+from unifierlib.windows import default_window as stats_window, midnight, to_local, format_time
+from unifierlib.windows import HOUR
+
+if HAVE_DOT_ENV:
+    load_dotenv()
+
+DATETIME_FORMAT = os.getenv('UNIFI_DT_FMT') or '%y-%m-%d %H:%M:%S'
+
+def default_window(tz=None):
+    """From the start of yesterday up to the last whole hour, on the calendar of tz"""
+    _, end = stats_window(HOUR, tz=tz)
+    start = midnight(to_local(end, tz).date() - datetime.timedelta(1), tz)
+    return start, end
+
+def show_discrepancies(title: str, discrepancies: list, tz=None):
+    """Prints one line per discrepancy, at the time on the wall clock of tz"""
+    print(f"{title}: {len(discrepancies)} discrepancies")
+    for entry in discrepancies:
+        time_str = format_time(entry.time, DATETIME_FORMAT, tz)
+        print(f"  {time_str} {entry.attribute}: "
+              f"Reported: {HumanizedByte(entry.reported)}; "
+              f"Summed: {HumanizedByte(entry.summed)}; "
+              f"Delta: {HumanizedByte(entry.delta)} ({entry.relative:.2%})")
+
+@click.command()
+@click.option("--host", "-H", "host",
+              envvar="UNIFI_HOST",
+              help="Hostname or IP address of the controller")
+@click.option("--port", "-p", "port",
+              envvar='UNIFI_PORT',
+              default=8443,
+              show_default=True,
+              help="Port number where the controller is hosting the API")
+@click.option("--user", "-u", "user",
+              envvar='UNIFI_USER',
+              help="Username with privileges to the API")
+@click.option("--password", "--pass", "--pwd", "-P", "password",
+              envvar='UNIFI_PASSWD',
+              help="Password for the user")
+@click.option("--site", "-s", "site",
+              envvar='UNIFI_SITE',
+              default="default",
+              show_default=True,
+              help="Site name on the controller")
+@click.option("--json", "-j", "do_json",
+              default=False, is_flag=True,
+              help="Show all discrepancies in JSON format")
+@click.option("--tolerance", "-t", "tolerance",
+              default=DEFAULT_TOLERANCE,
+              show_default=True,
+              help="Relative difference allowed between a bucket and its parts")
+@click.option("--abs-tolerance", "abs_tolerance",
+              default=DEFAULT_ABS_TOLERANCE,
+              show_default=True,
+              help="Difference in bytes always allowed between a bucket and its parts")
+@click.option("--timezone", "-z", "timezone",
+              envvar='UNIFI_TZ',
+              help="Site time zone such as Europe/Berlin, read from the controller if not given")
+@click.option("--profile", "profile",
+              default=False, is_flag=True,
+              help="Print time, CPU and allocations per phase and the slowest functions to stderr")
+@click.option("--profile-stacks", "profile_stacks",
+              type=click.Path(dir_okay=False),
+              help="Write folded stacks for a flame graph to this file")
+def main(host, port, user, password, site, do_json, tolerance, abs_tolerance, timezone,
+         profile, profile_stacks):
+    """Check that 5 minute stats add up to hourly, and hourly to daily."""
+    with profiled(profile, profile_stacks):
+        host, user, password = prompt_for_missing(host, user, password)
+        controller = Controller(host,
+                                port,
+                                user,
+                                password,
+                                site=site,
+                                ssl_verify=False,
+                                timezone=timezone)
+        if not controller.logged_in:
+            return
+
+        tz = controller.timezone
+        start, end = default_window(tz)
+        result = reconcile(controller,
+                           start,
+                           end,
+                           tolerance=tolerance,
+                           abs_tolerance=abs_tolerance)
+        if result is None:
+            sys.exit("Could not fetch all of the reports")
+
+        if do_json:
+            print(json.dumps({name: [vars(entry) for entry in entries]
+                              for name, entries in vars(result).items()}))
+            return
+        show_discrepancies("5 minute vs hourly", result.minutely_hourly, tz)
+        show_discrepancies("Hourly vs daily", result.hourly_daily, tz)
+
+if __name__ == "__main__":
+    #pylint: disable=no-value-for-parameter
+    main()
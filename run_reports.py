@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""Script to run scheduled report jobs from a config file in one long-lived process"""
+
+import sys
+
+try:
+    from dotenv import load_dotenv
+    HAVE_DOT_ENV = True
+except ImportError:
+    HAVE_DOT_ENV = False
+
+import click
+
+from cli_lib import prompt_for_missing, profiled
+from unifierlib import Controller
+from unifierlib.jobs import Scheduler, JobError, load_jobs, WORKERS
+from unifierlib.service import QueryService, CACHE_TTL
+from unifierlib.windows import get_timezone, WindowError
+
+if HAVE_DOT_ENV:
+    load_dotenv()
+
+def show_metrics(metrics):
+    """Prints each job's runs and durations to stderr"""
+    for name, job in sorted(metrics.items()):
+        mean = "-" if job.mean_duration is None else f"{job.mean_duration:.3f}s"
+        sys.stderr.write(f"{name}: {job.runs} runs, {job.failures} failed, "
+                         f"{job.skipped} skipped, {job.buckets} buckets; "
+                         f"mean {mean}, max {job.max_duration:.3f}s\n")
+
+@click.command()
+@click.option("--host", "-H", "host",
+              envvar="UNIFI_HOST",
+              help="Hostname or IP address of the controller")
+@click.option("--port", "-p", "port",
+              envvar='UNIFI_PORT',
+              default=8443,
+              show_default=True,
+              help="Port number where the controller is hosting the API")
+@click.option("--user", "-u", "user",
+              envvar='UNIFI_USER',
+              help="Username with privileges to the API")
+@click.option("--password", "--pass", "--pwd", "-P", "password",
+              envvar='UNIFI_PASSWD',
+              help="Password for the user")
+@click.option("--config", "-c", "config",
+              envvar="UNIFIER_JOBS",
+              required=True,
+              type=click.Path(exists=True, dir_okay=False),
+              help="JSON file of report jobs")
+@click.option("--workers", "-w", "workers",
+              default=WORKERS,
+              show_default=True,
+              type=click.IntRange(min=1),
+              help="Jobs run at the same time")
+@click.option("--timezone", "-z", "timezone",
+              envvar="UNIFI_TZ",
+              help="IANA time zone the schedules are read in, local time by default")
+@click.option("--ttl", "-t", "ttl",
+              default=CACHE_TTL,
+              show_default=True,
+              type=click.FloatRange(min=0),
+              help="Seconds fetched stats are shared between jobs")
+@click.option("--rate-limit", "rate_limit",
+              type=click.FloatRange(min=0, min_open=True),
+              help="Most requests a second sent to the controller")
+@click.option("--profile", "profile",
+              default=False, is_flag=True,
+              help="Print time, CPU and allocations per phase and the slowest functions to stderr")
+@click.option("--profile-stacks", "profile_stacks",
+              type=click.Path(dir_okay=False),
+              help="Write folded stacks for a flame graph to this file")
+def main(host, port, user, password, config, workers, timezone, ttl, rate_limit,
+         profile, profile_stacks):
+    """Run report jobs on their schedules from one login until interrupted."""
+    try:
+        jobs = load_jobs(config)
+        tz = get_timezone(timezone)
+    except (JobError, WindowError) as err:
+        sys.exit(str(err))
+    with profiled(profile, profile_stacks):
+        host, user, password = prompt_for_missing(host, user, password)
+        controller = Controller(host,
+                                port,
+                                user,
+                                password,
+                                ssl_verify=False,
+                                rate_limit=rate_limit)
+        if not controller.logged_in:
+            return
+
+        scheduler = Scheduler(QueryService(controller, ttl), jobs, workers=workers, tz=tz)
+        try:
+            scheduler.run()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            scheduler.stop()
+            show_metrics(scheduler.metrics)
+
+if __name__ == "__main__":
+    #pylint: disable=no-value-for-parameter
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""Script to rank the sites of the local controller by WAN traffic or clients"""
+
+import json
+
+try:
+    from dotenv import load_dotenv
+    HAVE_DOT_ENV = True
+except ImportError:
+    HAVE_DOT_ENV = False
+
+import click
+
+from cli_lib import prompt_for_missing, profiled
+from unifierlib import Controller
+from unifierlib.controller import DAILY_STAT_URL, HOURLY_STAT_URL, MINUTELY_STAT_URL
+from unifierlib.leaderboard import leaderboard, METRICS, DEFAULT_TOP
+from unifierlib.utility import HumanizedByte, WAN_TX_KEY, WAN_RX_KEY
+
+if HAVE_DOT_ENV:
+    load_dotenv()
+
+def show_entry(entry):
+    """Prints one ranked site, with its usage totals when they were fetched"""
+    counters = entry.counters
+    line = (f"{entry.rank:>3}. {counters.desc}: "
+            f"Up: {HumanizedByte(counters.wan_tx_rate)}/s; "
+            f"Down: {HumanizedByte(counters.wan_rx_rate)}/s; "
+            f"Clients: {counters.clients}")
+    if entry.stats:
+        total_tx = sum(stat_entry.get(WAN_TX_KEY) or 0 for stat_entry in entry.stats)
+        total_rx = sum(stat_entry.get(WAN_RX_KEY) or 0 for stat_entry in entry.stats)
+        line += f"; Used: {HumanizedByte(total_tx + total_rx)}"
+    print(line)
+
+@click.command()
+@click.option("--host", "-H", "host",
+              envvar="UNIFI_HOST",
+              help="Hostname or IP address of the controller")
+@click.option("--port", "-p", "port",
+              envvar='UNIFI_PORT',
+              default=8443,
+              show_default=True,
+              help="Port number where the controller is hosting the API")
+@click.option("--user", "-u", "user",
+              envvar='UNIFI_USER',
+              help="Username with privileges to the API")
+@click.option("--password", "--pass", "--pwd", "-P", "password",
+              envvar='UNIFI_PASSWD',
+              help="Password for the user")
+@click.option("--top", "-k", "top",
+              default=DEFAULT_TOP,
+              show_default=True,
+              type=click.IntRange(min=1),
+              help="Number of sites to show")
+@click.option("--by", "-b", "metric",
+              default="wan",
+              show_default=True,
+              type=click.Choice(list(METRICS)),
+              help="Counter to rank the sites on")
+@click.option("--usage", "-g", "granularity",
+              type=click.Choice([DAILY_STAT_URL, HOURLY_STAT_URL, MINUTELY_STAT_URL]),
+              help="Also total the default window of these stats for the top sites")
+@click.option("--json", "-j", "do_json",
+              default=False, is_flag=True,
+              help="Show the ranking in JSON format")
+@click.option("--profile", "profile",
+              default=False, is_flag=True,
+              help="Print time, CPU and allocations per phase and the slowest functions to stderr")
+@click.option("--profile-stacks", "profile_stacks",
+              type=click.Path(dir_okay=False),
+              help="Write folded stacks for a flame graph to this file")
+def main(host, port, user, password, top, metric, granularity, do_json, profile,
+         profile_stacks):
+    """Rank the sites of a Unifi Controller from one request."""
+    with profiled(profile, profile_stacks):
+        host, user, password = prompt_for_missing(host, user, password)
+        controller = Controller(host,
+                                port,
+                                user,
+                                password,
+                                ssl_verify=False)
+        if not controller.logged_in:
+            return
+
+        entries = leaderboard(controller, top=top, metric=metric, granularity=granularity)
+        if entries is None:
+            return
+        if do_json:
+            print(json.dumps([{"rank": entry.rank,
+                               "stats": entry.stats,
+                               **vars(entry.counters)} for entry in entries]))
+            return
+        for entry in entries:
+            show_entry(entry)
+
+if __name__ == "__main__":
+    #pylint: disable=no-value-for-parameter
+    main()
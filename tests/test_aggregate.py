@@ -0,0 +1,115 @@
+"""Tests the aggregate functionality"""
+
+import os
+import pickle
+import random
+import tempfile
+import unittest
+
+from unifierlib.aggregate import PercentileSketch, StatAggregate
+from unifierlib.aggregate import summarize_parallel, summarize_archives, combine
+from unifierlib.archive import StatArchive
+from unifierlib.utility import WAN_TX_KEY, WAN_RX_KEY
+
+def make_stats(count, seed):
+    """Makes random stats"""
+    rand = random.Random(seed)
+    return [{"time": i * 300,
+             WAN_TX_KEY: rand.randint(0, 10**9),
+             WAN_RX_KEY: rand.randint(0, 10**10)}
+            for i in range(count)]
+
+class TestAggregate(unittest.TestCase):
+    """Tests partial aggregates and parallel summarization"""
+    def test_ag_01(self):
+        """Tests the sketch stays within its relative accuracy"""
+        values = list(range(1, 10001))
+        sketch = PercentileSketch()
+        for value in values:
+            sketch.add(value)
+        for fraction in [0.0, 0.25, 0.5, 0.9, 0.99, 1.0]:
+            with self.subTest(fraction=fraction):
+                exact = values[int(fraction * (len(values) - 1))]
+                self.assertAlmostEqual(exact, sketch.quantile(fraction), delta=exact * 0.01)
+        self.assertIsNone(PercentileSketch().quantile(0.5))
+
+    def test_ag_02(self):
+        """Tests merged sketches match a single sketch and survive pickling"""
+        whole = PercentileSketch()
+        left = PercentileSketch()
+        right = PercentileSketch()
+        for value in range(0, 1000):
+            whole.add(value)
+            (left if value % 2 else right).add(value)
+        left.merge(pickle.loads(pickle.dumps(right)))
+        self.assertEqual(whole.count, left.count)
+        self.assertEqual(whole.quantile(0.5), left.quantile(0.5))
+        with self.assertRaises(ValueError):
+            left.merge(PercentileSketch(accuracy=0.05))
+
+    def test_ag_03(self):
+        """Tests merging partial aggregates equals one aggregate"""
+        stats = make_stats(1000, 1)
+        whole = StatAggregate()
+        whole.add(stats)
+        merged = StatAggregate()
+        for offset in range(0, 1000, 128):
+            partial = StatAggregate()
+            partial.add(stats[offset:offset + 128])
+            merged.merge(partial)
+        merged.merge(StatAggregate())
+        self.assertEqual(whole.count, merged.count)
+        self.assertEqual(whole.sums, merged.sums)
+        self.assertEqual(whole.minimums, merged.minimums)
+        self.assertEqual(whole.maximums, merged.maximums)
+        self.assertEqual((0, 999 * 300), (merged.start, merged.end))
+        self.assertEqual(sum(s[WAN_TX_KEY] for s in stats), merged.sums[WAN_TX_KEY])
+
+    def test_ag_04(self):
+        """Tests the process pool gives the same answer as in-process"""
+        series = {f"site{i}": make_stats(500 + i, i) for i in range(4)}
+        serial = summarize_parallel(series, workers=1, partition_size=100)
+        parallel = summarize_parallel(series, workers=2, partition_size=100)
+        for site in series:
+            with self.subTest(site=site):
+                self.assertEqual(serial[site].sums, parallel[site].sums)
+                self.assertEqual(len(series[site]), parallel[site].count)
+                self.assertEqual(serial[site].percentile(WAN_RX_KEY, 0.95),
+                                 parallel[site].percentile(WAN_RX_KEY, 0.95))
+        total = combine(parallel.values())
+        self.assertEqual(sum(len(stats) for stats in series.values()), total.count)
+
+    def test_ag_05(self):
+        """Tests worker counts below one are refused"""
+        for workers in [0, -1]:
+            with self.subTest(workers=workers):
+                with self.assertRaises(ValueError):
+                    summarize_parallel({"a": make_stats(10, 1)}, workers=workers)
+                with self.assertRaises(ValueError):
+                    summarize_archives([], workers=workers)
+
+    def test_ag_06(self):
+        """Tests totalling archives matches totalling their stats"""
+        with tempfile.TemporaryDirectory() as directory:
+            paths = []
+            series = {}
+            for index in range(3):
+                site = f"site{index}"
+                series[site] = make_stats(300 + index, index)
+                path = os.path.join(directory, site)
+                with StatArchive(path, site=site, interval=300) as archive:
+                    archive.append(series[site])
+                paths.append(path)
+            expected = summarize_parallel(series, workers=1, percentiles=False)
+            for workers in [1, 2]:
+                with self.subTest(workers=workers):
+                    result = summarize_archives(paths,
+                                                workers=workers,
+                                                partition_size=64,
+                                                percentiles=False)
+                    for site in series:
+                        self.assertEqual(expected[site].count, result[site].count)
+                        self.assertEqual(expected[site].sums, result[site].sums)
+                        self.assertEqual(expected[site].maximums, result[site].maximums)
+                        with self.assertRaises(ValueError):
+                            result[site].percentile(WAN_TX_KEY, 0.5)
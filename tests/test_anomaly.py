@@ -0,0 +1,90 @@
+"""Tests the incremental WAN anomaly detector"""
+
+import datetime
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+from unifierlib.anomaly import AnomalyDetector, hour_of_week, detect
+from unifierlib.utility import WAN_TX_KEY, WAN_RX_KEY
+
+WEEK = 7 * 86400
+# Monday 2021-03-01 00:00 UTC
+MONDAY = 1614556800
+
+def bucket(stat_time, t_x, r_x=100):
+    """One hourly stat entry"""
+    return {"time": stat_time, WAN_TX_KEY: t_x, WAN_RX_KEY: r_x}
+
+def weeks(count, t_x=100, hour=0):
+    """The same hour of the week over count weeks, tx wobbling around t_x"""
+    return [bucket(MONDAY + week * WEEK + hour * 3600, t_x + (week % 2) * 10)
+            for week in range(count)]
+
+class FakeSite:
+    """Answers get_hourly_stats for one site"""
+    def __init__(self, stats):
+        self.stats = stats
+        self.timezone = datetime.timezone.utc
+
+    def get_hourly_stats(self):
+        """The canned stats"""
+        return self.stats
+
+class TestAnomaly(unittest.TestCase):
+    """Tests scoring, incremental updates and persistence"""
+    def test_an_01(self):
+        """Tests the hour of the week follows the wall clock of the time zone"""
+        utc = datetime.timezone.utc
+        self.assertEqual(0, hour_of_week(MONDAY, utc))
+        self.assertEqual(167, hour_of_week(MONDAY - 3600, utc))
+        self.assertEqual(2, hour_of_week(MONDAY, datetime.timezone(datetime.timedelta(hours=2))))
+
+    def test_an_02(self):
+        """Tests a spike is flagged after the warm up and steady traffic is not"""
+        detector = AnomalyDetector(warmup=3, threshold=4)
+        utc = datetime.timezone.utc
+        self.assertEqual([], detector.update("a", weeks(6), utc))
+        spike = bucket(MONDAY + 6 * WEEK, 10000)
+        anomalies = detector.update("a", [spike], utc)
+        self.assertEqual([("a", "tx", 10000)],
+                         [(found.site, found.metric, found.value) for found in anomalies])
+        self.assertGreater(anomalies[0].score, 4)
+        # Old and repeated buckets are skipped rather than learned twice
+        self.assertEqual([], detector.update("a", weeks(7) + [spike], utc))
+        self.assertEqual(7, detector.baselines["a"].counts[0])
+        # Other hours of the week have no baseline yet
+        self.assertEqual([], detector.update("a", [bucket(MONDAY + 6 * WEEK + 3600, 10 ** 9)],
+                                             utc))
+
+    def test_an_03(self):
+        """Tests baselines survive a save and load and carry on from where they were"""
+        utc = datetime.timezone.utc
+        detector = AnomalyDetector(alpha=0.2)
+        detector.update("a", weeks(5), utc)
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "baselines.json")
+            self.assertEqual(0, len(AnomalyDetector.load(path)))
+            detector.save(path)
+            loaded = AnomalyDetector.load(path)
+        self.assertEqual(0.2, loaded.alpha)
+        self.assertEqual(detector.to_json(), loaded.to_json())
+        spike = [bucket(MONDAY + 5 * WEEK, 10000)]
+        self.assertEqual([(anomaly.metric, anomaly.score) for anomaly in
+                          detector.update("a", spike, utc)],
+                         [(anomaly.metric, anomaly.score) for anomaly in
+                          loaded.update("a", spike, utc)])
+
+    def test_an_04(self):
+        """Tests detect feeds every site and leaves failed sites alone"""
+        sites = {"a": FakeSite(weeks(4) + [bucket(MONDAY + 4 * WEEK, 10000)]),
+                 "b": FakeSite(None)}
+        controller = SimpleNamespace(site_info_simplified=lambda: sites,
+                                     for_site=lambda site: sites[site])
+        detector = AnomalyDetector()
+        anomalies = detect(controller, detector)
+        self.assertEqual([("a", "tx")], [(found.site, found.metric) for found in anomalies])
+        self.assertEqual(["a"], list(detector.baselines))
+        with self.assertRaises(ValueError):
+            AnomalyDetector(alpha=0)
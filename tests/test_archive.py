@@ -0,0 +1,116 @@
+"""Tests the StatArchive functionality"""
+
+import os
+import tempfile
+import unittest
+
+from unifierlib.archive import StatArchive, ArchiveError, read_archive
+from unifierlib.utility import WAN_TX_KEY, WAN_RX_KEY
+
+def make_stats(start, count, interval=300):
+    """Makes a run of time-sorted stats"""
+    return [
+        {
+            "time": start + i * interval,
+            WAN_TX_KEY: i * 10,
+            WAN_RX_KEY: i * 100.4
+        }
+        for i in range(count)
+    ]
+
+class TestStatArchive(unittest.TestCase):
+    """Tests the binary stats archive"""
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._dir.name, "default.5m")
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def test_ar_01(self):
+        """Tests opening a missing archive without a site"""
+        with self.assertRaises(ArchiveError):
+            StatArchive(self.path)
+
+    def test_ar_02(self):
+        """Tests the header round trips"""
+        StatArchive(self.path, site="default", interval=300).close()
+        with StatArchive(self.path) as archive:
+            self.assertEqual("default", archive.site)
+            self.assertEqual(300, archive.interval)
+            self.assertEqual(["time", WAN_TX_KEY, WAN_RX_KEY], archive.columns)
+            self.assertEqual(0, len(archive))
+            self.assertEqual([], archive.read())
+
+    def test_ar_03(self):
+        """Tests a mismatched site or interval is refused"""
+        StatArchive(self.path, site="default", interval=300).close()
+        with self.assertRaises(ArchiveError):
+            StatArchive(self.path, site="other")
+        with self.assertRaises(ArchiveError):
+            StatArchive(self.path, interval=3600)
+
+    def test_ar_04(self):
+        """Tests appending and reading back"""
+        stats = make_stats(1000, 10)
+        with StatArchive(self.path, site="default", interval=300) as archive:
+            self.assertEqual(10, archive.append(stats))
+            result = archive.read()
+        self.assertEqual(10, len(result))
+        self.assertEqual(stats[3]["time"], result[3]["time"])
+        self.assertEqual(30, result[3][WAN_TX_KEY])
+        self.assertEqual(301, result[3][WAN_RX_KEY])
+
+    def test_ar_05(self):
+        """Tests overlapping appends are deduplicated"""
+        with StatArchive(self.path, site="default", interval=300) as archive:
+            archive.append(make_stats(1000, 10))
+            self.assertEqual(5, archive.append(make_stats(1000 + 300 * 5, 10)))
+            self.assertEqual(15, len(archive))
+            times = [entry["time"] for entry in archive.read()]
+        self.assertEqual(sorted(set(times)), times)
+
+    def test_ar_06(self):
+        """Tests range reads"""
+        with StatArchive(self.path, site="default", interval=300) as archive:
+            archive.append(make_stats(0, 100))
+            tests = [
+                (None, None, 100),
+                (0, 300, 1),
+                (150, 900, 2),
+                (29700, None, 1),
+                (30000, None, 0),
+                (None, 3000, 10)
+            ]
+            for start, end, expected in tests:
+                with self.subTest(start=start, end=end):
+                    self.assertEqual(expected, len(archive.read(start, end)))
+
+    def test_ar_07(self):
+        """Tests zero-copy column views"""
+        with StatArchive(self.path, site="default", interval=300) as archive:
+            archive.append(make_stats(0, 20))
+            view = archive.column(WAN_TX_KEY, 300, 1500)
+            self.assertEqual([10, 20, 30, 40], view.tolist())
+            view.release()
+            with self.assertRaises(ArchiveError):
+                archive.column("nope")
+
+    def test_ar_08(self):
+        """Tests the read_archive convenience function"""
+        with StatArchive(self.path, site="default", interval=300) as archive:
+            archive.append(make_stats(0, 5))
+        self.assertEqual(5, len(read_archive(self.path)))
+        self.assertEqual(3, len(read_archive(self.path, 600)))
+
+    def test_ar_09(self):
+        """Tests appending and reading while a column view is still held"""
+        with StatArchive(self.path, site="default", interval=300) as archive:
+            archive.append(make_stats(0, 5))
+            view = archive.column(WAN_TX_KEY)
+            archive.append(make_stats(300 * 5, 5))
+            self.assertEqual(10, len(archive.read()))
+            self.assertEqual([0, 10, 20, 30, 40], view.tolist())
+            self.assertEqual(10, len(archive.column(WAN_TX_KEY)))
+        self.assertEqual([0, 10, 20, 30, 40], view.tolist())
+        view.release()
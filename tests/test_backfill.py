@@ -0,0 +1,119 @@
+"""Tests the backfill functionality"""
+
+import datetime
+import os
+import threading
+import time
+import unittest
+
+from unifierlib.backfill import backfill, plan_requests, expected_times
+from unifierlib.controller import MINUTELY_STAT_URL, DAILY_STAT_URL
+from unifierlib.series import StatSeries
+
+class FakeController:
+    """Serves stats out of a fixed set of bucket times"""
+    timezone = None
+
+    def __init__(self, available):
+        self.available = sorted(available)
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def get_stats(self, granularity, start, end, stat_attributes=None):
+        """Mimics Controller.get_stats with an inclusive end"""
+        with self._lock:
+            self.calls.append((granularity, start, end))
+        return StatSeries({"time": t, "wan-tx_bytes": 1}
+                          for t in self.available if start <= t <= end)
+
+class TestBackfill(unittest.TestCase):
+    """Tests gap planning and backfill"""
+    def test_bf_01(self):
+        """Tests planning joins close gaps and splits long ones"""
+        tests = [
+            ([(0, 300)], {}, [(0, 300)]),
+            ([(0, 300), (600, 900)], {}, [(0, 900)]),
+            ([(0, 300), (300 * 20, 300 * 21)], {}, [(0, 300), (300 * 20, 300 * 21)]),
+            ([(0, 300 * 5)], {"max_buckets": 2}, [(0, 600), (600, 1200), (1200, 1500)]),
+            ([(0, 300), (600, 900)], {"join_buckets": 0}, [(0, 300), (600, 900)])
+        ]
+        for gaps, kwargs, expected in tests:
+            with self.subTest(gaps=gaps, kwargs=kwargs):
+                self.assertEqual(expected, plan_requests(gaps, 300, **kwargs))
+
+    def test_bf_02(self):
+        """Tests a series without holes makes no requests"""
+        controller = FakeController([])
+        series = StatSeries({"time": t} for t in range(0, 3000, 300))
+        report = backfill(controller, series, MINUTELY_STAT_URL)
+        self.assertEqual([], controller.calls)
+        self.assertEqual([], report.unrecoverable)
+
+    def test_bf_03(self):
+        """Tests holes are filled and the unrecoverable ones reported"""
+        everything = range(0, 300 * 100, 300)
+        lost = {300 * 50, 300 * 51}
+        controller = FakeController([t for t in everything if t not in lost])
+        holes = {300 * 10, 300 * 90} | set(range(300 * 45, 300 * 55, 300))
+        present = [t for t in everything if t not in holes]
+        series = StatSeries({"time": t} for t in present)
+        report = backfill(controller, series, MINUTELY_STAT_URL, 0, 300 * 100)
+        self.assertEqual([(300 * 50, 300 * 52)], report.unrecoverable)
+        self.assertEqual(100 - len(present) - 2, report.recovered)
+        self.assertEqual(98, len(series))
+        self.assertEqual([], report.failed)
+        # Only the holes were asked for, never the whole window
+        for _, start, end in controller.calls:
+            self.assertLess(end - start, 300 * 10)
+        self.assertEqual(3, len(controller.calls))
+
+    def test_bf_04(self):
+        """Tests failed requests are reported"""
+        controller = FakeController([])
+        controller.get_stats = lambda *args, **kwargs: None
+        series = StatSeries([{"time": 0}, {"time": 900}])
+        report = backfill(controller, series, MINUTELY_STAT_URL)
+        self.assertEqual([(300, 900)], report.failed)
+        self.assertEqual([(300, 900)], report.unrecoverable)
+
+class TestBackfillDaily(unittest.TestCase):
+    """Tests daily backfill across a DST change"""
+    def setUp(self):
+        self._tz = os.environ.get("TZ")
+        os.environ["TZ"] = "America/New_York"
+        time.tzset()
+        first = datetime.date(2026, 10, 28)
+        self.days = [time.mktime((first + datetime.timedelta(i)).timetuple())
+                     for i in range(10)]
+
+    def tearDown(self):
+        if self._tz is None:
+            del os.environ["TZ"]
+        else:
+            os.environ["TZ"] = self._tz
+        time.tzset()
+
+    def test_bf_05(self):
+        """Tests daily buckets follow local midnights"""
+        self.assertEqual(self.days, expected_times(DAILY_STAT_URL, self.days[0], self.days[-1] + 1))
+        self.assertEqual(self.days[1:3], expected_times(DAILY_STAT_URL, self.days[0] + 1, self.days[3]))
+        # One of the days is 25 hours long
+        self.assertIn(90000, {b - a for a, b in zip(self.days, self.days[1:])})
+
+    def test_bf_06(self):
+        """Tests a complete series across the DST change has no holes"""
+        controller = FakeController(self.days)
+        series = StatSeries({"time": t} for t in self.days)
+        report = backfill(controller, series, DAILY_STAT_URL)
+        self.assertEqual([], controller.calls)
+        self.assertEqual([], report.unrecoverable)
+
+    def test_bf_07(self):
+        """Tests a missing day after the DST change is refetched with a sane window"""
+        controller = FakeController(self.days)
+        series = StatSeries({"time": t} for t in self.days if t != self.days[6])
+        report = backfill(controller, series, DAILY_STAT_URL)
+        self.assertEqual(1, report.recovered)
+        self.assertEqual([], report.unrecoverable)
+        for _, start, end in controller.calls:
+            self.assertLessEqual(start, end)
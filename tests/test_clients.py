@@ -0,0 +1,88 @@
+"""Tests the client inventory and its diffs"""
+
+import json
+import unittest
+from unittest.mock import patch, MagicMock
+
+from test_controller import MockResponse
+
+from unifierlib import Controller
+from unifierlib.clients import Client, ClientSnapshot, ClientInventory, diff, is_empty
+
+def wireless(mac, ap_mac="ap:01", essid="corp", **extra):
+    """A stat/sta record for a wireless client"""
+    return {"mac": mac, "ap_mac": ap_mac, "essid": essid, "is_wired": False, **extra}
+
+def wired(mac, sw_mac="sw:01", sw_port=1):
+    """A stat/sta record for a wired client"""
+    return {"mac": mac, "sw_mac": sw_mac, "sw_port": sw_port, "is_wired": True}
+
+class FakeController:
+    """Answers get_clients from a list of snapshots, None once they run out"""
+    def __init__(self, *answers):
+        self.answers = list(answers)
+
+    def get_clients(self):
+        """The next answer"""
+        return self.answers.pop(0) if self.answers else None
+
+class TestClients(unittest.TestCase):
+    """Tests snapshots, diffs and polling"""
+    def test_cl_01(self):
+        """Tests records are reduced to slotted clients keyed by lower case MAC"""
+        snapshot = ClientSnapshot.from_data([
+            wireless("AA:00", hostname="laptop", tx_bytes=5), wired("aa:01"), {"ip": "1.2.3.4"}])
+        self.assertEqual(2, len(snapshot))
+        self.assertIn("AA:00", snapshot)
+        laptop = snapshot.clients["aa:00"]
+        self.assertEqual(("laptop", ("ap:01", "corp"), 5, 0),
+                         (laptop.hostname, laptop.uplink, laptop.tx_bytes, laptop.rx_bytes))
+        self.assertEqual(("sw:01", 1), snapshot.clients["aa:01"].uplink)
+        self.assertFalse(hasattr(laptop, "__dict__"))
+        self.assertIsInstance(laptop, Client)
+
+    def test_cl_02(self):
+        """Tests joins, leaves and roams between two snapshots"""
+        before = ClientSnapshot.from_data([wireless("a"), wireless("b"), wired("c"), wired("d")])
+        after = ClientSnapshot.from_data([wireless("a", ap_mac="ap:02"), wireless("b"),
+                                          wired("c", sw_port=2), wired("d"), wireless("e")])
+        delta = diff(before, after)
+        self.assertEqual(["e"], [client.mac for client in delta.joined])
+        self.assertEqual([], delta.left)
+        self.assertEqual([("a", "ap:01", "ap:02"), ("c", "sw:01", "sw:01")],
+                         sorted((old.mac, old.uplink[0], new.uplink[0])
+                                for old, new in delta.roamed))
+        delta = diff(after, ClientSnapshot.from_data([wireless("b")]))
+        self.assertEqual(["a", "c", "d", "e"], sorted(client.mac for client in delta.left))
+        self.assertTrue(is_empty(diff(before, before)))
+
+    def test_cl_03(self):
+        """Tests the inventory only hands on deltas that aren't empty"""
+        delivered = []
+        inventory = ClientInventory(FakeController([wireless("a")],
+                                                   [wireless("a")],
+                                                   [wireless("a", essid="guest"), wired("b")]),
+                                    callback=delivered.append)
+        self.assertEqual(1, len(inventory.poll().joined))
+        self.assertTrue(is_empty(inventory.poll()))
+        delta = inventory.poll()
+        self.assertEqual((1, 1), (len(delta.joined), len(delta.roamed)))
+        self.assertIsNone(inventory.poll())
+        self.assertEqual(2, len(delivered))
+        metrics = inventory.metrics
+        self.assertEqual((4, 1, 2, 0, 1, 2),
+                         (metrics.polls, metrics.failures, metrics.joined, metrics.left,
+                          metrics.roamed, metrics.clients))
+
+    @patch('requests.Session.get')
+    @patch('requests.Session.post')
+    def test_cl_04(self, mock_post: MagicMock, mock_get: MagicMock):
+        """Tests the controller reads the site's clients from stat/sta"""
+        mock_post.return_value = MockResponse(200, "login", '{"meta":{"rc":"ok"},"data":[]}')
+        mock_get.return_value = MockResponse(200, "sta", json.dumps(
+            {"meta": {"rc": "ok"}, "data": [wireless("a")]}))
+        controller = Controller('localhost', 8443, 'test', 'password', site="branch")
+        self.assertEqual([wireless("a")], controller.get_clients())
+        self.assertTrue(mock_get.call_args[0][0].endswith("/api/s/branch/stat/sta"))
+        mock_get.return_value = MockResponse(200, "sta", '{"meta":{"rc":"error"},"data":[]}')
+        self.assertIsNone(controller.get_clients())
@@ -3,18 +3,28 @@
 import unittest
 from unittest.mock import patch, MagicMock
 import io
+import datetime
+import threading
 
 from requests import Session, Response, ConnectionError
+from requests.structures import CaseInsensitiveDict
 
 from unifierlib import Controller
+from unifierlib.series import StatSeries
+from unifierlib.controller import HOURLY_STAT_URL, MINUTELY_STAT_URL
+from unifierlib.controller import _ValidatedResponses
 
 #pylint: disable=line-too-long
 
 class MockResponse:
-    def __init__(self, status_code, url, text):
+    def __init__(self, status_code, url, text, headers=None):
         self.status_code = status_code
         self.url = url
         self.raw = io.StringIO(text)
+        self.text = text
+        self.content = text.encode()
+        self.headers = CaseInsensitiveDict(headers or {})
+        self.elapsed = datetime.timedelta(milliseconds=5)
     def __bool__(self):
         return self.ok
     @property
@@ -91,3 +101,253 @@ class TestController(unittest.TestCase):
             with self.subTest(test_method=test_method):
                 res = test_method()
                 self.assertIsNone(res)
+
+    @patch('requests.Session.post')
+    def test_cont_05(self, mock_post: MagicMock):
+        """Tests stats are returned as a time-indexed series"""
+        host = 'localhost'
+        port = 8443
+        login = MockResponse(200,
+                             f"https://{host}:{port}/api/login",
+                             '{"meta":{"rc":"ok"},"data":[]}')
+        stats = MockResponse(200,
+                             f"https://{host}:{port}/api/s/default/stat/report/hourly.site",
+                             '{"meta":{"rc":"ok"},"data":['
+                             '{"time":7200000,"wan-tx_bytes":2},'
+                             '{"time":0,"wan-tx_bytes":9},'
+                             '{"time":3600000,"wan-tx_bytes":1},'
+                             '{"time":7200000,"wan-tx_bytes":3}]}')
+        mock_post.side_effect = [login, stats]
+        controller = Controller(host, port, 'test', 'password', timezone="UTC")
+        res = controller.get_hourly_stats(start=3600, end=10800)
+        self.assertIsInstance(res, StatSeries)
+        self.assertEqual([3600, 7200], res.times)
+        self.assertEqual(3, res.get(7200)["wan-tx_bytes"])
+
+    @patch('requests.Session.post')
+    def test_cont_06(self, mock_post: MagicMock):
+        """Tests many threads can share one controller through a session expiry"""
+        threads = 16
+        calls_per_thread = 25
+        state = {"valid": True, "logins": 0, "stats": 0}
+        state_lock = threading.Lock()
+
+        def post(url, json=None): # pylint: disable=redefined-outer-name,unused-argument
+            with state_lock:
+                if url.endswith("/api/login"):
+                    state["logins"] += 1
+                    state["valid"] = True
+                    return MockResponse(200, url, '{"meta":{"rc":"ok"},"data":[]}')
+                if not state["valid"]:
+                    return MockResponse(401, url, '{"meta":{"rc":"error","msg":"api.err.LoginRequired"}}')
+                state["stats"] += 1
+            return MockResponse(200, url, '{"meta":{"rc":"ok"},"data":[{"time":3600000}]}')
+        mock_post.side_effect = post
+
+        controller = Controller('localhost', 8443, 'test', 'password', pool_size=4)
+        # Expire the session before the threads start so they all trip over it together
+        state["valid"] = False
+        barrier = threading.Barrier(threads)
+        failures = []
+
+        def hammer(index):
+            barrier.wait()
+            for call in range(calls_per_thread):
+                # Distinct windows so nothing is coalesced
+                start = (index * calls_per_thread + call) * 3600
+                result = controller.get_stats(HOURLY_STAT_URL, start, start + 3600)
+                if result is None:
+                    failures.append((index, call))
+
+        workers = [threading.Thread(target=hammer, args=(i,)) for i in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual([], failures)
+        self.assertTrue(controller.logged_in)
+        # The initial login plus exactly one shared re-login
+        self.assertEqual(2, state["logins"])
+        self.assertEqual(threads * calls_per_thread, state["stats"])
+        self.assertEqual([], controller.error_stack)
+
+    @patch('requests.Session.get')
+    @patch('requests.Session.post')
+    def test_cont_07(self, mock_post: MagicMock, mock_get: MagicMock):
+        """Tests conditional GETs reuse the cached body on 304 Not Modified"""
+        sent_headers = []
+        body = '{"meta":{"rc":"ok"},"data":[{"mac":"aa:00"}]}'
+
+        def get(url, headers=None, **kwargs): # pylint: disable=unused-argument
+            sent_headers.append(headers)
+            if headers and headers.get("If-None-Match") == '"v1"':
+                return MockResponse(304, url, '')
+            return MockResponse(200, url, body,
+                                headers={"ETag": '"v1"',
+                                         "Content-Encoding": "gzip",
+                                         "Content-Length": "40"})
+        mock_get.side_effect = get
+
+        def post(url, json=None, headers=None): # pylint: disable=redefined-outer-name,unused-argument
+            if url.endswith("/api/login"):
+                return MockResponse(200, url, '{"meta":{"rc":"ok"},"data":[]}')
+            sent_headers.append(headers)
+            return MockResponse(200, url, '{"meta":{"rc":"ok"},"data":[]}',
+                                headers={"ETag": '"v2"'})
+        mock_post.side_effect = post
+
+        controller = Controller('localhost', 8443, 'test', 'password')
+        self.assertIn("gzip", controller._session.headers["Accept-Encoding"]) # pylint: disable=protected-access
+        first = controller.get_clients()
+        second = controller.get_clients()
+        self.assertEqual([None, {"If-None-Match": '"v1"'}], sent_headers)
+        self.assertEqual(first, second)
+        # Each answer is decoded afresh, so callers never share dicts
+        self.assertIsNot(first[0], second[0])
+        self.assertEqual([], controller.error_stack)
+
+        metrics = controller.request_metrics
+        self.assertEqual([200, 304], [entry.status for entry in metrics])
+        self.assertEqual(40, metrics[0].wire_bytes)
+        self.assertEqual("gzip", metrics[0].encoding)
+        self.assertEqual(len(body), metrics[0].body_bytes)
+        self.assertTrue(metrics[1].not_modified)
+        totals = controller.transfer_totals
+        self.assertEqual(2, totals.requests)
+        self.assertEqual(1, totals.not_modified)
+
+        # POSTs are never conditional, whatever validators their answers carry
+        sent_headers.clear()
+        controller.get_stats(HOURLY_STAT_URL, 0, 7200)
+        controller.get_stats(HOURLY_STAT_URL, 0, 7200)
+        self.assertEqual([None, None], sent_headers)
+
+        # The kept bodies are bounded by their bytes
+        validated = _ValidatedResponses(max_bytes=10)
+        validated.put(("a",), {"If-None-Match": '"a"'}, b"123456")
+        validated.put(("b",), {"If-None-Match": '"b"'}, b"1234")
+        self.assertIsNotNone(validated.get(("a",)))
+        validated.put(("c",), {"If-None-Match": '"c"'}, b"12")
+        self.assertEqual((2, 8), (len(validated), validated.bytes))
+        self.assertIsNone(validated.get(("b",)))
+        validated.put(("d",), {"If-None-Match": '"d"'}, b"x" * 11)
+        self.assertIsNone(validated.get(("d",)))
+        validated.put(("a",), None, b"")
+        self.assertEqual((1, 2), (len(validated), validated.bytes))
+
+    @patch('requests.Session.get')
+    @patch('requests.Session.post')
+    def test_cont_08(self, mock_post: MagicMock, mock_get: MagicMock):
+        """Tests default windows follow the site time zone read from its locale setting"""
+        mock_post.return_value = MockResponse(200, "login", '{"meta":{"rc":"ok"},"data":[]}')
+        answers = {
+            "/api/s/default/get/setting": '{"meta":{"rc":"ok"},"data":[{"key":"mgmt"},'
+                                          '{"key":"locale","timezone":"Asia/Kolkata"}]}',
+            "/api/s/branch/get/setting": '{"meta":{"rc":"ok"},"data":[{"key":"mgmt"}]}',
+            "/api/s/branch/stat/sysinfo": '{"meta":{"rc":"ok"},"data":[{"timezone":"UTC"}]}'
+        }
+        mock_get.side_effect = lambda url, **kwargs: MockResponse(
+            200, url, answers[url.split(":8443")[1]])
+        controller = Controller('localhost', 8443, 'test', 'password')
+        self.assertEqual("Asia/Kolkata", str(controller.timezone))
+        self.assertEqual("Asia/Kolkata", str(controller.timezone))
+        mock_get.assert_called_once()
+        # A site without a locale falls back on the controller's zone
+        self.assertEqual("UTC", str(controller.for_site("branch").timezone))
+
+        mock_post.return_value = MockResponse(200, "stats", '{"meta":{"rc":"ok"},"data":[]}')
+        # 2021-03-10 12:10 in Kolkata, five and a half hours ahead of UTC
+        end = 1615358400
+        controller.get_daily_stats(end=end)
+        params = mock_post.call_args[1]["json"]
+        # Cut back to 12:00 local and started on 1 March local midnight
+        self.assertEqual((end - 10 * 60) * 1000, params["end"])
+        self.assertEqual((1614556800 - 19800) * 1000, params["start"])
+
+    @patch('requests.Session.post')
+    def test_cont_09(self, mock_post: MagicMock):
+        """Tests lazy pagination yields in order and stops fetching when abandoned"""
+        pages = []
+
+        def post(url, json=None, headers=None): # pylint: disable=redefined-outer-name,unused-argument
+            if url.endswith("/api/login"):
+                return MockResponse(200, url, '{"meta":{"rc":"ok"},"data":[]}')
+            pages.append((json["start"] // 1000, json["end"] // 1000))
+            # Newest first, as the controller sometimes answers
+            times = range(json["end"] // 300000 * 300, json["start"] // 1000 - 1, -300)
+            data = ",".join(f'{{"time":{t * 1000},"wan-tx_bytes":1}}' for t in times)
+            return MockResponse(200, url, f'{{"meta":{{"rc":"ok"}},"data":[{data}]}}')
+        mock_post.side_effect = post
+
+        controller = Controller('localhost', 8443, 'test', 'password', timezone="UTC")
+        base = 86400
+        times = [bucket["time"] for bucket in controller.iter_stats(MINUTELY_STAT_URL,
+                                                                    base,
+                                                                    base + 3000,
+                                                                    page_buckets=3)]
+        self.assertEqual(list(range(base, base + 3000, 300)), times)
+        self.assertEqual([(base, base + 899), (base + 900, base + 1799),
+                          (base + 1800, base + 2699), (base + 2700, base + 2999)], sorted(pages))
+
+        for prefetch in (True, False):
+            with self.subTest(prefetch=prefetch):
+                pages.clear()
+                stats = controller.iter_stats(MINUTELY_STAT_URL, base, base * 30,
+                                              page_buckets=12, prefetch=prefetch)
+                first = [next(stats)["time"] for _ in range(13)]
+                stats.close()
+                self.assertEqual(list(range(base, base + 3900, 300)), first)
+                # The two pages used, plus at most the one fetched ahead
+                self.assertLessEqual(len(pages), 3)
+
+    @patch('requests.Session.post')
+    def test_cont_10(self, mock_post: MagicMock):
+        """Tests the event stream address carries the session cookie"""
+        mock_post.return_value = MockResponse(200, "login", '{"meta":{"rc":"ok"},"data":[]}')
+        controller = Controller('unifi.lan', 8443, 'test', 'password', site="branch")
+        controller._session.cookies.set("unifises", "abc") # pylint: disable=protected-access
+        target = controller.websocket_target()
+        self.assertEqual("wss://unifi.lan:8443/wss/s/branch/events", target.url)
+        self.assertEqual("unifises=abc", target.headers["Cookie"])
+        self.assertFalse(target.ssl_verify)
+        self.assertEqual(1, target.generation)
+
+    @patch('requests.Session.post')
+    def test_cont_11(self, mock_post: MagicMock):
+        """Tests a site copy logging back in renews the login of every copy"""
+        state = {"logins": 0, "expired": False}
+
+        def post(url, json=None, headers=None): # pylint: disable=redefined-outer-name,unused-argument
+            if url.endswith("/api/login"):
+                state["logins"] += 1
+                state["expired"] = False
+                return MockResponse(200, url, '{"meta":{"rc":"ok"},"data":[]}')
+            if state["expired"]:
+                return MockResponse(401, url, '{"meta":{"rc":"error","msg":"api.err.LoginRequired"}}')
+            return MockResponse(200, url, '{"meta":{"rc":"ok"},"data":[{"time":3600000}]}')
+        mock_post.side_effect = post
+
+        controller = Controller('localhost', 8443, 'test', 'password')
+        branch = controller.for_site("branch")
+        annex = controller.for_site("annex")
+        state["expired"] = True
+        self.assertEqual([3600], branch.get_stats(HOURLY_STAT_URL, 0, 7200).times)
+        self.assertEqual(2, state["logins"])
+        # The others see the new login rather than logging in for themselves
+        self.assertEqual(branch.websocket_target().generation,
+                         controller.websocket_target().generation)
+        self.assertEqual([3600], annex.get_stats(HOURLY_STAT_URL, 0, 7200).times)
+        self.assertEqual([3600], controller.get_stats(HOURLY_STAT_URL, 0, 7200).times)
+        self.assertEqual(2, state["logins"])
+
+        # A stale generation from before the re-login doesn't log in again
+        self.assertTrue(annex._relogin(1)) # pylint: disable=protected-access
+        self.assertEqual(2, state["logins"])
+
+        # Nor does a failed login on one copy leave the others thinking they're in
+        mock_post.side_effect = None
+        mock_post.return_value = MockResponse(400, "login", '{"meta":{"rc":"error"},"data":[]}')
+        self.assertFalse(annex.login())
+        self.assertFalse(controller.logged_in)
+        self.assertFalse(branch.logged_in)
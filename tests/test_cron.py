@@ -0,0 +1,71 @@
+"""Tests the cron schedules"""
+
+import datetime
+import unittest
+
+from unifierlib.cron import CronSchedule, CronError
+from unifierlib.windows import get_timezone
+
+UTC = datetime.timezone.utc
+
+def at(*args):
+    """Epoch seconds of a UTC wall clock time"""
+    return datetime.datetime(*args, tzinfo=UTC).timestamp()
+
+class TestCron(unittest.TestCase):
+    """Tests parsing and finding the next due time"""
+    def test_cr_01(self):
+        """Tests the field syntax"""
+        schedule = CronSchedule("*/15 9-17/4 1,15 * 1-5")
+        self.assertEqual(frozenset([0, 15, 30, 45]), schedule.minutes)
+        self.assertEqual(frozenset([9, 13, 17]), schedule.hours)
+        self.assertEqual(frozenset([1, 15]), schedule.days)
+        self.assertEqual(frozenset(range(5)), schedule.weekdays)
+        self.assertEqual(frozenset([6]), CronSchedule("0 0 * * 0,7").weekdays)
+        self.assertEqual(frozenset([5, 25, 45]), CronSchedule("5/20 * * * *").minutes)
+        for bad in ("* * * *", "60 * * * *", "a * * * *", "5-1 * * * *", "*/0 * * * *"):
+            with self.subTest(bad=bad):
+                with self.assertRaises(CronError):
+                    CronSchedule(bad)
+
+    def test_cr_02(self):
+        """Tests the next due minute is always strictly later"""
+        tests = [("*/15 * * * *", at(2021, 3, 1, 10, 7), at(2021, 3, 1, 10, 15)),
+                 ("*/15 * * * *", at(2021, 3, 1, 10, 15), at(2021, 3, 1, 10, 30)),
+                 ("5 0 * * *", at(2021, 3, 1, 0, 5, 30), at(2021, 3, 2, 0, 5)),
+                 ("@monthly", at(2021, 12, 15), at(2022, 1, 1)),
+                 ("0 12 29 2 *", at(2021, 3, 1), at(2024, 2, 29, 12)),
+                 # 2021-03-01 was a Monday, both day fields restricted match either
+                 ("0 0 13 * 5", at(2021, 3, 1), at(2021, 3, 5)),
+                 ("0 0 * * 5", at(2021, 3, 5, 0, 0), at(2021, 3, 12))]
+        for expression, after, expected in tests:
+            with self.subTest(expression=expression, after=after):
+                self.assertEqual(expected, CronSchedule(expression).next_after(after, UTC))
+
+    def test_cr_03(self):
+        """Tests schedules are read on the wall clock of the time zone"""
+        tz = datetime.timezone(datetime.timedelta(hours=5, minutes=30))
+        self.assertEqual(at(2021, 3, 1, 18, 30), CronSchedule("@daily").next_after(
+            at(2021, 3, 1, 12), tz))
+        with self.assertRaises(CronError):
+            CronSchedule("0 0 31 2 *").next_after(at(2021, 3, 1), UTC)
+
+    def test_cr_04(self):
+        """Tests the hour repeated when the clocks go back is walked, always forwards"""
+        new_york = get_timezone("America/New_York")
+        # 2021-11-07 01:00 EDT is 05:00 UTC, 01:00 EST is 06:00 UTC
+        tests = [("*/15 * * * *", at(2021, 11, 7, 6, 10), at(2021, 11, 7, 6, 15)),
+                 ("*/15 * * * *", at(2021, 11, 7, 5, 50), at(2021, 11, 7, 6, 0)),
+                 ("30 1 * * *", at(2021, 11, 7, 5, 30), at(2021, 11, 7, 6, 30)),
+                 ("0 2 * * *", at(2021, 11, 7, 5, 30), at(2021, 11, 7, 7, 0)),
+                 # 02:30 doesn't exist when the clocks go forward on 2021-03-14
+                 ("30 2 * * *", at(2021, 3, 14, 5), at(2021, 3, 15, 6, 30))]
+        for expression, after, expected in tests:
+            with self.subTest(expression=expression, after=after):
+                self.assertEqual(expected, CronSchedule(expression).next_after(after, new_york))
+        schedule = CronSchedule("*/15 * * * *")
+        due = at(2021, 11, 7, 3)
+        for _ in range(24):
+            following = schedule.next_after(due, new_york)
+            self.assertEqual(due + 900, following)
+            due = following
@@ -0,0 +1,81 @@
+"""Tests the DPI aggregation"""
+
+import json
+import unittest
+from unittest.mock import patch, MagicMock
+
+from test_controller import MockResponse
+
+from unifierlib import Controller
+from unifierlib.dpi import DpiLookup, DpiTotals, dpi_rows, dpi_report, BY_APP, BY_CAT
+
+def site_dpi(*apps):
+    """A sitedpi answer's data for (cat, app, tx, rx) rows"""
+    return [{"by_app": [{"cat": cat, "app": app, "tx_bytes": t_x, "rx_bytes": r_x}
+                        for cat, app, t_x, r_x in apps]}]
+
+LOOKUP = DpiLookup({"categories": {"4": "Streaming"}, "applications": {"4:12": "Netflix"}})
+
+class TestDpi(unittest.TestCase):
+    """Tests decoding, totals and top-N selection"""
+    def test_dp_01(self):
+        """Tests names come from the table with placeholders for unknown ids"""
+        tests = [((4, 12), "Netflix"), ((4, 3), "Streaming app 3"), ((4, None), "Streaming"),
+                 ((9, 1), "Category 9 app 1"), ((9, None), "Category 9")]
+        for key, expected in tests:
+            with self.subTest(key=key):
+                self.assertEqual(expected, LOOKUP.name(key))
+                self.assertEqual(expected, LOOKUP.name(key))
+
+    def test_dp_02(self):
+        """Tests rows are flattened by application or category"""
+        self.assertEqual([((4, 12), 1, 2)], list(dpi_rows(site_dpi((4, 12, 1, 2)))))
+        by_cat = [{"by_cat": [{"cat": 4, "apps": [12], "tx_bytes": 5, "rx_bytes": 6}]}]
+        self.assertEqual([((4, None), 5, 6)], list(dpi_rows(by_cat, BY_CAT)))
+        self.assertEqual([], list(dpi_rows(None)))
+
+    def test_dp_03(self):
+        """Tests totals across sites and ranking by each metric"""
+        totals = DpiTotals()
+        totals.add(dpi_rows(site_dpi((4, 12, 10, 100), (9, 1, 50, 0))), "a")
+        totals.add(dpi_rows(site_dpi((4, 12, 10, 100), (9, 2, 0, 30))), "b")
+        top = totals.top(2, lookup=LOOKUP)
+        self.assertEqual([(1, "Netflix", 20, 200, 220, 2), (2, "Category 9 app 1", 50, 0, 50, 1)],
+                         [(entry.rank, entry.name, entry.tx_bytes, entry.rx_bytes,
+                           entry.total, entry.sites) for entry in top])
+        self.assertEqual([(9, 1)], [(e.category, e.application) for e in totals.top(1, "tx")])
+        self.assertEqual([(4, 12), (9, 2)],
+                         [(e.category, e.application) for e in totals.top(5, "rx")][:2])
+        with self.assertRaises(ValueError):
+            totals.top(metric="packets")
+
+    @patch('requests.Session.get')
+    @patch('requests.Session.post')
+    def test_dp_04(self, mock_post: MagicMock, mock_get: MagicMock):
+        """Tests a report over every site, with one site failing"""
+        mock_get.return_value = MockResponse(200, "sites", json.dumps(
+            {"meta": {"rc": "ok"}, "data": [{"name": "a"}, {"name": "b"}, {"name": "c"}]}))
+        answers = {"a": site_dpi((4, 12, 1, 1)), "b": site_dpi((4, 12, 2, 2), (9, 1, 1, 0))}
+        requests_made = []
+
+        def post(url, json=None, headers=None): # pylint: disable=redefined-outer-name,unused-argument
+            if url.endswith("/api/login"):
+                return MockResponse(200, url, '{"meta":{"rc":"ok"},"data":[]}')
+            requests_made.append((url, json))
+            site = url.split("/api/s/")[1].split("/")[0]
+            if site not in answers:
+                return MockResponse(500, url, '')
+            return MockResponse(200, url, encode({"meta": {"rc": "ok"}, "data": answers[site]}))
+        mock_post.side_effect = post
+
+        controller = Controller('localhost', 8443, 'test', 'password', timezone="UTC")
+        report = dpi_report(controller, count=5, lookup=LOOKUP)
+        self.assertEqual(["c"], report.failed)
+        self.assertEqual([("Netflix", 6), ("Category 9 app 1", 1)],
+                         [(entry.name, entry.total) for entry in report.top])
+        self.assertTrue(all(url.endswith("/stat/sitedpi") and body == {"type": BY_APP}
+                            for url, body in requests_made))
+
+def encode(value):
+    """JSON encodes outside of post, whose json argument shadows the module"""
+    return json.dumps(value)
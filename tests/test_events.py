@@ -0,0 +1,203 @@
+"""Tests the websocket event subscriber against a local stand-in"""
+
+import asyncio
+import base64
+import hashlib
+import json
+import socket
+import struct
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+
+from unifierlib.events import EventSubscriber, WebSocket, WebSocketError, parse_message
+
+GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+def frame(payload: bytes, opcode: int = 0x1, fin: bool = True) -> bytes:
+    """An unmasked server frame"""
+    first = (0x80 if fin else 0) | opcode
+    if len(payload) < 126:
+        return struct.pack("!BB", first, len(payload)) + payload
+    return struct.pack("!BBH", first, 126, len(payload)) + payload
+
+def message(kind: str, *events) -> bytes:
+    """A controller push message as a text frame"""
+    return frame(json.dumps({"meta": {"rc": "ok", "message": kind},
+                             "data": list(events)}).encode())
+
+class StandIn:
+    """Serves scripted websocket sessions, one script per connection"""
+    def __init__(self, scripts):
+        self.scripts = list(scripts)
+        self.requests = []
+        self.received = []
+        self.server = socket.socket()
+        self.server.bind(("127.0.0.1", 0))
+        self.server.listen()
+        self.port = self.server.getsockname()[1]
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def serve(self):
+        """Answers each connection with the next script"""
+        for script in self.scripts:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            with conn:
+                request = b""
+                while b"\r\n\r\n" not in request:
+                    request += conn.recv(4096)
+                self.requests.append(request.decode())
+                status, frames, linger = script
+                if status != 101:
+                    conn.sendall(f"HTTP/1.1 {status} Nope\r\n\r\n".encode())
+                    continue
+                key = [line.split(":", 1)[1].strip() for line in request.decode().split("\r\n")
+                       if line.lower().startswith("sec-websocket-key")][0]
+                accept = base64.b64encode(hashlib.sha1(key.encode() + GUID).digest()).decode()
+                conn.sendall(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\n"
+                              f"Connection: Upgrade\r\nSec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+                for data in frames:
+                    conn.sendall(data)
+                conn.settimeout(0.5)
+                deadline = time.monotonic() + linger
+                while time.monotonic() < deadline:
+                    try:
+                        chunk = conn.recv(4096)
+                    except socket.timeout:
+                        continue
+                    if not chunk:
+                        break
+                    self.received.append(chunk)
+
+    def close(self):
+        """Stops accepting"""
+        self.server.close()
+
+class FakeController:
+    """Hands out the stand-in's address and counts logins"""
+    def __init__(self, port):
+        self.port = port
+        self.logins = 0
+
+    def websocket_target(self):
+        """Mimics Controller.websocket_target"""
+        return SimpleNamespace(url=f"ws://127.0.0.1:{self.port}/wss/s/default/events",
+                               headers={"Cookie": "unifises=abc"},
+                               ssl_verify=False,
+                               generation=self.logins)
+
+    def _relogin(self, generation):
+        """Mimics Controller._relogin"""
+        if generation == self.logins:
+            self.logins += 1
+        return True
+
+class TestEvents(unittest.TestCase):
+    """Tests websocket framing, reconnects and delivery"""
+    def test_ev_01(self):
+        """Tests parsing push messages"""
+        events = parse_message('{"meta":{"rc":"ok","message":"events"},"data":[{"key":"a"},{"key":"b"}]}')
+        self.assertEqual(["events", "events"], [event.message for event in events])
+        self.assertEqual(["a", "b"], [event.data["key"] for event in events])
+        self.assertEqual([], parse_message("not json"))
+        self.assertEqual([], parse_message("[1, 2]"))
+
+    def test_ev_02(self):
+        """Tests the handshake, fragments, pings and a refused upgrade"""
+        stand_in = StandIn([
+            (101, [frame(b'{"a":', fin=False), frame(b"9, 0x9", opcode=0x9),
+                   frame(b"1}", opcode=0x0), frame(b"\x03\xe8", opcode=0x8)], 1),
+            (401, [], 0)
+        ])
+        websocket = WebSocket(f"ws://127.0.0.1:{stand_in.port}/wss/s/default/events",
+                              {"Cookie": "unifises=abc"})
+        self.assertEqual('{"a":1}', websocket.recv())
+        self.assertIsNone(websocket.recv())
+        websocket.close()
+        self.assertIn("Cookie: unifises=abc", stand_in.requests[0])
+        self.assertIn("GET /wss/s/default/events HTTP/1.1", stand_in.requests[0])
+        with self.assertRaises(WebSocketError) as refused:
+            WebSocket(f"ws://127.0.0.1:{stand_in.port}/")
+        self.assertEqual(401, refused.exception.status)
+        stand_in.thread.join(5)
+        stand_in.close()
+        # The client's frames are masked: pong (0x8A) and close (0x88) with the mask bit
+        sent = b"".join(stand_in.received)
+        self.assertEqual(b"\x8a\x86", sent[:2])
+
+    def test_ev_03(self):
+        """Tests reconnecting after a drop and logging in again after a refusal"""
+        stand_in = StandIn([
+            (101, [message("events", {"key": 1}, {"key": 2})], 0),
+            (401, [], 0),
+            (101, [message("alarm", {"key": 3})], 5)
+        ])
+        controller = FakeController(stand_in.port)
+        received = []
+        with EventSubscriber(controller, callback=received.append,
+                             backoff_initial=0.01, backoff_max=0.05) as subscriber:
+            deadline = time.monotonic() + 5
+            while len(received) < 3 and time.monotonic() < deadline:
+                time.sleep(0.01)
+        stand_in.close()
+        self.assertEqual([1, 2, 3], [event.data["key"] for event in received])
+        self.assertEqual(["events", "events", "alarm"], [event.message for event in received])
+        self.assertEqual(1, controller.logins)
+        metrics = subscriber.metrics
+        self.assertEqual((3, 3, 2, 1), (metrics.received, metrics.delivered,
+                                        metrics.connects, metrics.failures))
+
+    def test_ev_04(self):
+        """Tests a full queue drops the oldest events when asked to"""
+        stand_in = StandIn([(101, [message("events", *({"key": i} for i in range(5)))], 5)])
+        subscriber = EventSubscriber(FakeController(stand_in.port), queue_size=2,
+                                     drop_oldest=True)
+        with subscriber:
+            deadline = time.monotonic() + 5
+            while subscriber.metrics.received < 5 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual([3, 4], [subscriber.get(1).data["key"] for _ in range(2)])
+            self.assertEqual(3, subscriber.metrics.dropped)
+        stand_in.close()
+
+    def test_ev_05(self):
+        """Tests the async iterator"""
+        stand_in = StandIn([(101, [message("events", {"key": 1}, {"key": 2})], 5)])
+        subscriber = EventSubscriber(FakeController(stand_in.port))
+
+        async def first_two():
+            keys = []
+            async for event in subscriber:
+                keys.append(event.data["key"])
+                if len(keys) == 2:
+                    break
+            return keys
+
+        with subscriber:
+            self.assertEqual([1, 2], asyncio.run(first_two()))
+        stand_in.close()
+
+    def test_ev_06(self):
+        """Tests a callback raising doesn't stop delivery of the events after it"""
+        stand_in = StandIn([(101, [message("events", *({"key": i} for i in range(4)))], 5)])
+        received = []
+
+        def callback(event):
+            if event.data["key"] == 1:
+                raise KeyError("site")
+            received.append(event.data["key"])
+
+        with EventSubscriber(FakeController(stand_in.port), callback=callback) as subscriber:
+            deadline = time.monotonic() + 5
+            while len(received) < 3 and time.monotonic() < deadline:
+                time.sleep(0.01)
+        stand_in.close()
+        self.assertEqual([0, 2, 3], received)
+        metrics = subscriber.metrics
+        self.assertEqual((1, "KeyError: 'site'"),
+                         (metrics.callback_errors, metrics.last_callback_error))
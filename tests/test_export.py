@@ -0,0 +1,86 @@
+"""Tests the time-series export pipeline"""
+
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from unifierlib.export import Exporter, to_line_protocol, open_exporter
+from unifierlib.export import LineProtocolExporter, SQLiteExporter
+
+def bucket(stat_time, t_x, r_x=None):
+    """Makes a bucket as the Controller returns it"""
+    entry = {"time": stat_time, "site": "5d1f", "wan-tx_bytes": t_x}
+    if r_x is not None:
+        entry["wan-rx_bytes"] = r_x
+    return entry
+
+class TestExport(unittest.TestCase):
+    """Tests exporting to line protocol and SQLite"""
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def path(self, name):
+        """A path in the scratch directory"""
+        return os.path.join(self.directory.name, name)
+
+    def test_ex_01(self):
+        """Tests line protocol formatting and escaping"""
+        line = to_line_protocol("my site,1", "hourly", bucket(3600, 5, 2.5))
+        self.assertEqual("unifi_stats,granularity=hourly,site=my\\ site\\,1 "
+                         "wan-rx_bytes=2.5,wan-tx_bytes=5.0 3600000000000", line)
+        self.assertIsNone(to_line_protocol("default", "hourly", {"time": 0, "site": "x"}))
+        self.assertEqual("unifi_stats,granularity=daily,site=default wan-tx_bytes=5.0 0",
+                         to_line_protocol("default", "daily", bucket(0, 5, 1), ["wan-tx_bytes"]))
+        # Integer and float values of a field are written alike, so its type never changes
+        self.assertEqual(["wan-tx_bytes=7.0", "wan-tx_bytes=7.5"],
+                         [to_line_protocol("default", "daily", bucket(0, value, 1),
+                                           ["wan-tx_bytes"]).split(" ")[1]
+                          for value in (7, 7.5)])
+        self.assertIsNone(to_line_protocol("default", "daily", bucket(0, float("nan"), 1),
+                                           ["wan-tx_bytes"]))
+        with self.assertRaises(TypeError):
+            Exporter() # pylint: disable=abstract-class-instantiated
+
+    def test_ex_02(self):
+        """Tests line protocol files are written in batches"""
+        path = self.path("stats.lp")
+        with LineProtocolExporter(path, batch_size=2) as exporter:
+            self.assertEqual(3, exporter.export("default", "hourly",
+                                                [bucket(t, t) for t in (0, 3600, 7200)]))
+            self.assertEqual(2, exporter.exported)
+        self.assertEqual(3, exporter.exported)
+        with open(path, encoding="utf-8") as lines:
+            self.assertEqual(3, len(lines.readlines()))
+
+    def test_ex_03(self):
+        """Tests SQLite upserts are idempotent and keep attributes a bucket lacks"""
+        path = self.path("stats.db")
+        with open_exporter(path, batch_size=2) as exporter:
+            self.assertIsInstance(exporter, SQLiteExporter)
+            exporter.export("default", "hourly", [bucket(0, 1, 10), bucket(3600, 2, 20)])
+            exporter.export("other", "hourly", [bucket(0, 7, 70)])
+        with open_exporter(path) as exporter:
+            exporter.export("default", "hourly", [bucket(0, 1, 10), bucket(3600, 5)])
+            exporter.export("default", "daily", [bucket(0, 9, 90)])
+
+        connection = sqlite3.connect(path)
+        rows = connection.execute('SELECT site, granularity, time, "wan-tx_bytes", '
+                                  '"wan-rx_bytes" FROM stats ORDER BY 1, 2, 3').fetchall()
+        connection.close()
+        self.assertEqual([("default", "daily", 0, 9, 90),
+                          ("default", "hourly", 0, 1, 10),
+                          ("default", "hourly", 3600, 5, 20),
+                          ("other", "hourly", 0, 7, 70)], rows)
+
+    def test_ex_04(self):
+        """Tests the store is picked by file suffix"""
+        tests = [("a.db", SQLiteExporter), ("a.SQLITE", SQLiteExporter),
+                 ("a.lp", LineProtocolExporter), ("a.txt", LineProtocolExporter)]
+        for name, expected in tests:
+            with self.subTest(name=name):
+                with open_exporter(self.path(name)) as exporter:
+                    self.assertIsInstance(exporter, expected)
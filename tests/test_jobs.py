@@ -0,0 +1,129 @@
+"""Tests the scheduled report jobs"""
+
+import datetime
+import json
+import os
+import tempfile
+import unittest
+
+from test_service import FakeController
+
+from unifierlib.jobs import Scheduler, JobError, load_jobs, make_job
+from unifierlib.service import QueryService
+from unifierlib.windows import get_timezone
+
+UTC = datetime.timezone.utc
+# 2021-03-01 10:30 UTC
+NOW = 1614594600
+
+def job(name, **config):
+    """A job config entry, hourly stats of the last two hours every five minutes"""
+    return {"name": name, "site": "branch", "granularity": "hourly", "window": 7200,
+            "schedule": "*/5 * * * *", **config}
+
+class FakeSite(FakeController):
+    """A site controller in UTC"""
+    timezone = UTC
+
+    def for_site(self, site):
+        other = super().for_site(site)
+        other.__class__ = FakeSite
+        return other
+
+    def get_daily_stats(self, start, end):
+        """Fails, as on a site that's down"""
+        self.calls.append(("daily", self.site, start, end))
+
+class TestJobs(unittest.TestCase):
+    """Tests the config, dispatching and running of jobs"""
+    def test_jb_01(self):
+        """Tests jobs are read from the config and bad ones are refused"""
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "jobs.json")
+            with open(path, "w", encoding="utf-8") as config:
+                json.dump({"jobs": [job("a"), job("b", priority=-1, window=None)]}, config)
+            jobs = load_jobs(path)
+            self.assertEqual([("a", 0, 7200), ("b", -1, None)],
+                             [(entry.name, entry.priority, entry.window) for entry in jobs])
+            with open(path, "w", encoding="utf-8") as config:
+                json.dump({"jobs": [job("a"), job("a")]}, config)
+            with self.assertRaises(JobError):
+                load_jobs(path)
+        for bad in ({"schedule": "@daily"}, job("a", schedule="* *"),
+                    job("a", granularity="weekly"), job("a", window=-5)):
+            with self.subTest(bad=bad):
+                with self.assertRaises(JobError):
+                    make_job(bad)
+
+    def test_jb_02(self):
+        """Tests due jobs run in priority order and overlapping runs are skipped"""
+        controller = FakeSite()
+        clock = [NOW]
+        jobs = [make_job(job("low", priority=5, window=3600)),
+                make_job(job("high", priority=1)),
+                make_job(job("hourly", schedule="@hourly"))]
+        scheduler = Scheduler(QueryService(controller), jobs, workers=1, tz=UTC,
+                              clock=lambda: clock[0])
+        self.assertEqual(NOW + 300, scheduler.next_due)
+        self.assertEqual(0, scheduler.dispatch(NOW + 299))
+        self.assertEqual(2, scheduler.dispatch(NOW + 300))
+        # Not started yet, so both are still queued when they come due again
+        self.assertEqual(0, scheduler.dispatch(NOW + 600))
+        scheduler.start()
+        scheduler.stop()
+        # The window ends on the last whole hour, 10:00
+        self.assertEqual([("hourly", "branch", NOW - 9000, NOW - 1800),
+                          ("hourly", "branch", NOW - 5400, NOW - 1800)],
+                         controller.calls)
+        metrics = scheduler.metrics
+        self.assertEqual((1, 1, 0, 1), (metrics["high"].runs, metrics["high"].skipped,
+                                        metrics["high"].failures, metrics["high"].buckets))
+        self.assertEqual(0, metrics["hourly"].runs)
+        self.assertIsNotNone(metrics["low"].mean_duration)
+        self.assertEqual(NOW + 900, scheduler.next_due)
+
+    def test_jb_03(self):
+        """Tests jobs over the same stats share one fetch and outputs are written"""
+        controller = FakeSite()
+        with tempfile.TemporaryDirectory() as folder:
+            output = os.path.join(folder, "stats.jsonl")
+            jobs = [make_job(job("a", output=output)), make_job(job("b", output=output)),
+                    make_job(job("c", site="down", granularity="daily", window=None))]
+            scheduler = Scheduler(QueryService(controller), jobs, tz=UTC, clock=lambda: NOW)
+            self.assertEqual(3, scheduler.dispatch(NOW + 300))
+            scheduler.start()
+            scheduler.stop()
+            with open(output, encoding="utf-8") as written:
+                lines = [json.loads(line) for line in written]
+        self.assertEqual(2, len(controller.calls))
+        self.assertEqual([("branch", "hourly", NOW - 9000)] * 2,
+                         [(line["site"], line["granularity"], line["time"]) for line in lines])
+        metrics = scheduler.metrics
+        self.assertEqual((1, 1), (metrics["c"].runs, metrics["c"].failures))
+        self.assertIn("didn't answer", metrics["c"].last_error)
+
+    def test_jb_04(self):
+        """Tests any failure is recorded without losing the worker, and DST doesn't stall"""
+        controller = FakeSite()
+        output = os.path.join(tempfile.gettempdir(), "no-such-folder", "stats.db")
+        jobs = [make_job(job("a", output=output))]
+        scheduler = Scheduler(QueryService(controller, ttl=0), jobs, workers=1, tz=UTC,
+                              clock=lambda: NOW)
+        scheduler.start()
+        self.assertEqual(1, scheduler.dispatch(NOW + 300))
+        scheduler.stop()
+        scheduler.start()
+        self.assertEqual(1, scheduler.dispatch(NOW + 600))
+        scheduler.stop()
+        metrics = scheduler.metrics["a"]
+        self.assertEqual((2, 2, 0), (metrics.runs, metrics.failures, metrics.skipped))
+        self.assertTrue(metrics.last_error.startswith("OperationalError"))
+
+        new_york = get_timezone("America/New_York")
+        # 2021-11-07 01:10 EST, in the hour repeated when the clocks go back
+        fall_back = 1636265400
+        scheduler = Scheduler(QueryService(controller), [make_job(job("b"))], tz=new_york,
+                              clock=lambda: fall_back)
+        self.assertEqual(fall_back + 300, scheduler.next_due)
+        self.assertEqual(1, scheduler.dispatch(fall_back + 300))
+        self.assertEqual(fall_back + 600, scheduler.next_due)
@@ -0,0 +1,77 @@
+"""Tests the site leaderboard"""
+
+import json
+import unittest
+from unittest.mock import patch, MagicMock
+
+from test_controller import MockResponse
+
+from unifierlib import Controller
+from unifierlib.controller import HOURLY_STAT_URL
+from unifierlib.leaderboard import rank_sites, leaderboard, site_counters
+
+def site(name, t_x, r_x, users=0, guests=0):
+    """Makes a site record as api/stat/sites returns it"""
+    return {"name": name,
+            "desc": name.title(),
+            "health": [{"subsystem": "wan", "status": "ok", "tx_bytes-r": t_x, "rx_bytes-r": r_x},
+                       {"subsystem": "lan", "num_user": users},
+                       {"subsystem": "wlan", "num_user": guests}]}
+
+SITES = [site("alpha", 10, 5, 1, 2), site("bravo", 1, 100, 7), site("charlie", 50, 0, 0, 1),
+         {"name": "delta", "health": []}, {"desc": "nameless"}]
+
+class TestLeaderboard(unittest.TestCase):
+    """Tests ranking sites and drilling into the top ones"""
+    def test_lb_01(self):
+        """Tests counters are pulled out of the health subsystems"""
+        counters = site_counters(SITES[0])
+        self.assertEqual(("alpha", "Alpha", 10, 5, 3, "ok"),
+                         (counters.name, counters.desc, counters.wan_tx_rate,
+                          counters.wan_rx_rate, counters.clients, counters.status))
+        counters = site_counters(SITES[3])
+        self.assertEqual((0, 0, 0, None), (counters.wan_tx_rate, counters.wan_rx_rate,
+                                           counters.clients, counters.status))
+
+    def test_lb_02(self):
+        """Tests ranking by each metric"""
+        tests = [
+            ("wan", 2, ["bravo", "charlie"]),
+            ("tx", 3, ["charlie", "alpha", "bravo"]),
+            ("rx", 1, ["bravo"]),
+            ("clients", 10, ["bravo", "alpha", "charlie", "delta"])
+        ]
+        for metric, top, expected in tests:
+            with self.subTest(metric=metric):
+                ranked = rank_sites(SITES, top, metric)
+                self.assertEqual(expected, [counters.name for counters in ranked])
+        self.assertEqual(["bravo"], [c.name for c in rank_sites({s["name"]: s for s in SITES[:3]}, 1)])
+        with self.assertRaises(ValueError):
+            rank_sites(SITES, metric="latency")
+
+    @patch('requests.Session.get')
+    @patch('requests.Session.post')
+    def test_lb_03(self, mock_post: MagicMock, mock_get: MagicMock):
+        """Tests one site list request plus one stats request per top site"""
+        mock_get.return_value = MockResponse(200, "sites", json.dumps({"meta": {"rc": "ok"},
+                                                                      "data": SITES}))
+        stats_urls = []
+
+        def post(url, json=None, headers=None): # pylint: disable=redefined-outer-name,unused-argument
+            if not url.endswith("/api/login"):
+                stats_urls.append(url)
+            return MockResponse(200, url, '{"meta":{"rc":"ok"},"data":[{"time":3600000}]}')
+        mock_post.side_effect = post
+
+        controller = Controller('localhost', 8443, 'test', 'password', timezone="UTC")
+        entries = leaderboard(controller, top=2, granularity=HOURLY_STAT_URL, start=0, end=7200)
+        mock_get.assert_called_once()
+        self.assertEqual([1, 2], [entry.rank for entry in entries])
+        self.assertEqual(["bravo", "charlie"], [entry.counters.name for entry in entries])
+        self.assertEqual([[3600], [3600]], [entry.stats.times for entry in entries])
+        self.assertEqual(["https://localhost:8443/api/s/bravo/stat/report/hourly.site",
+                          "https://localhost:8443/api/s/charlie/stat/report/hourly.site"],
+                         sorted(stats_urls))
+        # The drilled-into sites share the session, the original keeps its site
+        self.assertEqual("default", controller.site)
+        self.assertIs(controller._session, controller.for_site("bravo")._session) # pylint: disable=protected-access
@@ -0,0 +1,136 @@
+"""Tests resumable event and alarm ingestion"""
+
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch, MagicMock
+
+from test_controller import MockResponse
+
+from unifierlib import Controller
+from unifierlib.logs import LogCursor, ingest, batched, JsonLinesSink
+
+class FakeLog:
+    """Answers stat/event posts from a growing list of records"""
+    def __init__(self, count):
+        now = int(time.time() * 1000)
+        # Two records share each millisecond to exercise the id tie-break
+        self.records = [{"_id": f"{index:04d}", "time": now - 600000 + index // 2, "key": "EVT"}
+                        for index in range(count)]
+        self.pages = []
+        self.age_out = 0
+
+    def post(self, url, json=None, headers=None): # pylint: disable=redefined-outer-name,unused-argument
+        """Mimics the controller's paged answer"""
+        if url.endswith("/api/login"):
+            return MockResponse(200, url, '{"meta":{"rc":"ok"},"data":[]}')
+        self.pages.append(dict(json, url=url))
+        matching = [record for record in self.records
+                    if json["start"] <= record["time"] <= json["end"]]
+        page = matching[json["_start"]:json["_start"] + json["_limit"]]
+        if self.age_out:
+            # The oldest records fall out of the log between pages
+            del self.records[:self.age_out]
+        return MockResponse(200, url, encode({"meta": {"rc": "ok"}, "data": page}))
+
+def encode(value):
+    """JSON encodes outside of post, whose json argument shadows the module"""
+    return json.dumps(value)
+
+class TestLogs(unittest.TestCase):
+    """Tests cursors, paging and resuming"""
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cursor_path = os.path.join(self.directory.name, "events.cursor")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_lg_01(self):
+        """Tests the cursor orders by time then id and survives a save"""
+        cursor = LogCursor()
+        self.assertTrue(cursor.is_new({"time": 0}))
+        cursor.advance([{"_id": "a", "time": 5}, {"_id": "b", "time": 7}, {"_id": "c", "time": 7}])
+        tests = [({"_id": "d", "time": 6}, False), ({"_id": "b", "time": 7}, False),
+                 ({"_id": "d", "time": 7}, True), ({"_id": "a", "time": 8}, True)]
+        for record, expected in tests:
+            with self.subTest(record=record):
+                self.assertEqual(expected, cursor.is_new(record))
+        cursor.save(self.cursor_path)
+        loaded = LogCursor.load(self.cursor_path)
+        self.assertEqual((7, {"b", "c"}), (loaded.time, loaded.ids))
+        self.assertIsNone(LogCursor.load(self.cursor_path + ".missing").time)
+        self.assertEqual([[1, 2], [3]], list(batched([1, 2, 3], 2)))
+
+    @patch('requests.Session.post')
+    def test_lg_02(self, mock_post: MagicMock):
+        """Tests a rerun only ingests the records logged since"""
+        log = FakeLog(25)
+        mock_post.side_effect = log.post
+        controller = Controller('localhost', 8443, 'test', 'password', timezone="UTC")
+        batches = []
+
+        report = ingest(lambda cursor: controller.iter_events(cursor, page_size=10),
+                        batches.append, self.cursor_path, batch_size=4)
+        self.assertEqual((25, 7), (report.ingested, report.batches))
+        self.assertEqual([record["_id"] for record in log.records],
+                         [record["_id"] for batch in batches for record in batch])
+        first = log.pages[0]
+        self.assertEqual(30 * 24 * 3600000, first["end"] - first["start"])
+        # Each page starts at the last time read, skipping the two records read there
+        self.assertEqual([(4, 2), (9, 2)],
+                         [(page["start"] - log.records[0]["time"], page["_start"])
+                          for page in log.pages[1:]])
+        self.assertEqual("+time", log.pages[0]["_sort"])
+        self.assertTrue(log.pages[0]["url"].endswith("/api/s/default/stat/event"))
+
+        log.records.append({"_id": "9999", "time": log.records[-1]["time"], "key": "EVT"})
+        batches.clear()
+        report = ingest(lambda cursor: controller.iter_events(cursor, page_size=10),
+                        batches.append, self.cursor_path)
+        self.assertEqual(["9999"], [record["_id"] for batch in batches for record in batch])
+        # The second time round starts at the cursor
+        self.assertEqual(log.records[-1]["time"], log.pages[-1]["start"])
+
+    @patch('requests.Session.post')
+    def test_lg_03(self, mock_post: MagicMock):
+        """Tests an interrupted run resumes after the last whole batch"""
+        log = FakeLog(10)
+        mock_post.side_effect = log.post
+        controller = Controller('localhost', 8443, 'test', 'password', timezone="UTC")
+        written = []
+
+        def failing_sink(batch):
+            if len(written) == 2:
+                raise IOError("disk full")
+            written.append(batch)
+
+        with self.assertRaises(IOError):
+            ingest(controller.iter_alarms, failing_sink, self.cursor_path, batch_size=3)
+        self.assertTrue(log.pages[0]["url"].endswith("/api/s/default/stat/alarm"))
+        output = os.path.join(self.directory.name, "alarms.jsonl")
+        with JsonLinesSink(output) as sink:
+            report = ingest(controller.iter_alarms, sink, self.cursor_path, batch_size=3)
+        self.assertEqual(4, report.ingested)
+        with open(output, encoding="utf-8") as lines:
+            self.assertEqual(["0006", "0007", "0008", "0009"],
+                             [json.loads(line)["_id"] for line in lines])
+
+    @patch('requests.Session.post')
+    def test_lg_04(self, mock_post: MagicMock):
+        """Tests no record is skipped while the oldest ones age out between pages"""
+        log = FakeLog(30)
+        log.age_out = 5
+        expected = [record["_id"] for record in log.records]
+        mock_post.side_effect = log.post
+        controller = Controller('localhost', 8443, 'test', 'password', timezone="UTC")
+        self.assertEqual(expected, [record["_id"] for record in
+                                    controller.iter_events(page_size=7)])
+        # A page entirely at one time steps on within it
+        log = FakeLog(0)
+        log.records = [{"_id": f"{index}", "time": 5, "key": "EVT"} for index in range(5)]
+        mock_post.side_effect = log.post
+        self.assertEqual(5, len(list(controller.iter_events(LogCursor(1), page_size=2))))
+        self.assertEqual([0, 2, 4], [page["_start"] for page in log.pages])
@@ -0,0 +1,52 @@
+"""Tests the profiling hooks"""
+
+import unittest
+from unittest.mock import patch, MagicMock
+
+from test_controller import MockResponse
+
+from unifierlib import Controller
+from unifierlib.profiling import Profiler, phase, active
+from unifierlib.controller import HOURLY_STAT_URL
+
+class TestProfiling(unittest.TestCase):
+    """Tests phase timing, reports and folded stacks"""
+    def test_pf_01(self):
+        """Tests phases do nothing without an active profiler"""
+        self.assertIsNone(active())
+        with phase("idle"):
+            pass
+        profiler = Profiler(use_cprofile=False)
+        with profiler:
+            self.assertIs(profiler, active())
+            for _ in range(3):
+                with phase("build"):
+                    _ = [bytes(1024) for _ in range(100)]
+        self.assertIsNone(active())
+        self.assertEqual(["build"], list(profiler.phases))
+        build = profiler.phases["build"]
+        self.assertEqual(3, build.calls)
+        self.assertGreater(build.wall, 0)
+        self.assertGreater(build.allocated, 0)
+
+    @patch('requests.Session.post')
+    def test_pf_02(self, mock_post: MagicMock):
+        """Tests the controller's phases show up in the report and stacks"""
+        mock_post.side_effect = [
+            MockResponse(200, "login", '{"meta":{"rc":"ok"},"data":[]}'),
+            MockResponse(200, "stats", '{"meta":{"rc":"ok"},"data":[{"time":3600000}]}')
+        ]
+        with Profiler() as profiler:
+            controller = Controller('localhost', 8443, 'test', 'password', timezone="UTC")
+            controller.get_stats(HOURLY_STAT_URL, 3600, 7200)
+        self.assertEqual(["login", "request", "decode", "sort"], list(profiler.phases))
+        report = profiler.report()
+        self.assertIn("Total wall time", report)
+        self.assertIn("decode", report)
+        stacks = profiler.folded_stacks().splitlines()
+        self.assertTrue(stacks)
+        for line in stacks:
+            stack, micros = line.rsplit(" ", 1)
+            self.assertTrue(stack)
+            self.assertGreater(int(micros), 0)
+        self.assertTrue(any("get_stats" in line for line in stacks))
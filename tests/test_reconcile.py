@@ -0,0 +1,96 @@
+"""Tests the reconciliation functionality"""
+
+import datetime
+import unittest
+
+from unifierlib.controller import DAILY_STAT_URL, HOURLY_STAT_URL, MINUTELY_STAT_URL
+from unifierlib.reconcile import rollup, compare, reconcile
+from unifierlib.series import StatSeries
+from unifierlib.utility import WAN_TX_KEY, WAN_RX_KEY
+
+def buckets(start, count, interval, value):
+    """Makes count buckets of the same value"""
+    return StatSeries({"time": start + i * interval, WAN_TX_KEY: value, WAN_RX_KEY: value}
+                      for i in range(count))
+
+class FakeController:
+    """Serves a consistent set of reports"""
+    timezone = datetime.timezone.utc
+
+    def __init__(self):
+        self.reports = {
+            MINUTELY_STAT_URL: buckets(0, 24 * 12, 300, 10),
+            HOURLY_STAT_URL: buckets(0, 24, 3600, 120),
+            DAILY_STAT_URL: buckets(0, 1, 86400, 24 * 120)
+        }
+
+    def get_stats(self, granularity, start, end, stat_attributes=None):
+        """Mimics Controller.get_stats"""
+        return self.reports[granularity].between(start, end + 1)
+
+class TestReconcile(unittest.TestCase):
+    """Tests rollups and cross-granularity comparison"""
+    def test_rc_01(self):
+        """Tests rolling 5 minute buckets into hours"""
+        fine = buckets(600, 30, 300, 1)
+        result = rollup(fine, [0, 3600, 7200], [WAN_TX_KEY], 300, 3600)
+        self.assertEqual([10, 12, 8], result["sums"][WAN_TX_KEY])
+        self.assertEqual([10, 12, 8], result["counts"])
+        self.assertEqual([12, 12, 12], result["expected"])
+
+    def test_rc_02(self):
+        """Tests matching buckets raise nothing"""
+        self.assertEqual([], compare(buckets(0, 24, 300, 10),
+                                     buckets(0, 2, 3600, 120),
+                                     300,
+                                     3600,
+                                     abs_tolerance=0))
+
+    def test_rc_03(self):
+        """Tests mismatches are flagged and partial buckets skipped"""
+        fine = buckets(0, 30, 300, 10000)
+        coarse = buckets(0, 3, 3600, 120000)
+        coarse[1][WAN_RX_KEY] = 100000
+        result = compare(fine, coarse, 300, 3600)
+        self.assertEqual(1, len(result))
+        self.assertEqual(3600, result[0].time)
+        self.assertEqual(WAN_RX_KEY, result[0].attribute)
+        self.assertEqual(20000, result[0].delta)
+        self.assertAlmostEqual(0.2, result[0].relative)
+
+    def test_rc_04(self):
+        """Tests small differences are tolerated"""
+        fine = buckets(0, 12, 300, 10000)
+        coarse = buckets(0, 1, 3600, 120500)
+        self.assertEqual([], compare(fine, coarse, 300, 3600))
+        self.assertEqual([], compare(fine, coarse, 300, 3600, abs_tolerance=0))
+        self.assertEqual(2, len(compare(fine, coarse, 300, 3600,
+                                        tolerance=0, abs_tolerance=0)))
+
+    def test_rc_05(self):
+        """Tests the full reconciliation"""
+        controller = FakeController()
+        result = reconcile(controller, 0, 86400)
+        self.assertEqual([], result.minutely_hourly)
+        self.assertEqual([], result.hourly_daily)
+        controller.reports[DAILY_STAT_URL][0][WAN_TX_KEY] = 0
+        result = reconcile(controller, 0, 86400)
+        self.assertEqual(1, len(result.hourly_daily))
+        controller.get_stats = lambda *args, **kwargs: None
+        self.assertIsNone(reconcile(controller, 0, 86400))
+
+    def test_rc_06(self):
+        """Tests a missing coarse bucket doesn't push its fine buckets into the one before"""
+        fine = buckets(0, 3 * 12, 300, 1000)
+        coarse = StatSeries([{"time": 0, WAN_TX_KEY: 12000, WAN_RX_KEY: 12000},
+                             {"time": 7200, WAN_TX_KEY: 12000, WAN_RX_KEY: 12000}])
+        rolled = rollup(fine, coarse.times, [WAN_TX_KEY], 300, 3600)
+        self.assertEqual(([12000, 12000], [12, 12], [12, 12]),
+                         (rolled["sums"][WAN_TX_KEY], rolled["counts"], rolled["expected"]))
+        self.assertEqual([], compare(fine, coarse, 300, 3600))
+        # A missing day is left out the same way, with days on the local calendar
+        tz = datetime.timezone(datetime.timedelta(hours=-5))
+        hourly = buckets(5 * 3600, 72, 3600, 10)
+        daily = StatSeries([{"time": 5 * 3600, WAN_TX_KEY: 240, WAN_RX_KEY: 240},
+                            {"time": 2 * 86400 + 5 * 3600, WAN_TX_KEY: 240, WAN_RX_KEY: 240}])
+        self.assertEqual([], compare(hourly, daily, 3600, 86400, tz=tz))
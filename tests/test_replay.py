@@ -0,0 +1,102 @@
+"""Tests recording and replaying controller traffic"""
+
+import gzip
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import requests
+from requests import ConnectionError
+
+from unifierlib import Controller
+from unifierlib.controller import HOURLY_STAT_URL
+from unifierlib.replay import Recorder, RecordingAdapter, ReplayAdapter, ReplayError
+from unifierlib.replay import scrub, load_recording
+
+def stand_in(adapter, request, **kwargs): # pylint: disable=unused-argument
+    """Answers in place of the network the way the controller would"""
+    response = requests.Response()
+    response.status_code = 200
+    response.url = request.url
+    response.request = request
+    if request.url.endswith("/api/login"):
+        response._content = b'{"meta":{"rc":"ok"},"data":[]}' # pylint: disable=protected-access
+        response.headers["Set-Cookie"] = "unifises=secret-session"
+    else:
+        body = json.loads(request.body)
+        data = [{"time": stat_time * 1000, "wan-tx_bytes": 5}
+                for stat_time in range(body["start"] // 1000, body["end"] // 1000, 3600)]
+        response._content = json.dumps({"meta": {"rc": "ok"}, "data": data}).encode() # pylint: disable=protected-access
+        response.headers["Content-Encoding"] = "gzip"
+        response.headers["Content-Length"] = "33"
+    return response
+
+class TestReplay(unittest.TestCase):
+    """Tests recordings are scrubbed and replay without a network"""
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "session.jsonl.gz")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def record(self):
+        """Records a login and two stats requests"""
+        with patch.object(requests.adapters.HTTPAdapter, "send", stand_in):
+            with Recorder(self.path) as recorder:
+                controller = Controller('localhost', 8443, 'admin', 'hunter2',
+                                        timezone="UTC",
+                                        adapter=RecordingAdapter(recorder))
+                controller.get_stats(HOURLY_STAT_URL, 3600, 3600 * 4)
+                controller.get_stats(HOURLY_STAT_URL, 3600 * 10, 3600 * 12)
+            self.assertEqual(3, len(recorder))
+
+    def test_rp_01(self):
+        """Tests secrets are scrubbed wherever they appear"""
+        self.assertEqual({"username": "***", "nested": [{"X_Password": "***", "keep": 1}]},
+                         scrub({"username": "a", "nested": [{"X_Password": "b", "keep": 1}]}))
+
+    def test_rp_02(self):
+        """Tests recordings keep no credentials or cookies"""
+        self.record()
+        with gzip.open(self.path, "rt", encoding="utf-8") as recording:
+            text = recording.read()
+        self.assertNotIn("hunter2", text)
+        self.assertNotIn("admin", text)
+        self.assertNotIn("secret-session", text)
+        entries = load_recording(self.path)
+        self.assertEqual(["/api/login", "/api/s/default/stat/report/hourly.site",
+                          "/api/s/default/stat/report/hourly.site"],
+                         [entry["target"] for entry in entries])
+        self.assertEqual({"Content-Encoding": "gzip", "Content-Length": "33"},
+                         entries[1]["headers"])
+
+    def test_rp_03(self):
+        """Tests replay serves the recorded answers, falling back for new windows"""
+        self.record()
+        sleeps = []
+        adapter = ReplayAdapter(self.path, time_scale=0.5, sleep=sleeps.append)
+        controller = Controller('elsewhere', 443, 'user', 'password',
+                                timezone="UTC", adapter=adapter)
+        self.assertTrue(controller.logged_in)
+        self.assertEqual([3600, 7200, 10800],
+                         controller.get_stats(HOURLY_STAT_URL, 3600, 3600 * 4).times)
+        self.assertEqual([36000, 39600],
+                         controller.get_stats(HOURLY_STAT_URL, 3600 * 10, 3600 * 12).times)
+        # Never recorded, so the answers recorded for that path are served in order
+        self.assertEqual([3600, 7200, 10800],
+                         controller.get_stats(HOURLY_STAT_URL, 0, 3600 * 30).times)
+        self.assertEqual(4, len(sleeps))
+        self.assertEqual(33, controller.request_metrics[0].wire_bytes)
+
+        with self.assertRaises(ConnectionError):
+            controller._session.get("https://elsewhere:443/api/self/sites") # pylint: disable=protected-access
+
+    def test_rp_04(self):
+        """Tests unreadable recordings are refused"""
+        with open(self.path, "wb") as recording:
+            recording.write(b"not gzip")
+        with self.assertRaises(ReplayError):
+            ReplayAdapter(self.path)
@@ -0,0 +1,111 @@
+"""Tests the StatSeries functionality"""
+
+import copy
+import json
+import pickle
+import unittest
+
+from unifierlib.series import StatSeries
+
+def bucket(stat_time, value=0):
+    """Makes a minimal bucket"""
+    return {"time": stat_time, "wan-tx_bytes": value}
+
+class TestStatSeries(unittest.TestCase):
+    """Tests the time-indexed stat series"""
+    def test_ss_01(self):
+        """Tests construction sorts and dedupes, keeping the last duplicate"""
+        series = StatSeries([bucket(300), bucket(0), bucket(600), bucket(300, 7)])
+        self.assertEqual([0, 300, 600], series.times)
+        self.assertEqual(7, series[1]["wan-tx_bytes"])
+        self.assertEqual(0, series.start)
+        self.assertEqual(600, series.end)
+
+    def test_ss_02(self):
+        """Tests the series still behaves as a list"""
+        series = StatSeries([bucket(0), bucket(300)])
+        self.assertIsInstance(series, list)
+        self.assertEqual(2, len(series))
+        self.assertEqual('[{"time": 0, "wan-tx_bytes": 0}, {"time": 300, "wan-tx_bytes": 0}]',
+                         json.dumps(series))
+
+    def test_ss_03(self):
+        """Tests merging newer, older, interleaved and duplicate buckets"""
+        series = StatSeries([bucket(t) for t in range(0, 3000, 600)])
+        self.assertEqual(2, series.merge([bucket(3000), bucket(3600)]))
+        self.assertEqual(1, series.merge([bucket(-600)]))
+        self.assertEqual(2, series.merge([bucket(900), bucket(300), bucket(1200, 5)]))
+        self.assertEqual([-600, 0, 300, 600, 900, 1200, 1800, 2400, 3000, 3600],
+                         series.times)
+        self.assertEqual(5, series.get(1200)["wan-tx_bytes"])
+        self.assertEqual(series.times, [entry["time"] for entry in series])
+
+    def test_ss_04(self):
+        """Tests range slicing"""
+        series = StatSeries([bucket(t) for t in range(0, 3000, 300)])
+        tests = [
+            (None, None, 10),
+            (0, 300, 1),
+            (100, 1000, 3),
+            (2700, None, 1),
+            (3000, None, 0),
+            (900, 600, 0)
+        ]
+        for start, end, expected in tests:
+            with self.subTest(start=start, end=end):
+                result = series.between(start, end)
+                self.assertIsInstance(result, StatSeries)
+                self.assertEqual(expected, len(result))
+                self.assertEqual([entry["time"] for entry in result], result.times)
+
+    def test_ss_05(self):
+        """Tests exact and nearest lookups"""
+        series = StatSeries([bucket(t) for t in range(0, 3000, 300)])
+        self.assertIsNone(series.get(301))
+        self.assertEqual(300, series.get(300)["time"])
+        tests = [(-50, 0), (140, 0), (150, 0), (160, 300), (5000, 2700)]
+        for stat_time, expected in tests:
+            with self.subTest(stat_time=stat_time):
+                self.assertEqual(expected, series.nearest(stat_time)["time"])
+        self.assertIsNone(StatSeries().nearest(5))
+
+    def test_ss_06(self):
+        """Tests gap detection"""
+        series = StatSeries([bucket(t) for t in [0, 300, 1200, 1500, 2400]])
+        self.assertEqual([(600, 1200), (1800, 2400)], series.gaps(300))
+        self.assertEqual([(-600, 0), (600, 1200), (1800, 2400), (2700, 3000)],
+                         series.gaps(300, -600, 3000))
+        self.assertEqual([(0, 900)], StatSeries().gaps(300, 0, 900))
+
+    def test_ss_07(self):
+        """Tests append, extend and reindex keep the index in step"""
+        series = StatSeries()
+        series.append(bucket(600))
+        series.extend([bucket(0), bucket(300)])
+        self.assertEqual([0, 300, 600], series.times)
+        list.append(series, bucket(150))
+        series.reindex()
+        self.assertEqual([0, 150, 300, 600], series.times)
+        series.clear()
+        self.assertEqual([], series.times)
+
+    def test_ss_08(self):
+        """Tests copies and pickles are independent series with their own index"""
+        series = StatSeries([bucket(0), bucket(300), bucket(600)])
+        tests = [
+            ("copy", copy.copy),
+            ("deepcopy", copy.deepcopy),
+            ("pickle", lambda original: pickle.loads(pickle.dumps(original)))
+        ]
+        for name, duplicate in tests:
+            with self.subTest(name=name):
+                result = duplicate(series)
+                self.assertIsInstance(result, StatSeries)
+                self.assertEqual([0, 300, 600], result.times)
+                self.assertIsNot(series.times, result.times)
+                result.append(bucket(900))
+                self.assertEqual([0, 300, 600, 900], result.times)
+                self.assertEqual([0, 300, 600], series.times)
+                self.assertEqual(600, series.get(600)["time"])
+        self.assertIs(series[0], copy.copy(series)[0])
+        self.assertIsNot(series[0], copy.deepcopy(series)[0])
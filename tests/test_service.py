@@ -0,0 +1,113 @@
+"""Tests the local query service"""
+
+import json
+import threading
+import time
+import unittest
+import urllib.error
+import urllib.request
+
+from unifierlib.service import TTLCache, QueryService, QueryError, make_server
+
+class FakeController:
+    """Counts calls and answers after a short delay"""
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+        self.site = "default"
+
+    def for_site(self, site):
+        """A controller for site that records calls here"""
+        other = FakeController(self.delay)
+        other.calls = self.calls
+        other.site = site
+        return other
+
+    def site_info_simplified(self):
+        """Two sites"""
+        self.calls.append("sites")
+        time.sleep(self.delay)
+        return {"default": {"name": "default"}, "branch": {"name": "branch"}}
+
+    def get_hourly_stats(self, start, end):
+        """One bucket"""
+        self.calls.append(("hourly", self.site, start, end))
+        time.sleep(self.delay)
+        return [{"time": 0, "wan-tx_bytes": 1, "wan-rx_bytes": 2}]
+
+    def get_stats(self, granularity, start, end):
+        """One bucket at start"""
+        self.calls.append((granularity, self.site, start, end))
+        return [{"time": start, "wan-tx_bytes": 1, "wan-rx_bytes": 2}]
+
+    def get_clients(self):
+        """Fails, as on a controller that's down"""
+        self.calls.append(("clients", self.site))
+
+class TestService(unittest.TestCase):
+    """Tests caching, coalescing and the HTTP front end"""
+    def test_sv_01(self):
+        """Tests entries expire after the ttl and the least recently used go first"""
+        now = [0.0]
+        cache = TTLCache(ttl=10, max_entries=2, clock=lambda: now[0])
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual((True, 1), cache.get("a"))
+        cache.put("c", 3)
+        self.assertEqual((False, None), cache.get("b"))
+        now[0] = 10
+        self.assertEqual((False, None), cache.get("a"))
+        self.assertEqual((False, None), cache.get("c"))
+        self.assertEqual(0, len(cache))
+
+    def test_sv_02(self):
+        """Tests repeats come from the cache and concurrent queries share one call"""
+        controller = FakeController(delay=0.2)
+        service = QueryService(controller)
+        threads = [threading.Thread(target=service.stats, args=("branch", "hourly"))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(2, service.stats("branch", "hourly")[0]["wan-rx_bytes"])
+        self.assertEqual([("hourly", "branch", None, None)], controller.calls)
+        service.stats("branch", "daily", 100, 200)
+        self.assertEqual(("daily", "branch", 100, 200), controller.calls[-1])
+        with self.assertRaises(QueryError) as caught:
+            service.clients("branch")
+        self.assertEqual(502, caught.exception.status)
+        with self.assertRaises(QueryError):
+            service.clients("branch")
+        metrics = service.metrics
+        self.assertEqual((9, 1, 8, 4, 4, 2, 1),
+                         (metrics.queries, metrics.hits, metrics.misses, metrics.coalesced,
+                          metrics.controller_calls, metrics.failures, metrics.sites))
+        self.assertAlmostEqual(1 / 9, metrics.hit_ratio)
+
+    def test_sv_03(self):
+        """Tests the HTTP front end answers JSON, with errors as statuses"""
+        service = QueryService(FakeController())
+        server = make_server(service, port=0, quiet=True)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        root = f"http://127.0.0.1:{server.server_address[1]}"
+        try:
+            with urllib.request.urlopen(f"{root}/sites") as answer:
+                self.assertEqual(["default", "branch"], list(json.load(answer)))
+            with urllib.request.urlopen(f"{root}/s/branch/stats/hourly?start=5&end=9") as answer:
+                self.assertEqual(5, json.load(answer)[0]["time"])
+            for path, status in (("/nowhere", 404), ("/s/branch/stats/weekly", 404),
+                                 ("/s/branch/stats/hourly?start=x&end=9", 400),
+                                 ("/s/branch/dpi?by=by_os", 400),
+                                 ("/s/branch/clients", 502)):
+                with self.subTest(path=path):
+                    with self.assertRaises(urllib.error.HTTPError) as caught:
+                        urllib.request.urlopen(root + path).close()
+                    self.assertEqual(status, caught.exception.code)
+                    caught.exception.close()
+            with urllib.request.urlopen(f"{root}/metrics") as answer:
+                self.assertEqual(3, json.load(answer)["controller_calls"])
+        finally:
+            server.shutdown()
+            server.server_close()
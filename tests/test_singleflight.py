@@ -0,0 +1,104 @@
+"""Tests the SingleFlight functionality"""
+
+import threading
+import time
+import unittest
+from unittest.mock import patch, MagicMock
+
+from unifierlib import Controller
+from unifierlib.controller import HOURLY_STAT_URL
+from unifierlib.singleflight import SingleFlight
+
+from test_controller import MockResponse
+
+def wait_for(condition, timeout=5.0):
+    """Polls until condition() is true or the timeout passes"""
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+class TestSingleFlight(unittest.TestCase):
+    """Tests coalescing of concurrent calls"""
+    def run_threads(self, count, target):
+        """Runs target on count threads and returns their results"""
+        results = [None] * count
+        def runner(index):
+            try:
+                results[index] = target()
+            except Exception as exc: # pylint: disable=broad-except
+                results[index] = exc
+        threads = [threading.Thread(target=runner, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_sf_01(self):
+        """Tests concurrent calls for one key share one call"""
+        flights = SingleFlight()
+        release = threading.Event()
+        calls = []
+        def work():
+            calls.append(1)
+            release.wait(5)
+            return 42
+        def caller():
+            return flights.do("key", work)
+        def releaser():
+            wait_for(lambda: flights.metrics.coalesced == 7)
+            release.set()
+        threading.Thread(target=releaser).start()
+        results = self.run_threads(8, caller)
+        self.assertEqual([42] * 8, results)
+        self.assertEqual(1, len(calls))
+        metrics = flights.metrics
+        self.assertEqual((1, 7, 0), (metrics.calls, metrics.coalesced, metrics.in_flight))
+
+    def test_sf_02(self):
+        """Tests sequential calls and different keys aren't coalesced"""
+        flights = SingleFlight()
+        self.assertEqual(1, flights.do("a", lambda: 1))
+        self.assertEqual(1, flights.do("a", lambda: 1))
+        self.assertEqual(2, flights.do("b", lambda: 2))
+        self.assertEqual(3, flights.metrics.calls)
+        self.assertEqual(0, flights.metrics.coalesced)
+
+    def test_sf_03(self):
+        """Tests waiters see the leader's exception"""
+        flights = SingleFlight()
+        release = threading.Event()
+        def work():
+            release.wait(5)
+            raise ValueError("boom")
+        def releaser():
+            wait_for(lambda: flights.metrics.coalesced == 3)
+            release.set()
+        threading.Thread(target=releaser).start()
+        results = self.run_threads(4, lambda: flights.do("key", work))
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+        self.assertEqual(0, flights.metrics.in_flight)
+
+    @patch('requests.Session.post')
+    def test_sf_04(self, mock_post: MagicMock):
+        """Tests identical concurrent stats queries make one controller call"""
+        login = MockResponse(200, "login", '{"meta":{"rc":"ok"},"data":[]}')
+        mock_post.return_value = login
+        controller = Controller('localhost', 8443, 'test', 'password')
+
+        def stats_post(url, json=None): # pylint: disable=redefined-outer-name,unused-argument
+            wait_for(lambda: controller.flight_metrics.coalesced == 5)
+            return MockResponse(200,
+                                url,
+                                '{"meta":{"rc":"ok"},"data":[{"time":3600000,"wan-tx_bytes":1}]}')
+        mock_post.side_effect = stats_post
+
+        results = self.run_threads(6, lambda: controller.get_stats(HOURLY_STAT_URL, 3600, 7200))
+        # One login, one stats call
+        self.assertEqual(2, mock_post.call_count)
+        self.assertEqual(5, controller.flight_metrics.coalesced)
+        for result in results:
+            self.assertEqual([3600], result.times)
+        # Each caller has its own series over the shared buckets
+        self.assertIsNot(results[0], results[1])
+        self.assertIs(results[0][0], results[1][0])
@@ -0,0 +1,109 @@
+"""Tests the throttle functionality"""
+
+import threading
+import unittest
+from unittest.mock import patch, MagicMock
+
+from unifierlib import Controller
+from unifierlib.controller import HOURLY_STAT_URL
+from unifierlib.throttle import TokenBucket, AdaptiveConcurrency, Throttle
+
+from test_controller import MockResponse
+
+class FakeClock:
+    """A clock that only moves when slept on"""
+    def __init__(self):
+        self.now = 0.0
+    def __call__(self):
+        return self.now
+    def sleep(self, delay):
+        """Moves the clock on"""
+        self.now += delay
+
+class TestThrottle(unittest.TestCase):
+    """Tests the token bucket and AIMD concurrency limit"""
+    def test_th_01(self):
+        """Tests the bucket allows a burst then the steady rate"""
+        clock = FakeClock()
+        bucket = TokenBucket(10, burst=5, clock=clock, sleep=clock.sleep)
+        for _ in range(5):
+            bucket.acquire()
+        self.assertEqual(0.0, clock.now)
+        for _ in range(10):
+            bucket.acquire()
+        self.assertAlmostEqual(1.0, clock.now)
+        with self.assertRaises(ValueError):
+            TokenBucket(0)
+
+    def test_th_02(self):
+        """Tests the limit backs off on errors and slow calls"""
+        limiter = AdaptiveConcurrency(initial=8, minimum=1, maximum=16, target_latency=1.0)
+        for _ in range(8):
+            limiter.acquire()
+        # A whole window failing only counts once
+        for _ in range(8):
+            limiter.release(0.1, error=True)
+        self.assertEqual(4, limiter.limit)
+        for _ in range(4):
+            limiter.acquire()
+            limiter.release(5.0)
+        self.assertEqual(2, limiter.limit)
+        for _ in range(10):
+            limiter.acquire()
+            limiter.release(5.0)
+        self.assertEqual(1, limiter.limit)
+
+    def test_th_03(self):
+        """Tests the limit grows by about one per window of successes"""
+        limiter = AdaptiveConcurrency(initial=2, maximum=4)
+        for _ in range(4):
+            limiter.acquire()
+            limiter.release(0.1)
+        self.assertEqual(3, limiter.limit)
+        for _ in range(100):
+            limiter.acquire()
+            limiter.release(0.1)
+        self.assertEqual(4, limiter.limit)
+
+    def test_th_04(self):
+        """Tests concurrency never exceeds the limit"""
+        limiter = AdaptiveConcurrency(initial=3, maximum=3)
+        peak = [0]
+        lock = threading.Lock()
+        def work():
+            for _ in range(50):
+                limiter.acquire()
+                with lock:
+                    peak[0] = max(peak[0], limiter.in_flight)
+                limiter.release(0.0)
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertLessEqual(peak[0], 3)
+        self.assertEqual(0, limiter.in_flight)
+
+    def test_th_05(self):
+        """Tests exceptions count as errors"""
+        throttle = Throttle(max_concurrency=4)
+        for _ in range(4):
+            with self.assertRaises(RuntimeError):
+                with throttle.request():
+                    raise RuntimeError()
+        self.assertEqual(1, throttle.metrics.decreases)
+        self.assertIsNone(Throttle().metrics.limit)
+
+    @patch('requests.Session.post')
+    def test_th_06(self, mock_post: MagicMock):
+        """Tests controller server errors shrink the concurrency limit"""
+        mock_post.return_value = MockResponse(200, "login", '{"meta":{"rc":"ok"},"data":[]}')
+        controller = Controller('localhost', 8443, 'test', 'password',
+                                rate_limit=1000, max_concurrency=8)
+        mock_post.return_value = MockResponse(503, "stats", '')
+        for hour in range(8):
+            self.assertIsNone(controller.get_stats(HOURLY_STAT_URL, hour * 3600, hour * 3600))
+        metrics = controller.throttle_metrics
+        self.assertEqual(1000, metrics.rate)
+        self.assertLess(metrics.limit, 4)
+        self.assertEqual(8, len(controller.error_stack))
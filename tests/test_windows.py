@@ -0,0 +1,73 @@
+"""Tests the time zone aware window helpers"""
+
+import datetime
+import unittest
+
+from unifierlib.windows import get_timezone, align, bucket_boundaries, assign_buckets
+from unifierlib.windows import default_window, format_time, midnight, WindowError
+
+NEW_YORK = get_timezone("America/New_York")
+KOLKATA = get_timezone("Asia/Kolkata")
+UTC = datetime.timezone.utc
+
+class TestWindows(unittest.TestCase):
+    """Tests windows and bucket boundaries in explicit time zones"""
+    def test_wn_01(self):
+        """Tests resolving time zone names"""
+        self.assertIsNone(get_timezone(None))
+        self.assertIs(UTC, get_timezone("UTC"))
+        self.assertEqual("Europe/Berlin", str(get_timezone("Europe/Berlin")))
+        with self.assertRaises(WindowError):
+            get_timezone("Not/A_Zone")
+
+    def test_wn_02(self):
+        """Tests aligning to hours and days in a half-hour offset zone"""
+        # 2021-03-10 06:40 UTC is 12:10 in Kolkata
+        stat_time = 1615358400
+        tests = [
+            (300, UTC, stat_time),
+            (3600, UTC, stat_time - 40 * 60),
+            (3600, KOLKATA, stat_time - 10 * 60),
+            (86400, UTC, 1615334400),
+            (86400, KOLKATA, 1615334400 - 19800)
+        ]
+        for interval, tz, expected in tests:
+            with self.subTest(interval=interval, tz=str(tz)):
+                self.assertEqual(expected, align(stat_time, interval, tz))
+
+    def test_wn_03(self):
+        """Tests daily boundaries follow local midnights across DST"""
+        start = midnight(datetime.date(2021, 3, 13), NEW_YORK)
+        end = midnight(datetime.date(2021, 3, 16), NEW_YORK)
+        boundaries = bucket_boundaries(86400, start, end, NEW_YORK)
+        self.assertEqual(3, len(boundaries))
+        self.assertEqual([86400, 82800], [boundaries[1] - boundaries[0],
+                                          boundaries[2] - boundaries[1]])
+        self.assertEqual(["00:00"] * 3, [format_time(b, "%H:%M", NEW_YORK) for b in boundaries])
+
+    def test_wn_04(self):
+        """Tests fixed cadence boundaries start on the first aligned time"""
+        self.assertEqual([300, 600, 900], bucket_boundaries(300, 1, 1200, UTC))
+        self.assertEqual([0, 300], bucket_boundaries(300, 0, 600, UTC))
+        self.assertEqual([], bucket_boundaries(300, 600, 600, UTC))
+
+    def test_wn_05(self):
+        """Tests assigning unsorted times to buckets"""
+        self.assertEqual([1, -1, 0, 2, 1],
+                         assign_buckets([3600, -1, 0, 9000, 7199], [0, 3600, 7200]))
+
+    def test_wn_06(self):
+        """Tests default windows per report in the site time zone"""
+        # 2021-03-15 10:20 in New York, the day after DST began
+        end = datetime.datetime(2021, 3, 15, 10, 20, tzinfo=NEW_YORK).timestamp()
+        hour = datetime.datetime(2021, 3, 15, 10, tzinfo=NEW_YORK).timestamp()
+        tests = [
+            (86400, datetime.datetime(2021, 3, 1, tzinfo=NEW_YORK)),
+            (3600, datetime.datetime(2021, 3, 8, 10, tzinfo=NEW_YORK)),
+            (300, datetime.datetime(2021, 3, 14, 10, tzinfo=NEW_YORK))
+        ]
+        for interval, expected in tests:
+            with self.subTest(interval=interval):
+                self.assertEqual((expected.timestamp(), hour),
+                                 default_window(interval, None, end, NEW_YORK))
+        self.assertEqual((5, hour), default_window(3600, 5, end, NEW_YORK))
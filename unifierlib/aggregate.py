@@ -0,0 +1,262 @@
+"""Mergeable partial aggregates and parallel summarization of stats
+
+Each partition of a series is reduced to a StatAggregate holding sums, counts, min/max
+and a percentile sketch per attribute. Aggregates merge exactly (the sketch within its
+relative accuracy), so partitions can be reduced in any order across a process pool.
+
+The pool only pays off when the workers do the per-bucket work. Totalling dicts that
+are already in memory is cheaper in one process than pickling them to another, so the
+real win is summarize_archives(), where each worker maps its own slice of an archive.
+"""
+
+import math
+from concurrent.futures import ProcessPoolExecutor
+from typing import Union, Sequence, Mapping, MutableMapping, Iterable, Tuple
+
+from unifierlib.utility import WAN_TX_KEY, WAN_RX_KEY, TIME_KEY
+from unifierlib.archive import StatArchive
+
+DEFAULT_ATTRIBUTES = (WAN_TX_KEY, WAN_RX_KEY)
+# Buckets handed to a worker at a time, about a month of 5-minute stats
+PARTITION_SIZE = 8640
+# Relative accuracy of the percentile sketch
+SKETCH_ACCURACY = 0.01
+
+class PercentileSketch:
+    """Log-bucketed histogram giving quantiles within a relative accuracy.
+
+    Values are counted in buckets whose bounds grow geometrically, so two sketches with
+    the same accuracy merge by adding their bucket counts.
+    """
+    __slots__ = ("accuracy", "_gamma_log", "_buckets", "_zeros", "count")
+
+    def __init__(self, accuracy: float = SKETCH_ACCURACY):
+        self.accuracy = accuracy
+        self._gamma_log = math.log((1 + accuracy) / (1 - accuracy))
+        self._buckets = {}
+        self._zeros = 0
+        self.count = 0
+
+    def add(self, value: float):
+        """Counts one value, values at or below zero share one bucket"""
+        self.count += 1
+        if value <= 0:
+            self._zeros += 1
+            return
+        key = math.ceil(math.log(value) / self._gamma_log)
+        self._buckets[key] = self._buckets.get(key, 0) + 1
+
+    def merge(self, other: "PercentileSketch"):
+        """Adds the counts of another sketch of the same accuracy"""
+        if other.accuracy != self.accuracy:
+            raise ValueError("Cannot merge sketches of different accuracy")
+        # pylint: disable=protected-access
+        for key, count in other._buckets.items():
+            self._buckets[key] = self._buckets.get(key, 0) + count
+        self._zeros += other._zeros
+        self.count += other.count
+
+    def quantile(self, fraction: float) -> Union[float, None]:
+        """The value at fraction (0 to 1) of the way through the counted values"""
+        if not self.count:
+            return None
+        rank = fraction * (self.count - 1)
+        seen = self._zeros
+        if rank < seen:
+            return 0.0
+        for key in sorted(self._buckets):
+            seen += self._buckets[key]
+            if rank < seen:
+                # Midpoint of the bucket, in relative terms
+                return 2 * math.exp(key * self._gamma_log) / (1 + math.exp(self._gamma_log))
+        return math.exp(max(self._buckets) * self._gamma_log)
+
+    def __getstate__(self):
+        return (self.accuracy, self._buckets, self._zeros, self.count)
+
+    def __setstate__(self, state):
+        accuracy, buckets, zeros, count = state
+        self.__init__(accuracy)
+        self._buckets = buckets
+        self._zeros = zeros
+        self.count = count
+
+class StatAggregate:
+    """Sums, counts, min/max and percentiles of a set of stat buckets"""
+    def __init__(self,
+                 attributes: Sequence[str] = DEFAULT_ATTRIBUTES,
+                 percentiles: bool = True):
+        """Percentile sketches cost a log per value, leave them off for plain totals"""
+        self.attributes = tuple(attributes)
+        self.count = 0
+        self.start = None
+        self.end = None
+        self.sums = {attr: 0 for attr in self.attributes}
+        self.minimums = {attr: None for attr in self.attributes}
+        self.maximums = {attr: None for attr in self.attributes}
+        self.sketches = {}
+        if percentiles:
+            self.sketches = {attr: PercentileSketch() for attr in self.attributes}
+
+    def add_columns(self, times: Sequence[float], columns: Mapping[str, Sequence[float]]):
+        """Adds buckets given column-wise, one sequence of values per attribute"""
+        if not times:
+            return
+        self.count += len(times)
+        first = min(times)
+        last = max(times)
+        self.start = first if self.start is None else min(self.start, first)
+        self.end = last if self.end is None else max(self.end, last)
+        for attr in self.attributes:
+            values = columns[attr]
+            self.sums[attr] += sum(values)
+            low = min(values)
+            high = max(values)
+            minimum = self.minimums[attr]
+            maximum = self.maximums[attr]
+            self.minimums[attr] = low if minimum is None else min(minimum, low)
+            self.maximums[attr] = high if maximum is None else max(maximum, high)
+            sketch = self.sketches.get(attr)
+            if sketch is not None:
+                for value in values:
+                    sketch.add(value)
+
+    def add(self, stats: Iterable[MutableMapping]):
+        """Adds buckets given as the dicts the Controller returns"""
+        times, columns = to_columns(stats, self.attributes)
+        self.add_columns(times, columns)
+
+    def merge(self, other: "StatAggregate") -> "StatAggregate":
+        """Folds another aggregate over the same attributes into this one"""
+        if other.attributes != self.attributes:
+            raise ValueError("Cannot merge aggregates of different attributes")
+        if other.sketches.keys() != self.sketches.keys():
+            raise ValueError("Cannot merge aggregates with and without percentiles")
+        if not other.count:
+            return self
+        self.count += other.count
+        self.start = other.start if self.start is None else min(self.start, other.start)
+        self.end = other.end if self.end is None else max(self.end, other.end)
+        for attr in self.attributes:
+            self.sums[attr] += other.sums[attr]
+            for mine, theirs, pick in ((self.minimums, other.minimums, min),
+                                       (self.maximums, other.maximums, max)):
+                if mine[attr] is None:
+                    mine[attr] = theirs[attr]
+                elif theirs[attr] is not None:
+                    mine[attr] = pick(mine[attr], theirs[attr])
+            if attr in self.sketches:
+                self.sketches[attr].merge(other.sketches[attr])
+        return self
+
+    def percentile(self, attribute: str, fraction: float) -> Union[float, None]:
+        """Approximate percentile (0 to 1) of an attribute's bucket values"""
+        if attribute not in self.sketches:
+            raise ValueError("This aggregate was made without percentiles")
+        return self.sketches[attribute].quantile(fraction)
+
+def to_columns(stats: Iterable[MutableMapping],
+               attributes: Sequence[str] = DEFAULT_ATTRIBUTES) -> Tuple[list, dict]:
+    """Splits bucket dicts into a time column and one column per attribute"""
+    stats = list(stats)
+    times = [stat_entry[TIME_KEY] for stat_entry in stats]
+    columns = {attr: [stat_entry.get(attr) or 0 for stat_entry in stats]
+               for attr in attributes}
+    return times, columns
+
+def _check_workers(workers: Union[int, None]):
+    if workers is not None and workers < 1:
+        raise ValueError("workers must be at least 1")
+
+def _aggregate_partition(task) -> Tuple[str, StatAggregate]:
+    """Worker entry point, must be module level so it can be pickled"""
+    site, attributes, percentiles, stats = task
+    aggregate = StatAggregate(attributes, percentiles=percentiles)
+    aggregate.add(stats)
+    return site, aggregate
+
+def summarize_parallel(series_by_site: Mapping[str, Sequence[MutableMapping]],
+                       attributes: Sequence[str] = DEFAULT_ATTRIBUTES,
+                       workers: Union[int, None] = None,
+                       partition_size: int = PARTITION_SIZE,
+                       percentiles: bool = True) -> MutableMapping:
+    """Aggregates many sites' series across a process pool.
+
+    Each site's series is split into time-ordered slices of partition_size buckets
+    which the workers reduce independently; they are merged back per site. With
+    workers of 1 the work is done in this process, None uses every CPU. Returns a dict
+    of site name to StatAggregate.
+    """
+    _check_workers(workers)
+    attributes = tuple(attributes)
+    results = {site: StatAggregate(attributes, percentiles) for site in series_by_site}
+    tasks = ((site, attributes, percentiles, stats[offset:offset + partition_size])
+             for site, stats in series_by_site.items()
+             for offset in range(0, len(stats), partition_size))
+
+    def fold(partials):
+        for site, partial in partials:
+            results[site].merge(partial)
+
+    if workers == 1:
+        fold(map(_aggregate_partition, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            fold(executor.map(_aggregate_partition, tasks))
+    return results
+
+def _aggregate_archive_rows(task) -> Tuple[str, StatAggregate]:
+    """Worker entry point reducing rows lower to upper of one archive"""
+    path, attributes, percentiles, lower, upper = task
+    aggregate = StatAggregate(attributes, percentiles=percentiles)
+    with StatArchive(path) as archive:
+        site = archive.site
+        # Zero-copy views straight onto this worker's own map of the file
+        times = archive.column(TIME_KEY)[lower:upper]
+        columns = {attr: archive.column(attr)[lower:upper] for attr in attributes}
+        aggregate.add_columns(times, columns)
+        times.release()
+        for column in columns.values():
+            column.release()
+    return site, aggregate
+
+def summarize_archives(paths: Iterable[str],
+                       attributes: Sequence[str] = DEFAULT_ATTRIBUTES,
+                       workers: Union[int, None] = None,
+                       partition_size: int = PARTITION_SIZE,
+                       percentiles: bool = True) -> MutableMapping:
+    """Aggregates archives across a process pool, splitting each into row ranges.
+
+    Only paths and row numbers cross the process boundary; every worker maps the file
+    and reads its rows itself. Returns a dict of site name to StatAggregate, archives
+    of the same site are merged.
+    """
+    _check_workers(workers)
+    attributes = tuple(attributes)
+    tasks = []
+    for path in paths:
+        with StatArchive(path) as archive:
+            count = len(archive)
+        for lower in range(0, count, partition_size):
+            tasks.append((path, attributes, percentiles, lower, lower + partition_size))
+
+    results = {}
+    def fold(partials):
+        for site, partial in partials:
+            results.setdefault(site, StatAggregate(attributes, percentiles)).merge(partial)
+
+    if workers == 1:
+        fold(map(_aggregate_archive_rows, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            fold(executor.map(_aggregate_archive_rows, tasks))
+    return results
+
+def combine(aggregates: Iterable[StatAggregate],
+            attributes: Sequence[str] = DEFAULT_ATTRIBUTES,
+            percentiles: bool = True) -> StatAggregate:
+    """Merges aggregates, for example every site's, into one"""
+    total = StatAggregate(attributes, percentiles)
+    for aggregate in aggregates:
+        total.merge(aggregate)
+    return total
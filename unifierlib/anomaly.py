@@ -0,0 +1,191 @@
+"""Incremental detection of unusual WAN traffic per site
+
+Each site keeps an exponentially weighted mean and variance of its hourly WAN
+tx and rx for each of the 168 hours of the week, on the site's wall clock. A new
+hourly bucket is scored against its hour's baseline and then folded into it, so
+an update is O(1) and no history is ever read twice. Buckets at or before the
+last one a site has seen are skipped, which lets a poller hand over overlapping
+windows. The state of every site fits in one JSON file, saved between runs:
+
+    detector = AnomalyDetector.load("baselines.json")
+    for anomaly in detect(controller, detector):
+        print(anomaly)
+    detector.save("baselines.json")
+"""
+
+import json
+import math
+import os
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Union, Iterable, MutableMapping, Sequence, List
+
+from unifierlib.utility import WAN_TX_KEY, WAN_RX_KEY, TIME_KEY
+from unifierlib.windows import to_local, TimeZone, HOUR
+
+VERSION = 1
+HOURS_PER_WEEK = 168
+METRICS = {"tx": WAN_TX_KEY, "rx": WAN_RX_KEY}
+# Weight of each new bucket; 0.1 remembers roughly the last ten weeks of an hour
+ALPHA = 0.1
+# Standard deviations from the mean that count as unusual
+THRESHOLD = 4.0
+# Buckets an hour of the week needs before it is scored
+WARMUP = 3
+MAX_WORKERS = 4
+
+def hour_of_week(stat_time: float, tz: TimeZone = None) -> int:
+    """0 for Monday 00:00 to 167 for Sunday 23:00 on the wall clock of tz"""
+    local = to_local(stat_time, tz)
+    return local.weekday() * 24 + local.hour
+
+class SiteBaseline:
+    """The per hour of week mean and variance of one site's WAN traffic"""
+    __slots__ = ("last_time", "counts", "means", "variances")
+
+    def __init__(self, last_time: Union[float, None] = None, counts=None, means=None,
+                 variances=None):
+        self.last_time = last_time
+        self.counts = array("l", counts or [0] * HOURS_PER_WEEK)
+        self.means = {metric: array("d", (means or {}).get(metric) or [0.0] * HOURS_PER_WEEK)
+                      for metric in METRICS}
+        self.variances = {metric: array("d", (variances or {}).get(metric)
+                                        or [0.0] * HOURS_PER_WEEK)
+                          for metric in METRICS}
+
+    def to_json(self) -> dict:
+        """The baseline as plain lists"""
+        return {"last_time": self.last_time,
+                "counts": list(self.counts),
+                "means": {metric: list(values) for metric, values in self.means.items()},
+                "variances": {metric: list(values)
+                              for metric, values in self.variances.items()}}
+
+    @classmethod
+    def from_json(cls, state: MutableMapping) -> "SiteBaseline":
+        """A baseline saved by to_json"""
+        return cls(state.get("last_time"), state.get("counts"), state.get("means"),
+                   state.get("variances"))
+
+class AnomalyDetector:
+    """Scores hourly WAN buckets against each site's baseline and learns from them"""
+    def __init__(self, alpha: float = ALPHA, threshold: float = THRESHOLD,
+                 warmup: int = WARMUP):
+        if not 0 < alpha <= 1:
+            raise ValueError(f"alpha must be in (0, 1], got {alpha}")
+        self.alpha = alpha
+        self.threshold = threshold
+        self.warmup = warmup
+        self.baselines = {}
+
+    def __len__(self):
+        return len(self.baselines)
+
+    def update(self, site: str, stats: Iterable[MutableMapping],
+               tz: TimeZone = None) -> List[SimpleNamespace]:
+        """Folds in the site's buckets after the last one seen, oldest first.
+
+        Returns the anomalies among them, each with the site, time, metric, value,
+        the expected value and the score in standard deviations.
+        """
+        baseline = self.baselines.get(site)
+        if baseline is None:
+            baseline = self.baselines[site] = SiteBaseline()
+        anomalies = []
+        fresh = [entry for entry in stats or []
+                 if baseline.last_time is None or entry[TIME_KEY] > baseline.last_time]
+        fresh.sort(key=lambda entry: entry[TIME_KEY])
+        alpha = self.alpha
+        for entry in fresh:
+            stat_time = entry[TIME_KEY]
+            hour = hour_of_week(stat_time, tz)
+            count = baseline.counts[hour]
+            for metric, key in METRICS.items():
+                value = entry.get(key)
+                if value is None:
+                    continue
+                means, variances = baseline.means[metric], baseline.variances[metric]
+                if count == 0:
+                    means[hour] = value
+                    continue
+                mean = means[hour]
+                deviation = value - mean
+                spread = math.sqrt(variances[hour])
+                if count >= self.warmup and spread > 0:
+                    score = deviation / spread
+                    if abs(score) >= self.threshold:
+                        anomalies.append(SimpleNamespace(site=site, time=stat_time,
+                                                         metric=metric, value=value,
+                                                         expected=mean, score=score))
+                means[hour] = mean + alpha * deviation
+                variances[hour] = (1 - alpha) * (variances[hour] + alpha * deviation ** 2)
+            baseline.counts[hour] = count + 1
+            baseline.last_time = stat_time
+        return anomalies
+
+    def to_json(self) -> dict:
+        """The detector's settings and every site's baseline"""
+        return {"version": VERSION,
+                "alpha": self.alpha,
+                "threshold": self.threshold,
+                "warmup": self.warmup,
+                "sites": {site: baseline.to_json()
+                          for site, baseline in self.baselines.items()}}
+
+    @classmethod
+    def load(cls, path: str, **settings) -> "AnomalyDetector":
+        """Reads saved baselines, a fresh detector when there is no file yet.
+
+        settings given here override the saved ones.
+        """
+        if not os.path.exists(path):
+            return cls(**settings)
+        with open(path, encoding="utf-8") as state_file:
+            state = json.load(state_file)
+        if state.get("version") != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} baseline file")
+        for name in ("alpha", "threshold", "warmup"):
+            settings.setdefault(name, state[name])
+        detector = cls(**settings)
+        detector.baselines = {site: SiteBaseline.from_json(baseline)
+                              for site, baseline in (state.get("sites") or {}).items()}
+        return detector
+
+    def save(self, path: str):
+        """Writes the baselines, replacing the old file in a single step"""
+        temporary = f"{path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as state_file:
+            json.dump(self.to_json(), state_file, separators=(",", ":"))
+        os.replace(temporary, path)
+
+def detect(controller,
+           detector: AnomalyDetector,
+           sites: Union[Sequence[str], None] = None,
+           max_workers: int = MAX_WORKERS) -> List[SimpleNamespace]:
+    """Fetches each site's default hourly window and feeds it to the detector.
+
+    sites defaults to every site on the controller. The hour still in progress is
+    left for the next run, and sites whose stats can't be fetched are left as they
+    were. Returns the anomalies found, oldest first.
+    """
+    if sites is None:
+        known = controller.site_info_simplified()
+        if not isinstance(known, MutableMapping) or "meta" in known:
+            return []
+        sites = list(known)
+
+    def fetch(site):
+        site_controller = controller.for_site(site)
+        return site, site_controller.get_hourly_stats(), site_controller.timezone
+
+    anomalies = []
+    now = time.time()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for site, stats, tz in executor.map(fetch, sites):
+            if stats is not None:
+                complete = [entry for entry in stats if entry[TIME_KEY] + HOUR <= now]
+                anomalies.extend(detector.update(site, complete, tz))
+    anomalies.sort(key=lambda anomaly: (anomaly.time, anomaly.site))
+    return anomalies
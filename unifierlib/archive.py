@@ -0,0 +1,262 @@
+"""Fixed-width binary archive for time-bucketed stats
+
+An archive holds one site at one granularity. The file starts with a small header
+describing the site, the bucket interval and the column names, followed by
+fixed-width records of little-endian int64 values, one per column. The first
+column is always "time" (seconds since the Epoch) and records are kept sorted
+by time, so the record count and the time index fall out of the file size.
+
+Records are only ever appended, and reads are served from a read-only memory map
+so ranges can be located with a binary search and sliced without copying.
+"""
+
+import bisect
+import mmap
+import os
+import struct
+import sys
+from array import array
+from typing import Union, Iterable, MutableMapping
+
+from unifierlib.utility import TIME_KEY, WAN_TX_KEY, WAN_RX_KEY
+from unifierlib.series import StatSeries
+
+MAGIC = b"UNFA"
+VERSION = 1
+
+# magic, version, column count, header length, bucket interval in seconds
+_PREAMBLE = struct.Struct("<4sHHII")
+_NAME_LEN = struct.Struct("<H")
+_ITEM = struct.Struct("<q")
+
+DEFAULT_ATTRIBUTES = [WAN_TX_KEY, WAN_RX_KEY]
+
+class ArchiveError(Exception):
+    """Raised when an archive is missing, malformed or mismatched"""
+
+def _pack_name(name: str) -> bytes:
+    raw = name.encode("utf-8")
+    return _NAME_LEN.pack(len(raw)) + raw
+
+def _unpack_name(buf: bytes, offset: int):
+    (length,) = _NAME_LEN.unpack_from(buf, offset)
+    offset += _NAME_LEN.size
+    return buf[offset:offset + length].decode("utf-8"), offset + length
+
+class StatArchive:
+    """Append-only, memory-mappable archive of stats for one site and granularity"""
+    def __init__(self,
+                 path: str,
+                 site: str = None,
+                 interval: int = None,
+                 stat_attributes: list = None):
+        """Opens the archive at path, creating it when site and interval are given"""
+        self._path = path
+        self._file = None
+        self._map = None
+        self._mapped_size = 0
+
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            self._read_header()
+            if site is not None and site != self._site:
+                raise ArchiveError(f"{path} holds site '{self._site}', not '{site}'")
+            if interval is not None and interval != self._interval:
+                raise ArchiveError(f"{path} holds {self._interval}s buckets, not {interval}s")
+        else:
+            if site is None or interval is None:
+                raise ArchiveError(f"{path} does not exist and no site/interval was given")
+            attributes = [attr for attr in (stat_attributes or DEFAULT_ATTRIBUTES)
+                          if attr != TIME_KEY]
+            self._site = site
+            self._interval = int(interval)
+            self._columns = [TIME_KEY] + attributes
+            self._write_header()
+
+        self._width = len(self._columns)
+        self._record_size = self._width * _ITEM.size
+
+    def _write_header(self):
+        body = _pack_name(self._site)
+        for column in self._columns:
+            body += _pack_name(column)
+        header_size = _PREAMBLE.size + len(body)
+        # Pad so the records start on an 8 byte boundary
+        padding = -header_size % _ITEM.size
+        header_size += padding
+        preamble = _PREAMBLE.pack(MAGIC,
+                                  VERSION,
+                                  len(self._columns),
+                                  header_size,
+                                  self._interval)
+        with open(self._path, "wb") as archive_file:
+            archive_file.write(preamble + body + b"\0" * padding)
+        self._header_size = header_size
+
+    def _read_header(self):
+        with open(self._path, "rb") as archive_file:
+            preamble = archive_file.read(_PREAMBLE.size)
+            if len(preamble) < _PREAMBLE.size:
+                raise ArchiveError(f"{self._path} is truncated")
+            magic, version, width, header_size, interval = _PREAMBLE.unpack(preamble)
+            if magic != MAGIC:
+                raise ArchiveError(f"{self._path} is not a stats archive")
+            if version != VERSION:
+                raise ArchiveError(f"{self._path} is version {version}, expected {VERSION}")
+            body = archive_file.read(header_size - _PREAMBLE.size)
+
+        site, offset = _unpack_name(body, 0)
+        columns = []
+        for _ in range(width):
+            column, offset = _unpack_name(body, offset)
+            columns.append(column)
+
+        self._site = site
+        self._interval = interval
+        self._columns = columns
+        self._header_size = header_size
+
+    @property
+    def path(self):
+        """The path of the archive file"""
+        return self._path
+
+    @property
+    def site(self):
+        """The site the archive holds stats for"""
+        return self._site
+
+    @property
+    def interval(self):
+        """The bucket interval of the archive in seconds"""
+        return self._interval
+
+    @property
+    def columns(self):
+        """The column names, "time" first"""
+        return list(self._columns)
+
+    def __len__(self):
+        """Number of complete records in the archive"""
+        size = os.path.getsize(self._path) - self._header_size
+        return max(size, 0) // self._record_size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Releases the memory map.
+
+        A map with column() views still held is left to be freed along with the last
+        of them, so holding a view never stops the archive being closed or remapped.
+        """
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                # The outstanding views keep the old map alive until they are released
+                pass
+            self._map = None
+            self._mapped_size = 0
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _values(self) -> Union[memoryview, array, None]:
+        """A flat view over every value in the archive, mapping the file if needed"""
+        count = len(self)
+        if not count:
+            return None
+        size = self._header_size + count * self._record_size
+        if self._map is None or self._mapped_size != size:
+            self.close()
+            self._file = open(self._path, "rb")
+            self._map = mmap.mmap(self._file.fileno(), size, access=mmap.ACCESS_READ)
+            self._mapped_size = size
+        values = memoryview(self._map)[self._header_size:size].cast("q")
+        if sys.byteorder != "little":
+            # The file is little-endian; big-endian hosts pay for a copy
+            swapped = array("q", values)
+            values.release()
+            swapped.byteswap()
+            return swapped
+        return values
+
+    def last_time(self) -> Union[int, None]:
+        """The time of the newest record, or None for an empty archive"""
+        count = len(self)
+        if not count:
+            return None
+        with open(self._path, "rb") as archive_file:
+            archive_file.seek(self._header_size + (count - 1) * self._record_size)
+            (last,) = _ITEM.unpack(archive_file.read(_ITEM.size))
+        return last
+
+    def append(self, stats: Iterable[MutableMapping]) -> int:
+        """Appends stats newer than the last record, returns the number written.
+
+        Stats must be time-sorted, as returned by the Controller. Buckets at or before
+        the last archived time are skipped so re-appending an overlapping window is safe.
+        Missing attributes are stored as 0.
+        """
+        last = self.last_time()
+        record = struct.Struct(f"<{self._width}q")
+        attributes = self._columns[1:]
+        chunks = []
+        for stat_entry in stats:
+            stat_t = int(stat_entry[TIME_KEY])
+            if last is not None and stat_t <= last:
+                continue
+            values = [int(round(stat_entry.get(attr) or 0)) for attr in attributes]
+            chunks.append(record.pack(stat_t, *values))
+            last = stat_t
+
+        if chunks:
+            with open(self._path, "ab") as archive_file:
+                archive_file.write(b"".join(chunks))
+        return len(chunks)
+
+    def _bounds(self, times, start, end):
+        lower = 0 if start is None else bisect.bisect_left(times, start)
+        upper = len(times) if end is None else bisect.bisect_left(times, end)
+        return lower, upper
+
+    def column(self,
+               attribute: str,
+               start: Union[float, None] = None,
+               end: Union[float, None] = None) -> Union[memoryview, array]:
+        """A zero-copy view of one column for start <= time < end"""
+        try:
+            index = self._columns.index(attribute)
+        except ValueError:
+            raise ArchiveError(f"{self._path} has no column '{attribute}'") from None
+        values = self._values()
+        if values is None:
+            return memoryview(array("q"))
+        times = values[0::self._width]
+        lower, upper = self._bounds(times, start, end)
+        return values[index::self._width][lower:upper]
+
+    def read(self,
+             start: Union[float, None] = None,
+             end: Union[float, None] = None) -> StatSeries:
+        """Returns the stats for start <= time < end as a StatSeries"""
+        values = self._values()
+        if values is None:
+            return StatSeries()
+        width = self._width
+        columns = self._columns
+        times = values[0::width]
+        lower, upper = self._bounds(times, start, end)
+        flat = values[lower * width:upper * width].tolist()
+        return StatSeries(dict(zip(columns, flat[offset:offset + width]))
+                          for offset in range(0, len(flat), width))
+
+def read_archive(path: str,
+                 start: Union[float, None] = None,
+                 end: Union[float, None] = None) -> StatSeries:
+    """Convenience function to read a range of stats out of an archive"""
+    with StatArchive(path) as archive:
+        return archive.read(start, end)
@@ -0,0 +1,137 @@
+"""Gap detection and targeted backfill of stat series"""
+
+import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from types import SimpleNamespace
+from typing import Union, List, Tuple
+
+from unifierlib.controller import Controller, STAT_INTERVALS, DAILY_STAT_URL
+from unifierlib.series import StatSeries
+from unifierlib.windows import bucket_boundaries, midnight, to_local, TimeZone
+
+# A day of 5-minute buckets, about what the controller answers comfortably in one go
+MAX_BUCKETS_PER_REQUEST = 288
+# Holes this many buckets apart or closer are fetched in a single request
+JOIN_BUCKETS = 12
+MAX_WORKERS = 4
+
+Range = Tuple[float, float]
+
+def plan_requests(gaps: List[Range],
+                  interval: float,
+                  max_buckets: int = MAX_BUCKETS_PER_REQUEST,
+                  join_buckets: int = JOIN_BUCKETS) -> List[Range]:
+    """Turns gaps into the windows to request.
+
+    Nearby gaps are joined when refetching the few present buckets between them is
+    cheaper than another request, and long gaps are split so no single request spans
+    more than max_buckets.
+    """
+    max_span = max_buckets * interval
+    joined = []
+    for gap_start, gap_end in sorted(gaps):
+        if joined:
+            last_start, last_end = joined[-1]
+            if (gap_start - last_end <= join_buckets * interval
+                    and gap_end - last_start <= max_span):
+                joined[-1] = (last_start, max(last_end, gap_end))
+                continue
+        joined.append((gap_start, gap_end))
+
+    windows = []
+    for gap_start, gap_end in joined:
+        window_start = gap_start
+        while window_start < gap_end:
+            window_end = min(window_start + max_span, gap_end)
+            windows.append((window_start, window_end))
+            window_start = window_end
+    return windows
+
+def expected_times(granularity: str,
+                   start: float,
+                   end: float,
+                   tz: TimeZone = None) -> List[float]:
+    """The bucket times the controller should report for start <= time < end.
+
+    Daily buckets sit on the site's local midnights, so days across a DST change are
+    23 or 25 hours long; the other reports are a fixed cadence.
+    """
+    return bucket_boundaries(STAT_INTERVALS[granularity], start, end, tz)
+
+def find_gaps(series: StatSeries, expected: List[float], end: float) -> List[Range]:
+    """Runs of expected times missing from series as (first_missing, next_expected)"""
+    gaps = []
+    run_start = None
+    for stat_time in expected:
+        present = series.get(stat_time) is not None
+        if present and run_start is not None:
+            gaps.append((run_start, stat_time))
+            run_start = None
+        elif not present and run_start is None:
+            run_start = stat_time
+    if run_start is not None:
+        gaps.append((run_start, end))
+    return gaps
+
+def backfill(controller: Controller,
+             series: StatSeries,
+             granularity: str,
+             start: Union[float, None] = None,
+             end: Union[float, None] = None,
+             stat_attributes: list = None,
+             max_workers: int = MAX_WORKERS,
+             max_buckets: int = MAX_BUCKETS_PER_REQUEST) -> SimpleNamespace:
+    """Fills missing buckets of series in place by re-requesting only the holes.
+
+    Times are in seconds, end is exclusive and both default to the span of the series.
+    Returns a report with the windows requested, the number of buckets recovered and
+    the gaps that are still missing afterwards.
+    """
+    interval = STAT_INTERVALS[granularity]
+    timezone = controller.timezone
+    if start is None:
+        start = series.start
+    if end is None and series.end is not None:
+        if granularity == DAILY_STAT_URL:
+            next_day = to_local(series.end, timezone).date() + datetime.timedelta(1)
+            end = midnight(next_day, timezone)
+        else:
+            end = series.end + interval
+
+    report = SimpleNamespace(requested=[], recovered=0, failed=[], unrecoverable=[])
+    if start is None or end is None:
+        return report
+
+    expected = expected_times(granularity, start, end, timezone)
+    gaps = find_gaps(series, expected, end)
+    if not gaps:
+        return report
+
+    windows = plan_requests(gaps, interval, max_buckets=max_buckets)
+    report.requested = windows
+
+    def fetch(window):
+        window_start, window_end = window
+        # _get_stats appends "time" to the attributes, so give each request its own list
+        attributes = list(stat_attributes) if stat_attributes else None
+        # The controller's end is inclusive, stop just short of the next window
+        return controller.get_stats(granularity,
+                                    window_start,
+                                    window_end - 1,
+                                    stat_attributes=attributes)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(fetch, window): window for window in windows}
+        for future in as_completed(futures):
+            try:
+                fetched = future.result()
+            except Exception: # pylint: disable=broad-except
+                fetched = None
+            if fetched is None:
+                report.failed.append(futures[future])
+                continue
+            report.recovered += series.merge(fetched.between(start, end))
+
+    report.failed.sort()
+    report.unrecoverable = find_gaps(series, expected, end)
+    return report
@@ -0,0 +1,145 @@
+"""Connected-client inventory and the changes between polls
+
+`stat/sta` answers with a dict of some fifty keys per connected client. A poll
+keeps only what the diff needs in a Client, a `__slots__` record with the strings
+the clients share (access point and switch MACs, SSIDs) interned, so a snapshot of
+thousands of clients costs a fraction of the decoded answer. Successive snapshots
+are compared on their MAC key sets: joins and leaves are set differences, and only
+the clients present in both are checked for a roam to another uplink.
+
+    inventory = ClientInventory(controller, callback=print)
+    while True:
+        inventory.poll()
+        time.sleep(60)
+"""
+
+import sys
+import threading
+import time
+from types import SimpleNamespace
+from typing import Union, Callable, Iterable, MutableMapping, List, Tuple
+
+class Client:
+    """What a snapshot keeps of one connected client"""
+    __slots__ = ("mac", "ip", "hostname", "uplink", "tx_bytes", "rx_bytes", "last_seen")
+
+    def __init__(self, mac, ip, hostname, uplink, tx_bytes, rx_bytes, last_seen):
+        # pylint: disable=too-many-arguments
+        self.mac = mac
+        self.ip = ip
+        self.hostname = hostname
+        self.uplink = uplink
+        self.tx_bytes = tx_bytes
+        self.rx_bytes = rx_bytes
+        self.last_seen = last_seen
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.mac!r}, {self.hostname!r}, {self.uplink!r})"
+
+    @classmethod
+    def from_record(cls, record: MutableMapping) -> "Client":
+        """Keeps the fields of one stat/sta record"""
+        if record.get("is_wired"):
+            uplink = (_intern(record.get("sw_mac")), record.get("sw_port"))
+        else:
+            uplink = (_intern(record.get("ap_mac")), _intern(record.get("essid")))
+        return cls(record["mac"].lower(),
+                   record.get("ip"),
+                   record.get("hostname") or record.get("name"),
+                   uplink,
+                   record.get("tx_bytes") or 0,
+                   record.get("rx_bytes") or 0,
+                   record.get("last_seen"))
+
+def _intern(value: Union[str, None]) -> Union[str, None]:
+    return sys.intern(value) if isinstance(value, str) else value
+
+class ClientSnapshot:
+    """The clients connected at one poll, keyed by MAC"""
+    __slots__ = ("clients", "taken")
+
+    def __init__(self, clients: Union[MutableMapping, None] = None,
+                 taken: Union[float, None] = None):
+        self.clients = clients if clients is not None else {}
+        self.taken = taken
+
+    def __len__(self):
+        return len(self.clients)
+
+    def __contains__(self, mac: str):
+        return mac.lower() in self.clients
+
+    @classmethod
+    def from_data(cls, data: Iterable[MutableMapping],
+                  taken: Union[float, None] = None) -> "ClientSnapshot":
+        """A snapshot of Controller.get_clients' answer, skipping records without a MAC"""
+        clients = {}
+        for record in data or []:
+            if record.get("mac"):
+                client = Client.from_record(record)
+                clients[client.mac] = client
+        return cls(clients, taken)
+
+def diff(previous: ClientSnapshot, current: ClientSnapshot) -> SimpleNamespace:
+    """The clients that joined, left and roamed between two snapshots.
+
+    joined and left are lists of Client, roamed a list of (before, after) pairs.
+    """
+    before, after = previous.clients, current.clients
+    joined: List[Client] = [after[mac] for mac in after.keys() - before.keys()]
+    left: List[Client] = [before[mac] for mac in before.keys() - after.keys()]
+    roamed: List[Tuple[Client, Client]] = []
+    for mac in after.keys() & before.keys():
+        old, new = before[mac], after[mac]
+        if old.uplink != new.uplink:
+            roamed.append((old, new))
+    return SimpleNamespace(joined=joined, left=left, roamed=roamed, taken=current.taken)
+
+def is_empty(delta: SimpleNamespace) -> bool:
+    """Whether a diff found no change"""
+    return not (delta.joined or delta.left or delta.roamed)
+
+class ClientInventory:
+    """Polls a site's clients and hands on only what changed since the last poll.
+
+    The first poll reports every connected client as joined. callback, when given,
+    is called with each delta that isn't empty.
+    """
+    def __init__(self, controller, callback: Union[Callable, None] = None):
+        self._controller = controller
+        self._callback = callback
+        self._snapshot = ClientSnapshot()
+        self._lock = threading.Lock()
+        self._metrics = SimpleNamespace(polls=0, failures=0, joined=0, left=0, roamed=0)
+
+    @property
+    def snapshot(self) -> ClientSnapshot:
+        """The clients connected at the last successful poll"""
+        with self._lock:
+            return self._snapshot
+
+    @property
+    def metrics(self):
+        """Polls made and failed, and the joins, leaves and roams seen"""
+        with self._lock:
+            return SimpleNamespace(**vars(self._metrics), clients=len(self._snapshot))
+
+    def poll(self) -> Union[SimpleNamespace, None]:
+        """Fetches the clients and returns the delta, None when the fetch failed"""
+        data = self._controller.get_clients()
+        if data is None:
+            with self._lock:
+                self._metrics.polls += 1
+                self._metrics.failures += 1
+            return None
+        current = ClientSnapshot.from_data(data, time.time())
+        with self._lock:
+            delta = diff(self._snapshot, current)
+            self._snapshot = current
+            self._metrics.polls += 1
+            self._metrics.joined += len(delta.joined)
+            self._metrics.left += len(delta.left)
+            self._metrics.roamed += len(delta.roamed)
+        if self._callback is not None and not is_empty(delta):
+            self._callback(delta)
+        return delta
@@ -1,42 +1,155 @@
 """Controller Interface Class"""
 
-import time
-import datetime
+import copy
 import json
-from typing import Union, Any, MutableSequence, MutableMapping
+import time
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Union, Any, MutableSequence, MutableMapping, Iterator
 from types import SimpleNamespace
 import requests
+from requests.adapters import HTTPAdapter, BaseAdapter
 import urllib3
 
 from unifierlib.utility import reorganize_site_data
+from unifierlib.series import StatSeries
+from unifierlib.singleflight import SingleFlight
+from unifierlib.throttle import Throttle
+from unifierlib.profiling import phase
+from unifierlib.logs import LogCursor
+from unifierlib.windows import default_window, get_timezone, WindowError, TimeZone
 
 MAX_ERRORS = 1000
+# Connections kept alive to the controller, also the most requests in flight at once
+DEFAULT_POOL_SIZE = 10
+# Buckets asked for per page when iterating over long windows, a day of 5-minute stats
+PAGE_BUCKETS = 288
+# Event and alarm records asked for per page, and how far back a first read goes
+LOG_PAGE_SIZE = 3000
+LOG_WITHIN_HOURS = 24 * 30
+# Per-request transfer metrics kept, and bytes of response bodies kept for
+# conditional requests
+MAX_REQUEST_METRICS = 1000
+MAX_VALIDATED_BYTES = 32 * 1024 * 1024
+
+try:
+    import brotli # pylint: disable=unused-import
+    HAVE_BROTLI = True
+except ImportError:
+    try:
+        import brotlicffi # pylint: disable=unused-import
+        HAVE_BROTLI = True
+    except ImportError:
+        HAVE_BROTLI = False
+
+# urllib3 decodes each of these transparently, brotli only when a decoder is installed
+ACCEPT_ENCODING = "gzip, deflate, br" if HAVE_BROTLI else "gzip, deflate"
 
 DAILY_STAT_URL = "daily"
 HOURLY_STAT_URL = "hourly"
 MINUTELY_STAT_URL = "minutely"
 SITE_STATS_SIMPLE_URL = "site_stats_simple"
 SITE_STATS_DETAIL_URL = "site_stats_detailed"
+SYSINFO_URL = "sysinfo"
+SETTINGS_URL = "setting"
+EVENT_URL = "event"
+ALARM_URL = "alarm"
+SITE_DPI_URL = "sitedpi"
+CLIENT_DPI_URL = "stadpi"
+CLIENTS_URL = "sta"
 
 URL_SEGMENTS = {
     SITE_STATS_SIMPLE_URL: 'api/self/sites',
     SITE_STATS_DETAIL_URL: 'api/stat/sites',
     DAILY_STAT_URL: 'stat/report/daily.site',
     HOURLY_STAT_URL: 'stat/report/hourly.site',
-    MINUTELY_STAT_URL: 'stat/report/5minutes.site'
+    MINUTELY_STAT_URL: 'stat/report/5minutes.site',
+    SYSINFO_URL: 'stat/sysinfo',
+    SETTINGS_URL: 'get/setting',
+    EVENT_URL: 'stat/event',
+    ALARM_URL: 'stat/alarm',
+    SITE_DPI_URL: 'stat/sitedpi',
+    CLIENT_DPI_URL: 'stat/stadpi',
+    CLIENTS_URL: 'stat/sta'
 }
 
+# Width of each bucket returned by the stat reports, in seconds
+STAT_INTERVALS = {
+    DAILY_STAT_URL: 86400,
+    HOURLY_STAT_URL: 3600,
+    MINUTELY_STAT_URL: 300
+}
+
+class _ValidatedResponses:
+    """Bodies of GET responses with their validators, least recently used out first.
+
+    Bounded by the bytes of the bodies kept, as one stats answer can outweigh
+    hundreds of small ones.
+    """
+    def __init__(self, max_bytes: int = MAX_VALIDATED_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> Union[SimpleNamespace, None]:
+        """The validators and body kept for key"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: tuple, headers: Union[dict, None], body: bytes):
+        """Keeps body under its validators, or forgets key when there are none"""
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= len(old.body)
+            if not headers or len(body) > self.max_bytes:
+                return
+            self._entries[key] = SimpleNamespace(headers=headers, body=body)
+            self.bytes += len(body)
+            while self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= len(evicted.body)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
 class Controller:
-    """Provides an interface to the Ubqiuiti Unifi API"""
-    # pylint: disable=too-many-arguments
+    """Provides an interface to the Ubqiuiti Unifi API
+
+    A single instance is safe to share between threads. Requests are spread over a
+    pool of up to pool_size keep-alive connections, threads beyond that wait for a
+    free connection. The login state and error stack are guarded by a lock, and when
+    the controller expires the session only the first thread to notice logs back in;
+    the others wait for it and retry with the new session.
+    """
+    # pylint: disable=too-many-arguments,too-many-instance-attributes
     def __init__(self,
                  host: str,
                  port: int,
                  user: str,
                  password: str,
                  site: str = "default",
-                 ssl_verify=False):
-        """Class to interact with the controller API"""
+                 ssl_verify=False,
+                 pool_size: int = DEFAULT_POOL_SIZE,
+                 rate_limit: Union[float, None] = None,
+                 max_concurrency: Union[int, None] = None,
+                 timezone: Union[str, None] = None,
+                 adapter: Union[BaseAdapter, None] = None):
+        """Class to interact with the controller API
+
+        rate_limit caps requests a second and max_concurrency bounds an adaptive limit
+        on requests in flight, see unifierlib.throttle. Both are off by default.
+        timezone is the site's IANA time zone name, when not given it is read from the
+        site's locale setting on first use, or failing that the controller's system
+        info. adapter replaces the pooled HTTPS transport, for recording or replaying
+        traffic with unifierlib.replay.
+        """
         config = dict()
         config["host"] = host
         config["port"] = port
@@ -45,24 +158,120 @@ class Controller:
         config["password"] = password
         config["root_url"] = f"https://{host}:{port}"
         config["ssl_verify"] = ssl_verify
+        config["timezone"] = timezone
 
         session = requests.Session()
         session.verify = ssl_verify
         if not ssl_verify:
             urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+        # Everything goes to one host, so one pool sized for the threads sharing it.
+        # Blocking makes surplus threads wait rather than open throwaway connections.
+        if adapter is None:
+            adapter = HTTPAdapter(pool_connections=1,
+                                  pool_maxsize=pool_size,
+                                  pool_block=True)
+        session.mount("https://", adapter)
+        session.headers["Connection"] = "keep-alive"
+        session.headers["Accept-Encoding"] = ACCEPT_ENCODING
 
         self._session = session
         self._config = SimpleNamespace(**config)
 
-        self._logged_in = False
+        # The login is shared with every for_site() copy, so a copy logging back in
+        # renews it for all of them; its lock also guards the shared metrics and errors
+        self._auth = SimpleNamespace(lock=threading.RLock(), logged_in=False, generation=0)
+        self._lock = self._auth.lock
         self._error_stack = list()
+        self._flights = SingleFlight()
+        self._request_metrics = deque(maxlen=MAX_REQUEST_METRICS)
+        self._validated = _ValidatedResponses()
+        self._throttle = Throttle(rate=rate_limit, max_concurrency=max_concurrency)
+        self._timezone = None
+        self._timezone_resolved = False
 
         self.login()
 
     @property
     def logged_in(self):
         """The logged in state"""
-        return self._logged_in
+        return self._auth.logged_in
+
+    @property
+    def flight_metrics(self):
+        """How many stats calls were made and how many were coalesced into another"""
+        return self._flights.metrics
+
+    @property
+    def request_metrics(self):
+        """Per-request transfer metrics for the most recent requests, oldest first.
+
+        wire_bytes is what crossed the network (compressed when the controller
+        compressed it) and body_bytes the decoded size.
+        """
+        with self._lock:
+            return list(self._request_metrics)
+
+    @property
+    def transfer_totals(self):
+        """Requests, wire and body bytes and not-modified answers over request_metrics"""
+        metrics = self.request_metrics
+        return SimpleNamespace(requests=len(metrics),
+                               wire_bytes=sum(entry.wire_bytes for entry in metrics),
+                               body_bytes=sum(entry.body_bytes for entry in metrics),
+                               not_modified=sum(entry.not_modified for entry in metrics))
+
+    @property
+    def throttle_metrics(self):
+        """The rate limit, concurrency limit and activity of the request throttle"""
+        return self._throttle.metrics
+
+    @property
+    def site(self):
+        """The site this controller queries"""
+        return self._config.site
+
+    @property
+    def timezone(self) -> TimeZone:
+        """The site's time zone, None when it can't be found and local time is used"""
+        if self._timezone_resolved:
+            return self._timezone
+        name = self._config.timezone
+        if not name and self._auth.logged_in:
+            name = self._site_timezone_name()
+        try:
+            timezone = get_timezone(name)
+        except WindowError as err:
+            self._push_error(name, None, "GET", exception=err)
+            timezone = None
+        with self._lock:
+            if not self._timezone_resolved:
+                self._timezone = timezone
+                # Only settle on local time once the controller could have been asked
+                self._timezone_resolved = bool(self._config.timezone) or self._auth.logged_in
+            return self._timezone
+
+    def _site_timezone_name(self) -> Union[str, None]:
+        """The zone of the site's locale setting, else the controller's own"""
+        name = self._read_timezone(SETTINGS_URL, lambda info: info.get("key") == "locale")
+        return name or self._read_timezone(SYSINFO_URL, lambda info: True)
+
+    def _read_timezone(self, report: str, wanted) -> Union[str, None]:
+        try:
+            data = self._write_to_api(URL_SEGMENTS[report], "GET")
+        except requests.RequestException:
+            return None
+        if not data or data.get("meta", {}).get("rc") != "ok":
+            return None
+        for info in data.get("data") or []:
+            if wanted(info) and info.get("timezone"):
+                return info["timezone"]
+        return None
+
+    @property
+    def error_stack(self):
+        """A copy of the most recent errors, oldest first"""
+        with self._lock:
+            return list(self._error_stack)
 
     def _push_error(self,
                     url: str,
@@ -70,9 +279,6 @@ class Controller:
                     method: str,
                     parameters: Any = None,
                     exception: Any = None):
-        while len(self._error_stack) >= MAX_ERRORS:
-            self._error_stack.pop(0)
-
         stack_entry = {
             "url": url,
             "response": response,
@@ -82,7 +288,10 @@ class Controller:
         }
         stack_entry = SimpleNamespace(**stack_entry)
 
-        self._error_stack.append(stack_entry)
+        with self._lock:
+            while len(self._error_stack) >= MAX_ERRORS:
+                self._error_stack.pop(0)
+            self._error_stack.append(stack_entry)
 
     def login(self):
         """Log into the controller"""
@@ -93,34 +302,76 @@ class Controller:
 
         login_url = f"{self._config.root_url}/api/login"
 
-        try:
-            result = self._session.post(login_url, json=params)
-        except requests.ConnectionError as con_err:
-            self._logged_in = False
-            self._push_error(login_url,
-                             None,
-                             "POST",
-                             parameters=params,
-                             exception=con_err)
-            raise con_err
-
-        if not result.ok:
-            self._logged_in = False
-            result.close()
-            self._push_error(login_url,
-                             result,
-                             "POST",
-                             parameters=params)
-        else:
-            self._logged_in = True
-
-        return self._logged_in
+        with self._lock, phase("login"):
+            try:
+                result = self._session.post(login_url, json=params)
+            except requests.ConnectionError as con_err:
+                self._auth.logged_in = False
+                self._push_error(login_url,
+                                 None,
+                                 "POST",
+                                 parameters=params,
+                                 exception=con_err)
+                raise con_err
+
+            if not result.ok:
+                self._auth.logged_in = False
+                result.close()
+                self._push_error(login_url,
+                                 result,
+                                 "POST",
+                                 parameters=params)
+            else:
+                self._auth.logged_in = True
+                self._auth.generation += 1
+
+            return self._auth.logged_in
+
+    def for_site(self, site: str) -> "Controller":
+        """A Controller for another site on the same controller, without logging in again.
+
+        It shares this one's session, login, connection pool, throttle and error
+        stack; only the site, and with it the time zone, differ.
+        """
+        other = copy.copy(self)
+        other._config = SimpleNamespace(**vars(self._config)) # pylint: disable=protected-access
+        other._config.site = site # pylint: disable=protected-access
+        other._config.timezone = None # pylint: disable=protected-access
+        other._timezone = None # pylint: disable=protected-access
+        other._timezone_resolved = False # pylint: disable=protected-access
+        return other
+
+    def websocket_target(self) -> SimpleNamespace:
+        """Where and with which session cookies to open the site's event stream.
+
+        generation is the login the cookies came from, to hand to _relogin when the
+        stream is refused.
+        """
+        with self._lock:
+            cookies = "; ".join(f"{name}={value}"
+                                for name, value in self._session.cookies.items())
+            generation = self._auth.generation
+        headers = {"Origin": self._config.root_url}
+        if cookies:
+            headers["Cookie"] = cookies
+        return SimpleNamespace(url=(f"wss://{self._config.host}:{self._config.port}"
+                                    f"/wss/s/{self._config.site}/events"),
+                               headers=headers,
+                               ssl_verify=self._config.ssl_verify,
+                               generation=generation)
+
+    def _relogin(self, generation: int) -> bool:
+        """Logs in again unless another thread already has since generation"""
+        with self._lock:
+            if self._auth.generation != generation:
+                return self._auth.logged_in
+            return self.login()
 
     def _write_to_api(self,
                       relative_url: str,
                       method: str,
                       parameters: Union[dict, None] = None) -> Union[MutableMapping, None]:
-        if not self._logged_in:
+        if not self._auth.logged_in:
             return None
         url = f'{self._config.root_url}/api/s/{self._config.site}/{relative_url}'
         return self._write(url, method, parameters)
@@ -130,32 +381,110 @@ class Controller:
                method: str,
                parameters: Union[dict, None] = None) -> Union[MutableMapping, None]:
 
-        if not self._logged_in:
+        if not self._auth.logged_in:
             return None
 
-        _method = self._session.post
+        # Only GETs are conditional, a matching If-None-Match on a POST is a 412
+        cache_key = None
+        validated = None
+        headers = None
         if method == "GET":
-            _method = self._session.get
+            cache_key = (url, json.dumps(parameters, sort_keys=True))
+            validated = self._validated.get(cache_key)
+        if validated:
+            headers = validated.headers
+
+        generation = self._auth.generation
+        response = self._request(url, method, parameters, headers=headers)
+        if response.status_code == 401:
+            # The session expired, log back in once for every thread and try again
+            response.close()
+            if self._relogin(generation):
+                response = self._request(url, method, parameters, headers=headers)
 
-        if parameters:
-            response = _method(url, json=parameters)
-        else:
-            response = _method(url)
+        not_modified = validated is not None and response.status_code == 304
+        body = validated.body if not_modified else response.content
+        self._record_metrics(url, method, response, body, not_modified)
+        if cache_key is not None and response.ok and not not_modified:
+            self._remember_validators(cache_key, response, body)
 
         data = {}
         try:
-            data = json.loads(response.text)
-        except json.JSONDecodeError:
+            # Decoding the bytes directly skips requests' charset detection, which is
+            # slow on large bodies; JSON is always one of the UTF encodings
+            with phase("decode"):
+                data = json.loads(body)
+        except (json.JSONDecodeError, UnicodeDecodeError):
             pass
-        if not response.ok:
+        if not response.ok and not not_modified:
             response.close()
             self._push_error(url,
                              response,
-                             "POST",
+                             method,
                              parameters=parameters)
 
         return data
 
+    def _remember_validators(self,
+                             cache_key: tuple,
+                             response: requests.Response,
+                             body: bytes):
+        """Keeps the body of responses carrying validators for conditional requests"""
+        headers = {}
+        if response.headers.get("ETag"):
+            headers["If-None-Match"] = response.headers["ETag"]
+        if response.headers.get("Last-Modified"):
+            headers["If-Modified-Since"] = response.headers["Last-Modified"]
+        self._validated.put(cache_key, headers, body)
+
+    def _record_metrics(self,
+                        url: str,
+                        method: str,
+                        response: requests.Response,
+                        body: bytes,
+                        not_modified: bool):
+        encoding = response.headers.get("Content-Encoding", "identity")
+        wire_bytes = None
+        try:
+            # Bytes urllib3 pulled off the socket, before decompression
+            wire_bytes = response.raw.tell()
+        except (AttributeError, OSError):
+            pass
+        if not wire_bytes:
+            length = response.headers.get("Content-Length")
+            wire_bytes = int(length) if length and length.isdigit() else len(response.content)
+        elapsed = response.elapsed.total_seconds() if response.elapsed else None
+        entry = SimpleNamespace(url=url,
+                                method=method,
+                                status=response.status_code,
+                                elapsed=elapsed,
+                                encoding=encoding,
+                                wire_bytes=wire_bytes,
+                                body_bytes=len(body),
+                                not_modified=not_modified)
+        with self._lock:
+            self._request_metrics.append(entry)
+
+    def _request(self,
+                 url: str,
+                 method: str,
+                 parameters: Union[dict, None] = None,
+                 headers: Union[dict, None] = None) -> requests.Response:
+        _method = self._session.post
+        if method == "GET":
+            _method = self._session.get
+
+        kwargs = {}
+        if parameters:
+            kwargs["json"] = parameters
+        if headers:
+            kwargs["headers"] = headers
+        with self._throttle.request() as outcome, phase("request"):
+            response = _method(url, **kwargs)
+            # Overload shows up as server errors or being told to slow down
+            outcome.error = response.status_code >= 500 or response.status_code == 429
+        return response
+
     def site_info_simplified(self) -> Union[MutableSequence, None]:
         """Will get basic info about the sites on the controller"""
         url = f'{self._config.root_url}/{URL_SEGMENTS[SITE_STATS_SIMPLE_URL]}'
@@ -166,96 +495,213 @@ class Controller:
         url = f'{self._config.root_url}/{URL_SEGMENTS[SITE_STATS_DETAIL_URL]}'
         return reorganize_site_data(self._write(url, "GET"))
 
+    def get_site_dpi(self, by: str = "by_app") -> Union[MutableSequence, None]:
+        """Will return the site's DPI traffic by application ("by_app") or category ("by_cat")"""
+        return self._get_dpi(SITE_DPI_URL, {"type": by})
+
+    def get_client_dpi(self,
+                       macs: Union[list, None] = None,
+                       by: str = "by_app") -> Union[MutableSequence, None]:
+        """Will return DPI traffic per client, for just the macs given or all of them"""
+        params = {"type": by}
+        if macs:
+            params["macs"] = [mac.lower() for mac in macs]
+        return self._get_dpi(CLIENT_DPI_URL, params)
+
+    def _get_dpi(self, report: str, params: dict) -> Union[MutableSequence, None]:
+        data = self._write_to_api(URL_SEGMENTS[report], "POST", parameters=params)
+        if not data or data.get("meta", {}).get("rc") != "ok":
+            return None
+        return data.get("data") or []
+
+    def get_clients(self) -> Union[MutableSequence, None]:
+        """Will return the site's connected clients, or None when they can't be fetched"""
+        data = self._write_to_api(URL_SEGMENTS[CLIENTS_URL], "GET")
+        if not data or data.get("meta", {}).get("rc") != "ok":
+            return None
+        return data.get("data") or []
+
     def get_daily_stats(self,
                         start: Union[float, None] = None,
                         end: Union[float, None] = None,
                         stat_attributes: list = None) -> Union[MutableSequence, None]:
-        """Will return either a list of time-sorted daily stats or None.
+        """Will return either a StatSeries of daily stats or None.
 
         The start and end parameters default to give the last month's worth of daily usage.
         """
-        if not self._logged_in:
-            return None
-        stats_url = URL_SEGMENTS[DAILY_STAT_URL]
-        if not end or end <= 0.0:
-            end = time.time()
-
-        # Shave the last hour, the controller seems to want this
-        # This is also in keeping with Art-of-Wifi's library
-        end = end - (end % 3600)
-
-        if not start or start >= end:
-            # Go to the beginning of this month
-            end_t = time.localtime(end)
-            start_dt = datetime.date(end_t.tm_year,
-                                     end_t.tm_mon,
-                                     1)
-            start = time.mktime(start_dt.timetuple())
-
-        # Time is in milliseconds since the Epoch
-        end *= 1000
-        start *= 1000
-        return self._get_stats(stats_url, start, end, stat_attributes=stat_attributes)
+        return self._get_windowed_stats(DAILY_STAT_URL, start, end, stat_attributes)
 
     def get_hourly_stats(self,
                          start: Union[float, None] = None,
                          end: Union[float, None] = None,
                          stat_attributes: list = None) -> Union[MutableSequence, None]:
-        """Will return either a list of time-sorted hourly stats or None.
+        """Will return either a StatSeries of hourly stats or None.
 
         The start and end parameters default to give the last 7 days worth of hourly usage.
         """
-        if not self._logged_in:
-            return None
-        stats_url = URL_SEGMENTS[HOURLY_STAT_URL]
-
-        if not end or end <= 0.0:
-            end = time.time()
-
-        # Shave the last hour, the controller seems to want this
-        # This is also in keeping with Art-of-Wifi's library
-        end = end - (end % 3600)
-
-        if not start or start >= end:
-            # Go to the beginning of this month
-            start_dt = datetime.datetime.fromtimestamp(end) - datetime.timedelta(7)
-            start = time.mktime(start_dt.timetuple())
-
-        # Time is in milliseconds since the Epoch
-        end *= 1000
-        start *= 1000
-
-        return self._get_stats(stats_url, start, end, stat_attributes=stat_attributes)
+        return self._get_windowed_stats(HOURLY_STAT_URL, start, end, stat_attributes)
 
     def get_minutely_stats(self,
                            start: Union[float, None] = None,
                            end: Union[float, None] = None,
                            stat_attributes: list = None) -> Union[MutableSequence, None]:
-        """Will return either a list of time-sorted minutely stats or None.
+        """Will return either a StatSeries of minutely stats or None.
 
         The start and end parameters default to give the last 24 hours worth of 5-minute usage.
         """
-        if not self._logged_in:
+        return self._get_windowed_stats(MINUTELY_STAT_URL, start, end, stat_attributes)
+
+    def _get_windowed_stats(self,
+                            granularity: str,
+                            start: Union[float, None],
+                            end: Union[float, None],
+                            stat_attributes: list) -> Union[MutableSequence, None]:
+        if not self._auth.logged_in:
             return None
-        stats_url = URL_SEGMENTS[MINUTELY_STAT_URL]
-
-        if not end or end <= 0.0:
-            end = time.time()
-
         # Shave the last hour, the controller seems to want this
         # This is also in keeping with Art-of-Wifi's library
-        end = end - (end % 3600)
-
-        if not start or start >= end:
-            # Go to the beginning of this month
-            start_dt = datetime.datetime.fromtimestamp(end) - datetime.timedelta(1)
-            start = time.mktime(start_dt.timetuple())
-
+        start, end = default_window(STAT_INTERVALS[granularity], start, end, self.timezone)
+        return self.get_stats(granularity, start, end, stat_attributes=stat_attributes)
+
+    def get_stats(self,
+                  granularity: str,
+                  start: float,
+                  end: float,
+                  stat_attributes: list = None) -> Union[MutableSequence, None]:
+        """Will return a StatSeries of stats for exactly start to end or None.
+
+        The granularity is one of DAILY_STAT_URL, HOURLY_STAT_URL or MINUTELY_STAT_URL.
+        Unlike the get_*_stats methods no defaults or rounding are applied to the window.
+        """
+        if not self._auth.logged_in:
+            return None
+        stats_url = URL_SEGMENTS[granularity]
         # Time is in milliseconds since the Epoch
-        end *= 1000
-        start *= 1000
-
-        return self._get_stats(stats_url, start, end, stat_attributes=stat_attributes)
+        return self._get_stats(stats_url,
+                               start * 1000,
+                               end * 1000,
+                               stat_attributes=stat_attributes)
+
+    def iter_stats(self,
+                   granularity: str,
+                   start: float,
+                   end: float,
+                   stat_attributes: list = None,
+                   page_buckets: int = PAGE_BUCKETS,
+                   prefetch: bool = True) -> Iterator[MutableMapping]:
+        """Lazily yields the buckets with start <= time < end in time order.
+
+        The window is walked a page of page_buckets at a time. While the buckets of one
+        page are consumed the next page is fetched in the background, so at most one
+        page beyond the last one used is requested when the consumer stops early.
+        Iteration stops at the first page that can't be fetched, see error_stack.
+        """
+        span = page_buckets * STAT_INTERVALS[granularity]
+
+        def paginate():
+            page_start = start
+            while page_start < end:
+                yield page_start, min(page_start + span, end)
+                page_start += span
+        pages = paginate()
+
+        def fetch(page):
+            page_start, page_end = page
+            # _get_stats appends "time" to the attributes, so give each page its own list
+            attributes = list(stat_attributes) if stat_attributes else None
+            # The controller's end is inclusive, stop just short of the next page
+            stats = self.get_stats(granularity,
+                                   page_start,
+                                   page_end - 1,
+                                   stat_attributes=attributes)
+            return None if stats is None else stats.between(page_start, page_end)
+
+        if not prefetch:
+            for page in pages:
+                stats = fetch(page)
+                if stats is None:
+                    return
+                yield from stats
+            return
+
+        executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            page = next(pages, None)
+            pending = executor.submit(fetch, page) if page else None
+            while pending is not None:
+                stats = pending.result()
+                page = next(pages, None)
+                pending = executor.submit(fetch, page) if page and stats is not None else None
+                if stats is None:
+                    return
+                yield from stats
+        finally:
+            # Stopping early drops the prefetched page rather than waiting on it
+            executor.shutdown(wait=False)
+
+    def iter_events(self,
+                    cursor: Union[LogCursor, None] = None,
+                    page_size: int = LOG_PAGE_SIZE,
+                    within: int = LOG_WITHIN_HOURS) -> Iterator[MutableMapping]:
+        """Lazily yields the site's event log oldest first, after cursor when given.
+
+        Without a cursor the last within hours up to now are read, with one the
+        records since it. See unifierlib.logs for resuming ingestion across runs.
+        """
+        return self._iter_log(EVENT_URL, cursor, page_size, within)
+
+    def iter_alarms(self,
+                    cursor: Union[LogCursor, None] = None,
+                    page_size: int = LOG_PAGE_SIZE,
+                    within: int = LOG_WITHIN_HOURS) -> Iterator[MutableMapping]:
+        """Lazily yields the site's alarms oldest first, after cursor when given"""
+        return self._iter_log(ALARM_URL, cursor, page_size, within)
+
+    def _iter_log(self,
+                  log: str,
+                  cursor: Union[LogCursor, None],
+                  page_size: int,
+                  within: int) -> Iterator[MutableMapping]:
+        """Pages through a log oldest first, stopping at the first page that fails.
+
+        Pages are keyed on time between a start and end pinned when the walk begins,
+        each page starting at the last time read and skipping the records already
+        read at that time. Offsets into a sliding window would shift as the oldest
+        records aged out, silently skipping records.
+        """
+        end = int(time.time() * 1000)
+        if cursor is not None and cursor.time is not None:
+            start = cursor.time
+        else:
+            start = end - within * 3600000
+        # A copy, so the caller's cursor stays put; it also drops repeats across pages
+        seen = LogCursor(*((cursor.time, cursor.ids) if cursor is not None else ()))
+        skip = 0
+        while True:
+            params = {
+                "_sort": "+time",
+                "start": start,
+                "end": end,
+                "_start": skip,
+                "_limit": page_size
+            }
+            data = self._write_to_api(URL_SEGMENTS[log], "POST", parameters=params)
+            if not data or data.get("meta", {}).get("rc") != "ok":
+                return
+            records = data.get("data") or []
+            for record in records:
+                if seen.is_new(record):
+                    yield record
+            seen.advance(records)
+            if len(records) < page_size:
+                return
+            last = records[-1].get("time") or 0
+            at_last = sum(1 for record in records if (record.get("time") or 0) == last)
+            if last == start:
+                # A whole page at one time, step past it within that time
+                skip += at_last
+            else:
+                start, skip = last, at_last
 
     def _get_stats(self,
                    relative_url: str,
@@ -279,6 +725,18 @@ class Controller:
             "start": start
         }
 
+        # Identical concurrent queries share one controller call and its decoded result,
+        # each caller gets its own series over the shared buckets
+        key = (self._config.site, relative_url, tuple(stat_attributes), start, end)
+        statistics = self._flights.do(key, self._fetch_stats, relative_url, params)
+        if statistics is None:
+            return None
+        return statistics.between()
+
+    def _fetch_stats(self,
+                     relative_url: str,
+                     params: dict) -> Union[StatSeries, None]:
+        """Makes the stats request and decodes the answer"""
         data = self._write_to_api(relative_url, "POST", parameters=params)
 
         if not data:
@@ -290,13 +748,15 @@ class Controller:
 
         data = data["data"]
 
-        statistics = dict()
+        statistics = list()
 
         for item in data:
             item_t = item.get("time", 0) / 1000 # Go Back to Seconds
             if item_t == 0:
                 continue
             item["time"] = item_t
-            statistics[item_t] = item
+            statistics.append(item)
 
-        return [statistics[key] for key in sorted(statistics.keys())]
+        # The controller already answers in time order, so this is usually a single pass
+        with phase("sort"):
+            return StatSeries(statistics)
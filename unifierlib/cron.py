@@ -0,0 +1,105 @@
+"""Cron-style schedules
+
+A CronSchedule reads the five fields of a crontab line, minute, hour, day of the
+month, month and day of the week, each a `*`, a number, a range `a-b`, a step
+`*/n` or `a-b/n`, or a comma separated list of those. As in cron, when both day
+fields are restricted a day matching either one is due. The `@hourly`, `@daily`,
+`@weekly`, `@monthly` and `@yearly` shorthands are understood too.
+"""
+
+import datetime
+from typing import FrozenSet, Tuple
+
+from unifierlib.windows import TimeZone
+
+SHORTHANDS = {
+    "@hourly": "0 * * * *",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@weekly": "0 0 * * 0",
+    "@monthly": "0 0 1 * *",
+    "@yearly": "0 0 1 1 *",
+    "@annually": "0 0 1 1 *"
+}
+# (name, lowest, highest) of each field
+FIELDS = (("minute", 0, 59), ("hour", 0, 23), ("day", 1, 31), ("month", 1, 12),
+          ("weekday", 0, 7))
+# Further than any schedule can be from its next run, leap days included
+SEARCH_LIMIT = datetime.timedelta(days=366 * 8)
+
+class CronError(ValueError):
+    """Raised for schedules that can't be parsed"""
+
+def _parse_field(text: str, lowest: int, highest: int) -> Tuple[FrozenSet[int], bool]:
+    """The values a field allows and whether it is restricted at all"""
+    values = set()
+    for part in text.split(","):
+        span, _, step = part.partition("/")
+        try:
+            step = int(step) if step else 1
+            if span == "*":
+                start, stop = lowest, highest
+            elif "-" in span:
+                start, stop = (int(bound) for bound in span.split("-", 1))
+            else:
+                start = int(span)
+                stop = highest if step > 1 else start
+        except ValueError as err:
+            raise CronError(f"Can't read {part!r}") from err
+        if step < 1 or start < lowest or stop > highest or start > stop:
+            raise CronError(f"{part!r} is outside {lowest}-{highest}")
+        values.update(range(start, stop + 1, step))
+    return frozenset(values), text != "*"
+
+class CronSchedule:
+    """When a five field cron expression is due"""
+    def __init__(self, expression: str):
+        self.expression = expression
+        fields = SHORTHANDS.get(expression.strip().lower(), expression).split()
+        if len(fields) != len(FIELDS):
+            raise CronError(f"{expression!r} needs {len(FIELDS)} fields")
+        parsed = [_parse_field(text, lowest, highest)
+                  for text, (_, lowest, highest) in zip(fields, FIELDS)]
+        (self.minutes, _), (self.hours, _), (self.days, self._days_restricted), \
+            (self.months, _), (weekdays, self._weekdays_restricted) = parsed
+        # Cron counts Sunday as 0 or 7, Python's weekday() has Monday as 0
+        self.weekdays = frozenset((day - 1) % 7 for day in weekdays)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.expression!r})"
+
+    def _day_matches(self, day: datetime.datetime) -> bool:
+        in_month = day.day in self.days
+        in_week = day.weekday() in self.weekdays
+        if self._days_restricted and self._weekdays_restricted:
+            return in_month or in_week
+        return in_month and in_week
+
+    def next_after(self, after: float, tz: TimeZone = None) -> float:
+        """The first due minute strictly after the epoch time after, on the wall clock of tz.
+
+        The search steps through instants rather than wall clock times, so an hour
+        repeated when the clocks go back is walked through twice and the answer is
+        always later than after.
+        """
+        instant = (after // 60 + 1) * 60
+        limit = instant + SEARCH_LIMIT.total_seconds()
+        # Each miss skips to the start of the next month, day or hour that could match
+        while instant < limit:
+            moment = datetime.datetime.fromtimestamp(instant, tz)
+            if moment.month not in self.months:
+                year, month = divmod(moment.month, 12)
+                start = moment.replace(year=moment.year + year, month=month + 1, day=1,
+                                       hour=0, minute=0, fold=0)
+                instant = max(start.timestamp(), instant + 60)
+            elif not self._day_matches(moment):
+                start = (moment.replace(tzinfo=None) + datetime.timedelta(days=1)).replace(
+                    hour=0, minute=0, tzinfo=moment.tzinfo, fold=0)
+                instant = max(start.timestamp(), instant + 60)
+            elif moment.hour not in self.hours:
+                instant += (60 - moment.minute) * 60
+            elif moment.minute not in self.minutes:
+                instant += 60
+            else:
+                return instant
+        raise CronError(f"{self.expression!r} is never due")
@@ -0,0 +1,139 @@
+"""Traffic by application across sites from the DPI reports
+
+`stat/sitedpi` answers with a site's bytes per application (or per category) and
+`stat/stadpi` the same per client. Rows from any number of sites are folded into
+running totals keyed on (category, application), and the top N are picked with a
+heap, so millions of rows cost one pass and a small selection rather than a sort.
+
+The controller only reports numeric ids. A DpiLookup turns them into names from a
+JSON table such as {"categories": {"4": "Streaming"}, "applications": {"4:12":
+"Netflix"}}, caching each decoded id; ids missing from the table get readable
+placeholders.
+"""
+
+import heapq
+import json
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Union, Iterable, Iterator, MutableMapping, Sequence, List, Tuple
+
+from unifierlib.controller import Controller
+
+BY_APP = "by_app"
+BY_CAT = "by_cat"
+DEFAULT_TOP = 10
+MAX_WORKERS = 4
+
+Key = Tuple[int, Union[int, None]]
+
+class DpiLookup:
+    """Cached names for DPI category and application ids"""
+    def __init__(self, table: Union[MutableMapping, None] = None):
+        table = table or {}
+        self._categories = {int(cat): name
+                            for cat, name in (table.get("categories") or {}).items()}
+        self._applications = {}
+        for key, name in (table.get("applications") or {}).items():
+            cat, _, app = str(key).partition(":")
+            self._applications[(int(cat), int(app))] = name
+        self._cache = {}
+
+    @classmethod
+    def load(cls, path: str) -> "DpiLookup":
+        """Reads a table from a JSON file"""
+        with open(path, encoding="utf-8") as table:
+            return cls(json.load(table))
+
+    def name(self, key: Key) -> str:
+        """The name of a (category, application) key, application None for a category"""
+        cached = self._cache.get(key)
+        if cached is None:
+            cat, app = key
+            category = self._categories.get(cat, f"Category {cat}")
+            if app is None:
+                cached = category
+            else:
+                cached = self._applications.get(key, f"{category} app {app}")
+            self._cache[key] = cached
+        return cached
+
+def dpi_rows(data: Iterable[MutableMapping], by: str = BY_APP) -> Iterator[tuple]:
+    """Flattens a sitedpi or stadpi answer into (key, tx_bytes, rx_bytes) rows"""
+    for entry in data or []:
+        for row in entry.get(by) or []:
+            app = row.get("app") if by == BY_APP else None
+            yield ((row.get("cat"), app),
+                   row.get("tx_bytes") or 0,
+                   row.get("rx_bytes") or 0)
+
+class DpiTotals:
+    """Running tx/rx totals per DPI key, and the sites each key was seen on"""
+    def __init__(self):
+        self.totals = {}
+        self.sites = {}
+
+    def add(self, rows: Iterable[tuple], site: Union[str, None] = None):
+        """Folds rows in, noting site against each key"""
+        totals = self.totals
+        for key, tx_bytes, rx_bytes in rows:
+            current = totals.get(key)
+            if current is None:
+                totals[key] = [tx_bytes, rx_bytes]
+            else:
+                current[0] += tx_bytes
+                current[1] += rx_bytes
+            if site is not None:
+                self.sites.setdefault(key, set()).add(site)
+
+    def top(self,
+            count: int = DEFAULT_TOP,
+            metric: str = "total",
+            lookup: Union[DpiLookup, None] = None) -> List[SimpleNamespace]:
+        """The count keys with the most traffic, highest first"""
+        pick = {"total": lambda item: item[1][0] + item[1][1],
+                "tx": lambda item: item[1][0],
+                "rx": lambda item: item[1][1]}
+        if metric not in pick:
+            raise ValueError(f"Unknown metric {metric}, expected one of {', '.join(pick)}")
+        lookup = lookup or DpiLookup()
+        ranked = heapq.nlargest(count, self.totals.items(), key=pick[metric])
+        return [SimpleNamespace(rank=rank,
+                                category=key[0],
+                                application=key[1],
+                                name=lookup.name(key),
+                                tx_bytes=tx_bytes,
+                                rx_bytes=rx_bytes,
+                                total=tx_bytes + rx_bytes,
+                                sites=len(self.sites.get(key, ())))
+                for rank, (key, (tx_bytes, rx_bytes)) in enumerate(ranked, 1)]
+
+def dpi_report(controller: Controller,
+               sites: Union[Sequence[str], None] = None,
+               count: int = DEFAULT_TOP,
+               by: str = BY_APP,
+               metric: str = "total",
+               lookup: Union[DpiLookup, None] = None,
+               max_workers: int = MAX_WORKERS) -> Union[SimpleNamespace, None]:
+    """Fetches many sites' DPI stats concurrently and ranks the applications.
+
+    sites defaults to every site on the controller. Returns the top entries and the
+    sites whose DPI stats couldn't be fetched, or None when the site list can't be.
+    """
+    if sites is None:
+        known = controller.site_info_simplified()
+        if not isinstance(known, MutableMapping) or "meta" in known:
+            return None
+        sites = list(known)
+
+    def fetch(site):
+        return site, controller.for_site(site).get_site_dpi(by)
+
+    totals = DpiTotals()
+    failed = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for site, data in executor.map(fetch, sites):
+            if data is None:
+                failed.append(site)
+                continue
+            totals.add(dpi_rows(data, by), site)
+    return SimpleNamespace(top=totals.top(count, metric, lookup), failed=failed)
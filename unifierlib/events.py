@@ -0,0 +1,394 @@
+"""Live events pushed over the controller's websocket
+
+The controller pushes events, alarms and device updates to `/wss/s/<site>/events`
+for any client holding a logged-in session cookie. An EventSubscriber keeps that
+connection open on a background thread, reconnecting with exponential backoff,
+and delivers each parsed event to a callback or to iterators through a bounded
+queue. When the queue is full the reader stops reading, so a slow consumer pushes
+back on the controller instead of growing memory; with drop_oldest the oldest
+queued event is discarded instead.
+
+The websocket client is a small RFC 6455 implementation on the standard library,
+enough for the text frames the controller sends.
+"""
+
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import queue
+import random
+import socket
+import ssl
+import struct
+import threading
+import time
+from types import SimpleNamespace
+from typing import Union, Callable, Iterator, MutableMapping
+from urllib.parse import urlsplit
+
+QUEUE_SIZE = 1000
+BACKOFF_INITIAL = 1.0
+BACKOFF_MAX = 60.0
+# Seconds a read may block, so stop() is noticed promptly
+READ_TIMEOUT = 1.0
+CONNECT_TIMEOUT = 10.0
+
+_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+class WebSocketError(Exception):
+    """Raised when the websocket handshake or framing fails"""
+    def __init__(self, message: str, status: Union[int, None] = None):
+        super().__init__(message)
+        self.status = status
+
+class WebSocket:
+    """A minimal client end of a websocket"""
+    def __init__(self,
+                 url: str,
+                 headers: Union[MutableMapping, None] = None,
+                 ssl_verify: bool = True,
+                 timeout: float = CONNECT_TIMEOUT):
+        parts = urlsplit(url)
+        secure = parts.scheme == "wss"
+        host = parts.hostname
+        port = parts.port or (443 if secure else 80)
+        sock = socket.create_connection((host, port), timeout=timeout)
+        if secure:
+            context = ssl.create_default_context()
+            if not ssl_verify:
+                context.check_hostname = False
+                context.verify_mode = ssl.CERT_NONE
+            sock = context.wrap_socket(sock, server_hostname=host)
+        self._sock = sock
+        self._buffer = b""
+        self._fragments = []
+        self.closed = False
+        try:
+            self._handshake(parts, host, port, headers or {})
+        except Exception:
+            sock.close()
+            raise
+
+    def _handshake(self, parts, host: str, port: int, headers: MutableMapping):
+        key = base64.b64encode(os.urandom(16)).decode("ascii")
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        lines = [f"GET {path} HTTP/1.1",
+                 f"Host: {host}:{port}",
+                 "Upgrade: websocket",
+                 "Connection: Upgrade",
+                 f"Sec-WebSocket-Key: {key}",
+                 "Sec-WebSocket-Version: 13"]
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        self._sock.sendall(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+
+        while b"\r\n\r\n" not in self._buffer:
+            self._fill()
+        head, self._buffer = self._buffer.split(b"\r\n\r\n", 1)
+        status_line, *header_lines = head.decode("latin-1").split("\r\n")
+        status = status_line.split(" ", 2)
+        code = int(status[1]) if len(status) > 1 and status[1].isdigit() else None
+        if code != 101:
+            raise WebSocketError(f"Websocket upgrade refused: {status_line}", code)
+        answer = {}
+        for line in header_lines:
+            name, _, value = line.partition(":")
+            answer[name.strip().lower()] = value.strip()
+        expected = base64.b64encode(hashlib.sha1(key.encode("ascii") + _GUID).digest())
+        if answer.get("sec-websocket-accept", "").encode("ascii") != expected:
+            raise WebSocketError("Websocket upgrade answered with the wrong accept key")
+
+    def _fill(self):
+        chunk = self._sock.recv(65536)
+        if not chunk:
+            raise ConnectionError("Websocket closed by the controller")
+        self._buffer += chunk
+
+    def settimeout(self, timeout: Union[float, None]):
+        """Bounds how long recv() blocks waiting for data"""
+        self._sock.settimeout(timeout)
+
+    def send(self, payload: bytes, opcode: int = OP_TEXT):
+        """Sends one masked frame, as clients must"""
+        length = len(payload)
+        if length < 126:
+            header = struct.pack("!BB", 0x80 | opcode, 0x80 | length)
+        elif length < 1 << 16:
+            header = struct.pack("!BBH", 0x80 | opcode, 0x80 | 126, length)
+        else:
+            header = struct.pack("!BBQ", 0x80 | opcode, 0x80 | 127, length)
+        mask = os.urandom(4)
+        masked = bytes(byte ^ mask[index % 4] for index, byte in enumerate(payload))
+        self._sock.sendall(header + mask + masked)
+
+    def _parse_frame(self):
+        """Takes one whole frame off the buffer, or returns None until all of it is in"""
+        buffer = self._buffer
+        if len(buffer) < 2:
+            return None
+        first, second = buffer[0], buffer[1]
+        length = second & 0x7F
+        offset = 2
+        if length == 126:
+            if len(buffer) < 4:
+                return None
+            (length,) = struct.unpack_from("!H", buffer, 2)
+            offset = 4
+        elif length == 127:
+            if len(buffer) < 10:
+                return None
+            (length,) = struct.unpack_from("!Q", buffer, 2)
+            offset = 10
+        mask = None
+        if second & 0x80:
+            mask = buffer[offset:offset + 4]
+            offset += 4
+        if len(buffer) < offset + length:
+            return None
+        payload = buffer[offset:offset + length]
+        if mask:
+            payload = bytes(byte ^ mask[index % 4] for index, byte in enumerate(payload))
+        self._buffer = buffer[offset + length:]
+        return bool(first & 0x80), first & 0x0F, payload
+
+    def _frame(self):
+        # Frames are only taken off the buffer whole, so a read timeout loses nothing
+        frame = self._parse_frame()
+        while frame is None:
+            self._fill()
+            frame = self._parse_frame()
+        return frame
+
+    def recv(self) -> Union[str, None]:
+        """The next text message, None once the controller closes the connection.
+
+        Raises socket.timeout when nothing arrives within the timeout; a partly read
+        message is kept and picked up by the next call.
+        """
+        while True:
+            fin, opcode, payload = self._frame()
+            if opcode == OP_PING:
+                self.send(payload, OP_PONG)
+            elif opcode == OP_CLOSE:
+                if not self.closed:
+                    self.closed = True
+                    try:
+                        self.send(payload[:2], OP_CLOSE)
+                    except OSError:
+                        pass
+                return None
+            elif opcode in (OP_TEXT, OP_BINARY, OP_CONTINUATION):
+                self._fragments.append(payload)
+                if fin:
+                    message = b"".join(self._fragments)
+                    self._fragments = []
+                    return message.decode("utf-8", "replace")
+
+    def close(self):
+        """Says goodbye and closes the socket"""
+        if not self.closed:
+            self.closed = True
+            try:
+                self.send(struct.pack("!H", 1000), OP_CLOSE)
+            except OSError:
+                pass
+        self._sock.close()
+
+def parse_message(text: str) -> list:
+    """The events in one controller message, each tagged with the message type"""
+    try:
+        message = json.loads(text)
+    except ValueError:
+        return []
+    if not isinstance(message, dict):
+        return []
+    kind = (message.get("meta") or {}).get("message")
+    return [SimpleNamespace(message=kind, data=data)
+            for data in message.get("data") or []]
+
+class EventSubscriber:
+    """Keeps a websocket to the controller open and queues the events it pushes.
+
+    Either give a callback, run on a dispatcher thread for every event, or iterate
+    with events() or `async for`. Call stop() (or leave the with block) when done.
+    """
+    # pylint: disable=too-many-instance-attributes,too-many-arguments
+    def __init__(self,
+                 controller,
+                 callback: Union[Callable, None] = None,
+                 queue_size: int = QUEUE_SIZE,
+                 drop_oldest: bool = False,
+                 backoff_initial: float = BACKOFF_INITIAL,
+                 backoff_max: float = BACKOFF_MAX,
+                 url: Union[str, None] = None):
+        """url overrides the controller's event stream address"""
+        self._controller = controller
+        self._callback = callback
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._drop_oldest = drop_oldest
+        self._backoff_initial = backoff_initial
+        self._backoff_max = backoff_max
+        self._url = url
+        self._stopping = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._metrics = SimpleNamespace(received=0, delivered=0, dropped=0,
+                                        connects=0, failures=0, callback_errors=0,
+                                        last_callback_error=None, connected=False)
+
+    @property
+    def metrics(self):
+        """Events received, delivered and dropped, connection attempts and callback errors"""
+        with self._lock:
+            return SimpleNamespace(**vars(self._metrics), queued=self._queue.qsize())
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        """Connects in the background and starts delivering events"""
+        if self._threads:
+            return
+        self._stopping.clear()
+        self._threads.append(threading.Thread(target=self._run, daemon=True))
+        if self._callback is not None:
+            self._threads.append(threading.Thread(target=self._dispatch, daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout: Union[float, None] = None):
+        """Closes the connection and waits for the background threads"""
+        self._stopping.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _connect(self) -> WebSocket:
+        target = self._controller.websocket_target()
+        url = self._url or target.url
+        try:
+            return WebSocket(url, target.headers, target.ssl_verify)
+        except WebSocketError as err:
+            if err.status in (401, 403):
+                # The session expired, log in again for the next attempt unless another
+                # user of the session already has
+                self._controller._relogin(target.generation) # pylint: disable=protected-access
+            raise
+
+    def _run(self):
+        delay = self._backoff_initial
+        while not self._stopping.is_set():
+            try:
+                websocket = self._connect()
+            except (OSError, WebSocketError):
+                with self._lock:
+                    self._metrics.failures += 1
+                # Full jitter keeps a fleet of subscribers from reconnecting in step
+                self._stopping.wait(random.uniform(0, delay))
+                delay = min(delay * 2, self._backoff_max)
+                continue
+
+            with self._lock:
+                self._metrics.connects += 1
+                self._metrics.connected = True
+            websocket.settimeout(READ_TIMEOUT)
+            try:
+                while not self._stopping.is_set():
+                    try:
+                        text = websocket.recv()
+                    except socket.timeout:
+                        continue
+                    if text is None:
+                        break
+                    delay = self._backoff_initial
+                    for event in parse_message(text):
+                        self._enqueue(event)
+            except (OSError, WebSocketError):
+                pass
+            finally:
+                websocket.close()
+                with self._lock:
+                    self._metrics.connected = False
+            if not self._stopping.is_set():
+                self._stopping.wait(random.uniform(0, delay))
+                delay = min(delay * 2, self._backoff_max)
+
+    def _enqueue(self, event: SimpleNamespace):
+        with self._lock:
+            self._metrics.received += 1
+        while not self._stopping.is_set():
+            try:
+                if self._drop_oldest:
+                    self._queue.put_nowait(event)
+                else:
+                    # Waiting here stops reading, which is the backpressure
+                    self._queue.put(event, timeout=READ_TIMEOUT)
+                return
+            except queue.Full:
+                if not self._drop_oldest:
+                    continue
+            try:
+                self._queue.get_nowait()
+                with self._lock:
+                    self._metrics.dropped += 1
+            except queue.Empty:
+                pass
+
+    def get(self, timeout: Union[float, None] = None) -> Union[SimpleNamespace, None]:
+        """The next event, None if none arrives within timeout or after stop()"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = READ_TIMEOUT
+            if deadline is not None:
+                wait = min(wait, deadline - time.monotonic())
+                if wait <= 0:
+                    return None
+            try:
+                event = self._queue.get(timeout=wait)
+            except queue.Empty:
+                if self._stopping.is_set():
+                    return None
+                continue
+            with self._lock:
+                self._metrics.delivered += 1
+            return event
+
+    def events(self) -> Iterator[SimpleNamespace]:
+        """Yields events as they arrive, ending once stopped and the queue is drained"""
+        while True:
+            event = self.get()
+            if event is None:
+                return
+            yield event
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> SimpleNamespace:
+        loop = asyncio.get_running_loop()
+        event = await loop.run_in_executor(None, self.get)
+        if event is None:
+            raise StopAsyncIteration
+        return event
+
+    def _dispatch(self):
+        for event in self.events():
+            try:
+                self._callback(event)
+            except Exception as err: # pylint: disable=broad-except
+                # A failing callback must not stop delivery, or the queue fills and
+                # the reader stalls
+                with self._lock:
+                    self._metrics.callback_errors += 1
+                    self._metrics.last_callback_error = f"{type(err).__name__}: {err}"
@@ -0,0 +1,200 @@
+"""Exports stat buckets to local time-series stores
+
+Two stores are supported without extra dependencies: InfluxDB line protocol files,
+ready for `influx write`, and a SQLite table. Both are keyed on site, granularity and
+bucket time, so exporting the same buckets again replaces them rather than adding
+duplicates: InfluxDB overwrites points with the same series and timestamp, and the
+SQLite table upserts on its primary key.
+
+Only numeric bucket values are exported, strings such as the site id are dropped.
+Line protocol writes every field as a float, as a field that was an integer in one
+bucket and a float in another would be a type conflict InfluxDB refuses.
+"""
+
+import abc
+import math
+import os
+import sqlite3
+from typing import Union, Iterable, Sequence, MutableMapping, List, Tuple
+
+from unifierlib.utility import TIME_KEY
+
+DEFAULT_MEASUREMENT = "unifi_stats"
+DEFAULT_TABLE = "stats"
+# Buckets written per batch, one write or executemany each
+BATCH_SIZE = 5000
+SQLITE_SUFFIXES = (".db", ".sqlite", ".sqlite3")
+
+def numeric_fields(bucket: MutableMapping,
+                   attributes: Union[Sequence[str], None] = None) -> List[Tuple[str, float]]:
+    """The exportable (name, value) pairs of a bucket, in name order"""
+    names = attributes if attributes is not None else sorted(bucket)
+    fields = []
+    for name in names:
+        value = bucket.get(name)
+        if name == TIME_KEY or isinstance(value, bool):
+            continue
+        if isinstance(value, (int, float)):
+            fields.append((name, value))
+    return fields
+
+def _escape(text: str, special: str) -> str:
+    text = text.replace("\\", "\\\\")
+    for char in special:
+        text = text.replace(char, "\\" + char)
+    return text
+
+def to_line_protocol(site: str,
+                     granularity: str,
+                     bucket: MutableMapping,
+                     attributes: Union[Sequence[str], None] = None,
+                     measurement: str = DEFAULT_MEASUREMENT) -> Union[str, None]:
+    """One bucket as an InfluxDB line with a nanosecond timestamp, None without fields"""
+    fields = numeric_fields(bucket, attributes)
+    if not fields:
+        return None
+    field_set = ",".join(f"{_escape(name, ', =')}={float(value)!r}"
+                         for name, value in fields if math.isfinite(value))
+    if not field_set:
+        return None
+    tags = f"granularity={_escape(granularity, ', =')},site={_escape(site, ', =')}"
+    timestamp = int(bucket[TIME_KEY]) * 1000000000
+    return f"{_escape(measurement, ', ')},{tags} {field_set} {timestamp}"
+
+class Exporter(abc.ABC):
+    """Base of the exporters, buffers buckets and writes them a batch at a time"""
+    def __init__(self,
+                 attributes: Union[Sequence[str], None] = None,
+                 batch_size: int = BATCH_SIZE):
+        """attributes limits the exported fields, by default every numeric one"""
+        self.attributes = list(attributes) if attributes else None
+        self.batch_size = batch_size
+        self.exported = 0
+        self._pending = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def export(self, site: str, granularity: str, stats: Iterable[MutableMapping]) -> int:
+        """Queues the buckets of one site and granularity, returns how many were queued"""
+        count = 0
+        for bucket in stats:
+            self._pending.append((site, granularity, bucket))
+            count += 1
+            if len(self._pending) >= self.batch_size:
+                self.flush()
+        return count
+
+    def flush(self):
+        """Writes the queued buckets"""
+        if not self._pending:
+            return
+        pending = self._pending
+        self._pending = []
+        self._write_batch(pending)
+        self.exported += len(pending)
+
+    def close(self):
+        """Flushes and releases the store"""
+        self.flush()
+
+    @abc.abstractmethod
+    def _write_batch(self, batch: List[Tuple[str, str, MutableMapping]]):
+        """Writes one batch of (site, granularity, bucket) to the store"""
+
+class LineProtocolExporter(Exporter):
+    """Appends buckets to a file of InfluxDB line protocol"""
+    def __init__(self,
+                 path: str,
+                 attributes: Union[Sequence[str], None] = None,
+                 batch_size: int = BATCH_SIZE,
+                 measurement: str = DEFAULT_MEASUREMENT):
+        super().__init__(attributes, batch_size)
+        self.path = path
+        self.measurement = measurement
+        self._file = open(path, "a", encoding="utf-8")
+
+    def _write_batch(self, batch):
+        lines = (to_line_protocol(site, granularity, bucket, self.attributes, self.measurement)
+                 for site, granularity, bucket in batch)
+        self._file.writelines(line + "\n" for line in lines if line)
+        self._file.flush()
+
+    def close(self):
+        if self._file is None:
+            return
+        super().close()
+        self._file.close()
+        self._file = None
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+class SQLiteExporter(Exporter):
+    """Upserts buckets into a SQLite table keyed on (site, granularity, time).
+
+    The table grows a NUMERIC column for each attribute the first time it is seen, so
+    buckets with different attributes can share it.
+    """
+    def __init__(self,
+                 path: str,
+                 attributes: Union[Sequence[str], None] = None,
+                 batch_size: int = BATCH_SIZE,
+                 table: str = DEFAULT_TABLE):
+        super().__init__(attributes, batch_size)
+        self.path = path
+        self.table = table
+        self._connection = sqlite3.connect(path)
+        self._connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {_quote(table)} ("
+            "site TEXT NOT NULL, granularity TEXT NOT NULL, time INTEGER NOT NULL, "
+            "PRIMARY KEY (site, granularity, time))")
+        self._columns = self._table_columns()
+
+    def _table_columns(self) -> List[str]:
+        rows = self._connection.execute(f"PRAGMA table_info({_quote(self.table)})")
+        return [row[1] for row in rows]
+
+    def _write_batch(self, batch):
+        rows = [(site,
+                 granularity,
+                 int(bucket[TIME_KEY]),
+                 dict(numeric_fields(bucket, self.attributes)))
+                for site, granularity, bucket in batch]
+        names = sorted({name for *_, fields in rows for name in fields})
+        table = _quote(self.table)
+        with self._connection:
+            for name in names:
+                if name not in self._columns:
+                    self._connection.execute(f"ALTER TABLE {table} ADD COLUMN {_quote(name)} NUMERIC")
+                    self._columns.append(name)
+            columns = ", ".join(_quote(name) for name in ["site", "granularity", "time"] + names)
+            placeholders = ", ".join("?" * (len(names) + 3))
+            # A bucket lacking an attribute leaves the stored value alone
+            updates = ", ".join(f"{_quote(name)} = coalesce(excluded.{_quote(name)}, {_quote(name)})"
+                                for name in names)
+            conflict = f"DO UPDATE SET {updates}" if names else "DO NOTHING"
+            statement = (f"INSERT INTO {table} ({columns}) VALUES ({placeholders}) "
+                         f"ON CONFLICT (site, granularity, time) {conflict}")
+            self._connection.executemany(
+                statement,
+                ((site, granularity, stat_time, *(fields.get(name) for name in names))
+                 for site, granularity, stat_time, fields in rows))
+
+    def close(self):
+        if self._connection is None:
+            return
+        super().close()
+        self._connection.close()
+        self._connection = None
+
+def open_exporter(path: str,
+                  attributes: Union[Sequence[str], None] = None,
+                  batch_size: int = BATCH_SIZE) -> Exporter:
+    """A SQLite exporter for .db, .sqlite and .sqlite3 paths, line protocol otherwise"""
+    if os.path.splitext(path)[1].lower() in SQLITE_SUFFIXES:
+        return SQLiteExporter(path, attributes, batch_size)
+    return LineProtocolExporter(path, attributes, batch_size)
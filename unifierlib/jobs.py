@@ -0,0 +1,235 @@
+"""Scheduled report jobs run inside one long-lived process
+
+A JSON config lists the jobs, each fetching one site's stats on a cron schedule
+and writing them to an output:
+
+    {"jobs": [{"name": "hq-daily", "site": "default", "granularity": "daily",
+               "window": 604800, "output": "hq.db", "schedule": "5 0 * * *",
+               "priority": 0}]}
+
+window is the seconds of stats to fetch, ending at the last whole bucket; left
+out, the granularity's default window is used. output is a path taking the stats
+through unifierlib.export (SQLite for .db, .sqlite and .sqlite3, line protocol
+otherwise), or JSON lines for .jsonl. Lower priorities run first.
+
+A Scheduler keeps the next run of every job in a heap ordered by time. Due jobs
+move to a priority queue drained by a pool of workers, so when the workers are
+busy the most important waiting job goes next. Every job fetches through one
+QueryService, sharing its login, cache and coalescing; a job still queued or
+running when it comes due again skips that run.
+"""
+
+import heapq
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+from types import SimpleNamespace
+from typing import Union, Callable, List, MutableMapping
+
+from unifierlib.controller import STAT_INTERVALS
+from unifierlib.cron import CronSchedule, CronError
+from unifierlib.export import open_exporter
+from unifierlib.logs import JsonLinesSink
+from unifierlib.service import QueryService, WINDOW_FETCHERS
+from unifierlib.windows import align, TimeZone
+
+WORKERS = 4
+JSON_LINES_SUFFIXES = (".jsonl", ".ndjson")
+
+class JobError(ValueError):
+    """Raised for job configs that can't be used"""
+
+def make_job(config: MutableMapping) -> SimpleNamespace:
+    """A job from its config entry"""
+    try:
+        name = config["name"]
+        schedule = CronSchedule(config["schedule"])
+    except KeyError as err:
+        raise JobError(f"A job needs a {err.args[0]}") from err
+    except CronError as err:
+        raise JobError(f"Job {config['name']}: {err}") from err
+    granularity = config.get("granularity", "daily")
+    if granularity not in WINDOW_FETCHERS:
+        raise JobError(f"Job {name}: unknown granularity {granularity}")
+    window = config.get("window")
+    if window is not None and (not isinstance(window, (int, float)) or window <= 0):
+        raise JobError(f"Job {name}: window must be a positive number of seconds")
+    return SimpleNamespace(name=name,
+                           site=config.get("site", "default"),
+                           granularity=granularity,
+                           window=window,
+                           output=config.get("output"),
+                           schedule=schedule,
+                           priority=config.get("priority", 0))
+
+def load_jobs(path: str) -> List[SimpleNamespace]:
+    """The jobs of a config file"""
+    try:
+        with open(path, encoding="utf-8") as config_file:
+            config = json.load(config_file)
+    except (OSError, ValueError) as err:
+        raise JobError(f"Can't read jobs from {path}: {err}") from err
+    jobs = [make_job(entry) for entry in config.get("jobs") or []]
+    names = [job.name for job in jobs]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise JobError(f"Job names must be unique: {', '.join(duplicates)}")
+    return jobs
+
+def write_output(path: str, site: str, granularity: str, stats: List[MutableMapping]) -> int:
+    """Writes stats to path, returning how many buckets were written"""
+    if os.path.splitext(path)[1].lower() in JSON_LINES_SUFFIXES:
+        with JsonLinesSink(path) as sink:
+            sink([{"site": site, "granularity": granularity, **bucket} for bucket in stats])
+        return len(stats)
+    with open_exporter(path) as exporter:
+        return exporter.export(site, granularity, stats)
+
+class Scheduler:
+    """Runs jobs on their schedules with a pool of workers"""
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self,
+                 service: QueryService,
+                 jobs: List[SimpleNamespace],
+                 workers: int = WORKERS,
+                 tz: TimeZone = None,
+                 clock: Callable[[], float] = time.time):
+        """tz is the wall clock the schedules are read on, the local one by default"""
+        self._service = service
+        self._jobs = {job.name: job for job in jobs}
+        self._workers = workers
+        self._tz = tz
+        self._clock = clock
+        self._schedule = []
+        self._ready = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._pending = set()
+        self._lock = threading.Lock()
+        # Exporters aren't shared between threads, so one writer per output at a time
+        self._output_locks = {}
+        self._stopping = threading.Event()
+        self._threads = []
+        self._metrics = {name: SimpleNamespace(runs=0, failures=0, skipped=0, buckets=0,
+                                               last_run=None, last_duration=None,
+                                               total_duration=0.0, max_duration=0.0,
+                                               last_error=None)
+                         for name in self._jobs}
+        now = clock()
+        for job in jobs:
+            self._push(job, job.schedule.next_after(now, tz))
+
+    def _push(self, job: SimpleNamespace, due: float):
+        heapq.heappush(self._schedule, (due, job.priority, next(self._sequence), job.name))
+
+    @property
+    def metrics(self) -> MutableMapping:
+        """Per job runs, failures, skips, buckets written and durations"""
+        with self._lock:
+            return {name: SimpleNamespace(**vars(metrics),
+                                          mean_duration=(metrics.total_duration / metrics.runs
+                                                         if metrics.runs else None))
+                    for name, metrics in self._metrics.items()}
+
+    @property
+    def next_due(self) -> Union[float, None]:
+        """When the next job comes due"""
+        with self._lock:
+            return self._schedule[0][0] if self._schedule else None
+
+    def dispatch(self, now: Union[float, None] = None) -> int:
+        """Queues every job due by now and schedules its next run, returning how many"""
+        now = self._clock() if now is None else now
+        queued = 0
+        with self._lock:
+            while self._schedule and self._schedule[0][0] <= now:
+                due, priority, sequence, name = heapq.heappop(self._schedule)
+                job = self._jobs[name]
+                if name in self._pending:
+                    self._metrics[name].skipped += 1
+                else:
+                    self._pending.add(name)
+                    self._ready.put((priority, due, sequence, name))
+                    queued += 1
+                following = job.schedule.next_after(max(due, now), self._tz)
+                # A next run not after now would be popped again by this loop forever
+                self._push(job, max(following, now + 1))
+        return queued
+
+    def run_job(self, job: SimpleNamespace, now: Union[float, None] = None) -> int:
+        """Fetches and writes one job's stats, returning the buckets written"""
+        now = self._clock() if now is None else now
+        start = end = None
+        if job.window:
+            interval = STAT_INTERVALS[job.granularity]
+            # Ending on a bucket boundary gives jobs over the same stats the same key
+            end = align(now, interval, self._service.site(job.site).timezone)
+            start = end - job.window
+        stats = self._service.stats(job.site, job.granularity, start, end)
+        if not job.output:
+            return len(stats)
+        with self._lock:
+            output_lock = self._output_locks.setdefault(os.path.abspath(job.output),
+                                                        threading.Lock())
+        with output_lock:
+            return write_output(job.output, job.site, job.granularity, stats)
+
+    def _work(self):
+        while True:
+            name = self._ready.get()[3]
+            if name is None:
+                return
+            job = self._jobs[name]
+            started = time.perf_counter()
+            error = None
+            buckets = 0
+            try:
+                buckets = self.run_job(job)
+            except Exception as err: # pylint: disable=broad-except
+                # Whatever a job raises, the worker lives on to run the others
+                error = f"{type(err).__name__}: {err}"
+            finally:
+                duration = time.perf_counter() - started
+                with self._lock:
+                    self._pending.discard(name)
+                    metrics = self._metrics[name]
+                    metrics.runs += 1
+                    metrics.last_run = self._clock()
+                    metrics.last_duration = duration
+                    metrics.total_duration += duration
+                    metrics.max_duration = max(metrics.max_duration, duration)
+                    metrics.buckets += buckets
+                    metrics.last_error = error
+                    if error is not None:
+                        metrics.failures += 1
+
+    def start(self):
+        """Starts the workers; call dispatch() as time passes, or use run()"""
+        if self._threads:
+            return
+        self._stopping.clear()
+        self._threads = [threading.Thread(target=self._work, daemon=True)
+                         for _ in range(self._workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def run(self, poll: float = 1.0):
+        """Dispatches jobs as they come due until stop() is called"""
+        self.start()
+        while not self._stopping.is_set():
+            self.dispatch()
+            due = self.next_due
+            wait = poll if due is None else min(poll, max(due - self._clock(), 0))
+            self._stopping.wait(wait)
+
+    def stop(self, timeout: Union[float, None] = None):
+        """Stops dispatching and waits for the queued and running jobs to finish"""
+        self._stopping.set()
+        for _ in self._threads:
+            # Sorts after any job, so the queue drains first
+            self._ready.put((float("inf"), 0, 0, None))
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
@@ -0,0 +1,116 @@
+"""Resumable ingestion of the event and alarm logs
+
+The logs are paged oldest first, each page keyed on the last time read within a
+window pinned when the walk begins, so neither records arriving nor records aging
+out during a run move the pages. A LogCursor remembers the newest record
+time ingested and the ids seen at exactly that time; saved after every batch, it
+lets a rerun, or a run picking up after a crash, fetch only what is new.
+"""
+
+import json
+import os
+from itertools import islice
+from types import SimpleNamespace
+from typing import Union, Callable, Iterable, Iterator, MutableMapping, List
+
+TIME_KEY = "time"
+ID_KEY = "_id"
+# Records handed to the sink at a time, and the cursor saved after each
+SINK_BATCH = 1000
+
+class LogCursor:
+    """Where ingestion of a log got to, in controller milliseconds"""
+    __slots__ = ("time", "ids")
+
+    def __init__(self, time: Union[float, None] = None, ids: Iterable[str] = ()):
+        self.time = time
+        self.ids = set(ids)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.time!r}, {sorted(self.ids)!r})"
+
+    def is_new(self, record: MutableMapping) -> bool:
+        """Whether record comes after the cursor"""
+        if self.time is None:
+            return True
+        record_time = record.get(TIME_KEY) or 0
+        if record_time != self.time:
+            return record_time > self.time
+        return record.get(ID_KEY) not in self.ids
+
+    def advance(self, records: Iterable[MutableMapping]):
+        """Moves past records"""
+        for record in records:
+            record_time = record.get(TIME_KEY) or 0
+            if self.time is None or record_time > self.time:
+                self.time = record_time
+                self.ids = set()
+            if record_time == self.time and record.get(ID_KEY) is not None:
+                self.ids.add(record[ID_KEY])
+
+    @classmethod
+    def load(cls, path: str) -> "LogCursor":
+        """Reads a saved cursor, a fresh one when there is no file yet"""
+        if not os.path.exists(path):
+            return cls()
+        with open(path, encoding="utf-8") as cursor_file:
+            state = json.load(cursor_file)
+        return cls(state.get("time"), state.get("ids") or ())
+
+    def save(self, path: str):
+        """Writes the cursor, replacing the old one in a single step"""
+        temporary = f"{path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as cursor_file:
+            json.dump({"time": self.time, "ids": sorted(self.ids)}, cursor_file)
+        os.replace(temporary, path)
+
+class JsonLinesSink:
+    """Appends records to a file as JSON lines"""
+    def __init__(self, path: str):
+        self._file = open(path, "a", encoding="utf-8")
+
+    def __call__(self, records: List[MutableMapping]):
+        self._file.writelines(json.dumps(record) + "\n" for record in records)
+        self._file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Closes the file"""
+        self._file.close()
+
+def batched(records: Iterable, size: int) -> Iterator[list]:
+    """Lists of up to size records"""
+    records = iter(records)
+    batch = list(islice(records, size))
+    while batch:
+        yield batch
+        batch = list(islice(records, size))
+
+def ingest(records: Callable[[LogCursor], Iterable[MutableMapping]],
+           sink: Callable[[List[MutableMapping]], None],
+           cursor_path: Union[str, None] = None,
+           batch_size: int = SINK_BATCH) -> SimpleNamespace:
+    """Streams the records after the saved cursor into sink a batch at a time.
+
+    records is Controller.iter_events or Controller.iter_alarms, or anything taking
+    a cursor the same way. The cursor is saved after each batch the sink accepts,
+    so an interrupted run resumes after the last whole batch. Returns the number of
+    records and batches ingested and the final cursor.
+    """
+    cursor = LogCursor.load(cursor_path) if cursor_path else LogCursor()
+    report = SimpleNamespace(ingested=0, batches=0, cursor=cursor)
+    # Filter against a copy, the live cursor moves as batches are committed
+    start = LogCursor(cursor.time, cursor.ids)
+    for batch in batched(records(start), batch_size):
+        sink(batch)
+        cursor.advance(batch)
+        if cursor_path:
+            cursor.save(cursor_path)
+        report.ingested += len(batch)
+        report.batches += 1
+    return report
@@ -0,0 +1,160 @@
+"""Per-phase timing and allocation profiling
+
+Library code marks its phases with `with phase("decode"):`, which costs next to
+nothing unless a Profiler is active. While one is, every phase records its wall
+time, CPU time and, when tracing allocations, the bytes it allocated; cProfile can
+run underneath for a function-level breakdown.
+
+Phases on different threads overlap, so their wall times can add up to more than
+the run took. CPU time is the whole process's and is only meaningful for phases
+that don't overlap others.
+"""
+
+import contextlib
+import cProfile
+import io
+import pstats
+import threading
+import time
+import tracemalloc
+from types import SimpleNamespace
+from typing import Union, MutableMapping
+
+# Functions listed in the text report
+TOP_FUNCTIONS = 25
+
+_ACTIVE = None
+
+class Profiler:
+    """Collects phase timings, and optionally allocations and a cProfile run"""
+    def __init__(self, trace_allocations: bool = True, use_cprofile: bool = True):
+        self.trace_allocations = trace_allocations
+        self.use_cprofile = use_cprofile
+        self.wall = None
+        self._phases = {}
+        self._lock = threading.Lock()
+        self._cprofile = None
+        self._started = None
+
+    @property
+    def phases(self) -> MutableMapping:
+        """Totals per phase name, in the order the phases first ran"""
+        with self._lock:
+            return {name: SimpleNamespace(**vars(totals))
+                    for name, totals in self._phases.items()}
+
+    def start(self):
+        """Starts collecting and makes this the active profiler"""
+        global _ACTIVE # pylint: disable=global-statement
+        if self.trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if self.use_cprofile:
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        self._started = time.perf_counter()
+        _ACTIVE = self
+
+    def stop(self):
+        """Stops collecting"""
+        global _ACTIVE # pylint: disable=global-statement
+        if _ACTIVE is self:
+            _ACTIVE = None
+        if self._started is not None:
+            self.wall = time.perf_counter() - self._started
+        if self._cprofile is not None:
+            self._cprofile.disable()
+        if self.trace_allocations and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """Times the body as one run of phase name"""
+        tracing = self.trace_allocations and tracemalloc.is_tracing()
+        allocated = tracemalloc.get_traced_memory()[0] if tracing else 0
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = time.process_time() - cpu
+            if tracing:
+                allocated = max(0, tracemalloc.get_traced_memory()[0] - allocated)
+            with self._lock:
+                totals = self._phases.get(name)
+                if totals is None:
+                    totals = SimpleNamespace(calls=0, wall=0.0, cpu=0.0, allocated=0)
+                    self._phases[name] = totals
+                totals.calls += 1
+                totals.wall += wall
+                totals.cpu += cpu
+                totals.allocated += allocated
+
+    def report(self, top: int = TOP_FUNCTIONS) -> str:
+        """The phase table followed by the slowest functions by cumulative time"""
+        lines = []
+        if self.wall is not None:
+            lines.append(f"Total wall time: {self.wall:.3f}s")
+        lines.append(f"{'Phase':<16}{'Calls':>8}{'Wall s':>10}{'CPU s':>10}{'Alloc KB':>12}")
+        for name, totals in self.phases.items():
+            lines.append(f"{name:<16}{totals.calls:>8}{totals.wall:>10.3f}"
+                         f"{totals.cpu:>10.3f}{totals.allocated / 1024:>12.1f}")
+        if self._cprofile is not None:
+            stream = io.StringIO()
+            stats = pstats.Stats(self._cprofile, stream=stream)
+            stats.sort_stats("cumulative").print_stats(top)
+            lines.append("")
+            lines.append(stream.getvalue().strip())
+        return "\n".join(lines) + "\n"
+
+    def folded_stacks(self) -> str:
+        """The cProfile run as folded stacks for flamegraph.pl or speedscope.
+
+        cProfile keeps callers, not whole stacks, so each function's own time is
+        charged to the chain through its most expensive caller. Times are in
+        microseconds.
+        """
+        if self._cprofile is None:
+            return ""
+        stats = pstats.Stats(self._cprofile).stats # pylint: disable=no-member
+
+        def label(func):
+            filename, line, name = func
+            return f"{name} ({filename}:{line})".replace(";", ",")
+
+        def chain(func):
+            stack = []
+            seen = set()
+            while func is not None and func not in seen:
+                seen.add(func)
+                stack.append(label(func))
+                callers = stats[func][4] if func in stats else {}
+                # Caller entries are (calls, recursive calls, own time, cumulative time)
+                func = max(callers, key=lambda caller: callers[caller][3], default=None)
+            return ";".join(reversed(stack))
+
+        folded = {}
+        for func, (_, _, own_time, _, _) in stats.items():
+            micros = int(own_time * 1000000)
+            if micros:
+                stack = chain(func)
+                folded[stack] = folded.get(stack, 0) + micros
+        return "".join(f"{stack} {micros}\n" for stack, micros in sorted(folded.items()))
+
+def active() -> Union[Profiler, None]:
+    """The running profiler, if any"""
+    return _ACTIVE
+
+def phase(name: str):
+    """Times the body as phase name on the active profiler, or does nothing"""
+    profiler = _ACTIVE
+    if profiler is None:
+        return contextlib.nullcontext()
+    return profiler.phase(name)
@@ -0,0 +1,147 @@
+"""Cross-granularity reconciliation of the stat reports
+
+The 5-minute buckets of an hour should add up to that hour's bucket, and the hourly
+buckets of a day to the day's. Checking that lets locally derived rollups be trusted
+in place of repeated controller queries.
+"""
+
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Union, List, Sequence, MutableMapping
+
+from unifierlib.controller import Controller, STAT_INTERVALS
+from unifierlib.controller import DAILY_STAT_URL, HOURLY_STAT_URL, MINUTELY_STAT_URL
+from unifierlib.series import StatSeries
+from unifierlib.utility import WAN_TX_KEY, WAN_RX_KEY
+from unifierlib.windows import assign_buckets, midnight, to_local, TimeZone, DAY
+
+DEFAULT_ATTRIBUTES = [WAN_TX_KEY, WAN_RX_KEY]
+# Relative and absolute differences both have to be exceeded to flag a bucket
+DEFAULT_TOLERANCE = 0.01
+DEFAULT_ABS_TOLERANCE = 1024
+
+def bucket_ends(boundaries: Sequence[float],
+                interval: float,
+                tz: TimeZone = None) -> List[float]:
+    """Where each bucket starting at boundaries ends.
+
+    Daily buckets run to the next local midnight, as days across a DST change are
+    23 or 25 hours long; the others run for interval seconds.
+    """
+    if interval < DAY:
+        return [boundary + interval for boundary in boundaries]
+    return [midnight(to_local(boundary, tz).date() + datetime.timedelta(1), tz)
+            for boundary in boundaries]
+
+def rollup(fine: StatSeries,
+           boundaries: Sequence[float],
+           attributes: Sequence[str],
+           fine_interval: float,
+           coarse_interval: float,
+           tz: TimeZone = None) -> MutableMapping:
+    """Sums the fine buckets into the coarse buckets starting at boundaries.
+
+    Returns the per-attribute column of sums, the number of fine buckets that landed in
+    each coarse bucket and the number that were expected. Fine buckets past the end
+    of the coarse bucket before them, as when a coarse bucket is missing, are left out.
+    """
+    width = len(boundaries)
+    ends = bucket_ends(boundaries, coarse_interval, tz)
+    indexes = [index if index >= 0 and stat_time < ends[index] else -1
+               for index, stat_time in zip(assign_buckets(fine.times, boundaries),
+                                           fine.times)]
+    sums = {attr: [0] * width for attr in attributes}
+    counts = [0] * width
+    for attr in attributes:
+        column = sums[attr]
+        for index, bucket in zip(indexes, fine):
+            if index >= 0:
+                column[index] += bucket.get(attr) or 0
+    for index in indexes:
+        if index >= 0:
+            counts[index] += 1
+    expected = [round((bucket_end - boundary) / fine_interval)
+                for boundary, bucket_end in zip(boundaries, ends)]
+    return {"sums": sums, "counts": counts, "expected": expected}
+
+def compare(fine: StatSeries,
+            coarse: StatSeries,
+            fine_interval: float,
+            coarse_interval: float,
+            attributes: Sequence[str] = None,
+            tolerance: float = DEFAULT_TOLERANCE,
+            abs_tolerance: float = DEFAULT_ABS_TOLERANCE,
+            tz: TimeZone = None) -> List[SimpleNamespace]:
+    """Compares coarse buckets with the sum of the fine buckets inside them.
+
+    Only coarse buckets fully covered by fine buckets are compared, with days on the
+    calendar of tz. Returns a discrepancy for every bucket and attribute outside the
+    tolerances.
+    """
+    attributes = attributes or DEFAULT_ATTRIBUTES
+    rolled = rollup(fine, coarse.times, attributes, fine_interval, coarse_interval, tz)
+    covered = [count == expected
+               for count, expected in zip(rolled["counts"], rolled["expected"])]
+
+    discrepancies = []
+    for attr in attributes:
+        actual = rolled["sums"][attr]
+        for index, bucket in enumerate(coarse):
+            if not covered[index]:
+                continue
+            reported = bucket.get(attr) or 0
+            delta = actual[index] - reported
+            relative = abs(delta) / reported if reported else (0.0 if not delta else 1.0)
+            if abs(delta) > abs_tolerance and relative > tolerance:
+                discrepancies.append(SimpleNamespace(time=bucket["time"],
+                                                     attribute=attr,
+                                                     reported=reported,
+                                                     summed=actual[index],
+                                                     delta=delta,
+                                                     relative=relative))
+    return discrepancies
+
+def reconcile(controller: Controller,
+              start: float,
+              end: float,
+              attributes: Sequence[str] = None,
+              tolerance: float = DEFAULT_TOLERANCE,
+              abs_tolerance: float = DEFAULT_ABS_TOLERANCE) -> Union[SimpleNamespace, None]:
+    """Fetches all three reports for start to end in parallel and cross-checks them.
+
+    Returns the minutely-vs-hourly and hourly-vs-daily discrepancies, or None when any
+    of the reports couldn't be fetched.
+    """
+    attributes = list(attributes or DEFAULT_ATTRIBUTES)
+    granularities = [MINUTELY_STAT_URL, HOURLY_STAT_URL, DAILY_STAT_URL]
+    with ThreadPoolExecutor(max_workers=len(granularities)) as executor:
+        futures = [executor.submit(controller.get_stats,
+                                   granularity,
+                                   start,
+                                   end,
+                                   stat_attributes=list(attributes))
+                   for granularity in granularities]
+        minutely, hourly, daily = [future.result() for future in futures]
+
+    if minutely is None or hourly is None or daily is None:
+        return None
+    tz = controller.timezone
+
+    return SimpleNamespace(
+        minutely_hourly=compare(minutely,
+                                hourly,
+                                STAT_INTERVALS[MINUTELY_STAT_URL],
+                                STAT_INTERVALS[HOURLY_STAT_URL],
+                                attributes=attributes,
+                                tolerance=tolerance,
+                                abs_tolerance=abs_tolerance,
+                                tz=tz),
+        hourly_daily=compare(hourly,
+                             daily,
+                             STAT_INTERVALS[HOURLY_STAT_URL],
+                             STAT_INTERVALS[DAILY_STAT_URL],
+                             attributes=attributes,
+                             tolerance=tolerance,
+                             abs_tolerance=abs_tolerance,
+                             tz=tz))
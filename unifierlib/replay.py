@@ -0,0 +1,200 @@
+"""Recording and replay of controller traffic
+
+A Recorder captures each request the Controller makes and the response it got,
+through a RecordingAdapter mounted on the Controller's session. Credentials are
+scrubbed before anything is kept: login bodies, known secret keys anywhere in the
+JSON and cookies never reach the file. Recordings are gzipped JSON lines.
+
+A ReplayAdapter serves a recording back with no network at all, sleeping for the
+original response time scaled by time_scale (0 for as fast as possible), so
+fetch, decode and summarize throughput can be measured on a disconnected machine:
+
+    with Recorder("session.jsonl.gz") as recorder:
+        controller = Controller(host, port, user, password,
+                                adapter=RecordingAdapter(recorder))
+        ...
+    controller = Controller(host, port, "user", "password",
+                            adapter=ReplayAdapter("session.jsonl.gz", time_scale=0))
+"""
+
+import base64
+import gzip
+import json
+import threading
+import time
+from collections import deque
+from io import BytesIO
+from typing import Union, Any
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter, BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+FORMAT = "unifier-recording"
+VERSION = 1
+SCRUBBED = "***"
+# Keys whose values are replaced wherever they appear in a request or response body
+SECRET_KEYS = frozenset(["username", "password", "x_password", "x_passphrase",
+                         "x_shadow", "token", "api_key", "x_api_key"])
+# Response headers kept, enough for decoding and the transfer metrics
+KEPT_HEADERS = ("Content-Type", "Content-Encoding", "Content-Length", "ETag", "Last-Modified")
+
+class ReplayError(Exception):
+    """Raised for recordings that can't be read"""
+
+def scrub(value: Any) -> Any:
+    """A copy of a decoded JSON value with every secret replaced"""
+    if isinstance(value, dict):
+        return {key: SCRUBBED if key.lower() in SECRET_KEYS else scrub(item)
+                for key, item in value.items()}
+    if isinstance(value, list):
+        return [scrub(item) for item in value]
+    return value
+
+def _scrub_body(body: Union[bytes, str, None]) -> Union[str, None]:
+    """The request body as canonical scrubbed JSON, or as text if it isn't JSON"""
+    if not body:
+        return None
+    if isinstance(body, bytes):
+        body = body.decode("utf-8", "replace")
+    try:
+        return json.dumps(scrub(json.loads(body)), sort_keys=True)
+    except ValueError:
+        return body
+
+def _target(url: str) -> str:
+    """The path and query of url, so a recording replays against any host"""
+    parts = urlsplit(url)
+    return parts.path + (f"?{parts.query}" if parts.query else "")
+
+def request_key(method: str, url: str, body: Union[bytes, str, None]) -> tuple:
+    """What a replayed request is matched on"""
+    return (method.upper(), _target(url), _scrub_body(body))
+
+class Recorder:
+    """Collects request/response pairs and writes them out on close"""
+    def __init__(self, path: str):
+        self.path = path
+        self._entries = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def record(self,
+               request: requests.PreparedRequest,
+               response: requests.Response,
+               elapsed: float):
+        """Keeps one scrubbed exchange"""
+        content = response.content or b""
+        try:
+            body = {"body": scrub(json.loads(content))}
+        except ValueError:
+            body = {"body_b64": base64.b64encode(content).decode("ascii")}
+        method, target, request_body = request_key(request.method, request.url, request.body)
+        entry = {"method": method,
+                 "target": target,
+                 "request": request_body,
+                 "status": response.status_code,
+                 "headers": {name: response.headers[name]
+                             for name in KEPT_HEADERS if name in response.headers},
+                 "elapsed": round(elapsed, 6),
+                 **body}
+        with self._lock:
+            self._entries.append(entry)
+
+    def close(self):
+        """Writes the recording"""
+        with self._lock:
+            entries = list(self._entries)
+        with gzip.open(self.path, "wt", encoding="utf-8") as recording:
+            recording.write(json.dumps({"format": FORMAT, "version": VERSION}) + "\n")
+            for entry in entries:
+                recording.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+class RecordingAdapter(HTTPAdapter):
+    """Sends requests as usual and hands every exchange to a Recorder"""
+    def __init__(self, recorder: Recorder, **kwargs):
+        """Takes the HTTPAdapter pool arguments as keywords"""
+        super().__init__(**kwargs)
+        self.recorder = recorder
+
+    def send(self, request, **kwargs): # pylint: disable=arguments-differ
+        started = time.perf_counter()
+        response = super().send(request, **kwargs)
+        # Reading the body here counts its transfer in the recorded time
+        _ = response.content
+        self.recorder.record(request, response, time.perf_counter() - started)
+        return response
+
+def load_recording(path: str) -> list:
+    """The exchanges of a recording, in the order they were made"""
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as recording:
+            header = json.loads(recording.readline() or "{}")
+            if header.get("format") != FORMAT or header.get("version") != VERSION:
+                raise ReplayError(f"{path} is not a version {VERSION} recording")
+            return [json.loads(line) for line in recording if line.strip()]
+    except (OSError, ValueError) as err:
+        raise ReplayError(f"Can't read recording {path}: {err}") from err
+
+class ReplayAdapter(BaseAdapter):
+    """Answers requests from a recording instead of the network.
+
+    Requests are matched on method, path and body. A body that was never recorded,
+    such as a stats window that moved on with the clock, falls back to the responses
+    recorded for the same method and path. Repeats get the matching responses in
+    order; once they run out the last one is served again, so a recording can drive
+    any number of iterations. Requests matching nothing fail as a ConnectionError
+    would.
+    """
+    def __init__(self, path: str, time_scale: float = 1.0, sleep=time.sleep):
+        super().__init__()
+        self.time_scale = time_scale
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._responses = {}
+        for entry in load_recording(path):
+            for key in ((entry["method"], entry["target"], entry["request"]),
+                        (entry["method"], entry["target"])):
+                self._responses.setdefault(key, deque()).append(entry)
+
+    def send(self, request, **kwargs): # pylint: disable=arguments-differ
+        key = request_key(request.method, request.url, request.body)
+        with self._lock:
+            queue = self._responses.get(key) or self._responses.get(key[:2])
+            if not queue:
+                raise requests.ConnectionError(f"No recorded response for {key[0]} {key[1]}",
+                                               request=request)
+            entry = queue.popleft() if len(queue) > 1 else queue[0]
+
+        if self.time_scale:
+            self._sleep(entry["elapsed"] * self.time_scale)
+
+        if "body" in entry:
+            content = json.dumps(entry["body"]).encode("utf-8")
+        else:
+            content = base64.b64decode(entry["body_b64"])
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        response.headers.setdefault("Content-Length", str(len(content)))
+        # Unread, so the transfer metrics fall back on the recorded Content-Length
+        response.raw = BytesIO(content)
+        response._content = content # pylint: disable=protected-access
+        response.url = request.url
+        response.request = request
+        response.reason = "Replayed"
+        response.encoding = "utf-8"
+        return response
+
+    def close(self):
+        pass
@@ -0,0 +1,183 @@
+"""Time-sorted stat series with a time index"""
+
+import bisect
+from typing import Union, Iterable, MutableMapping, MutableSequence, List, Tuple
+
+from unifierlib.utility import TIME_KEY
+
+def _sorted_buckets(buckets: Iterable[MutableMapping]) -> MutableSequence:
+    """Time-sorts buckets if they aren't already, keeping the last of any duplicate time"""
+    buckets = list(buckets)
+    in_order = all(buckets[i][TIME_KEY] <= buckets[i + 1][TIME_KEY]
+                   for i in range(len(buckets) - 1))
+    if not in_order:
+        # Stable, so the last of any duplicates stays last
+        buckets.sort(key=lambda bucket: bucket[TIME_KEY])
+    deduped = []
+    for bucket in buckets:
+        if deduped and deduped[-1][TIME_KEY] == bucket[TIME_KEY]:
+            deduped[-1] = bucket
+        else:
+            deduped.append(bucket)
+    return deduped
+
+class StatSeries(list):
+    """A time-sorted list of stat buckets that keeps a parallel index of their times.
+
+    It is still a list, so it can be iterated, summarized and dumped to JSON as before.
+    Grow it with merge(), append() or extend() to keep the index in step; after any
+    other in-place list mutation call reindex().
+    """
+    def __init__(self, buckets: Iterable[MutableMapping] = ()):
+        super().__init__()
+        self._times = []
+        self.merge(buckets)
+
+    def __reduce__(self):
+        """Rebuilds through the constructor so copies and pickles get their own index"""
+        return (self.__class__, (list(self),))
+
+    @property
+    def times(self) -> List[float]:
+        """The sorted bucket times, this is the index itself and must not be modified"""
+        return self._times
+
+    @property
+    def start(self) -> Union[float, None]:
+        """Time of the first bucket"""
+        return self._times[0] if self._times else None
+
+    @property
+    def end(self) -> Union[float, None]:
+        """Time of the last bucket"""
+        return self._times[-1] if self._times else None
+
+    def reindex(self):
+        """Rebuilds the series and its index after out-of-band list mutation"""
+        buckets = _sorted_buckets(self)
+        list.__setitem__(self, slice(None), buckets)
+        self._times = [bucket[TIME_KEY] for bucket in buckets]
+
+    def merge(self, buckets: Iterable[MutableMapping]) -> int:
+        """Merges buckets into the series in place, returns the number of new times.
+
+        A bucket whose time is already present replaces the existing one. Only the tail
+        of the series from the earliest incoming time onward is touched, so appending
+        newer buckets costs nothing beyond the buckets themselves.
+        """
+        incoming = _sorted_buckets(buckets)
+        if not incoming:
+            return 0
+        incoming_times = [bucket[TIME_KEY] for bucket in incoming]
+
+        if not self._times or incoming_times[0] > self._times[-1]:
+            list.extend(self, incoming)
+            self._times.extend(incoming_times)
+            return len(incoming)
+
+        lower = bisect.bisect_left(self._times, incoming_times[0])
+        old = list.__getitem__(self, slice(lower, None))
+        old_times = self._times[lower:]
+        merged = []
+        merged_times = []
+        added = 0
+        i = j = 0
+        while i < len(old) and j < len(incoming):
+            if old_times[i] < incoming_times[j]:
+                merged.append(old[i])
+                merged_times.append(old_times[i])
+                i += 1
+            else:
+                if old_times[i] == incoming_times[j]:
+                    i += 1
+                else:
+                    added += 1
+                merged.append(incoming[j])
+                merged_times.append(incoming_times[j])
+                j += 1
+        merged.extend(old[i:])
+        merged_times.extend(old_times[i:])
+        merged.extend(incoming[j:])
+        merged_times.extend(incoming_times[j:])
+        added += len(incoming) - j
+
+        list.__setitem__(self, slice(lower, None), merged)
+        self._times[lower:] = merged_times
+        return added
+
+    def append(self, bucket: MutableMapping):
+        """Adds one bucket, keeping the series sorted"""
+        self.merge([bucket])
+
+    def extend(self, buckets: Iterable[MutableMapping]):
+        """Adds many buckets, keeping the series sorted"""
+        self.merge(buckets)
+
+    def clear(self):
+        """Empties the series"""
+        list.clear(self)
+        self._times = []
+
+    def _bounds(self,
+                start: Union[float, None],
+                end: Union[float, None]) -> Tuple[int, int]:
+        lower = 0 if start is None else bisect.bisect_left(self._times, start)
+        upper = len(self._times) if end is None else bisect.bisect_left(self._times, end)
+        return lower, max(lower, upper)
+
+    def between(self,
+                start: Union[float, None] = None,
+                end: Union[float, None] = None) -> "StatSeries":
+        """Returns a new series of the buckets with start <= time < end"""
+        lower, upper = self._bounds(start, end)
+        series = StatSeries()
+        list.extend(series, list.__getitem__(self, slice(lower, upper)))
+        series._times = self._times[lower:upper] # pylint: disable=protected-access
+        return series
+
+    def get(self, stat_time: float) -> Union[MutableMapping, None]:
+        """Returns the bucket at exactly stat_time or None"""
+        index = bisect.bisect_left(self._times, stat_time)
+        if index < len(self._times) and self._times[index] == stat_time:
+            return self[index]
+        return None
+
+    def nearest(self, stat_time: float) -> Union[MutableMapping, None]:
+        """Returns the bucket closest to stat_time, the earlier one on a tie"""
+        if not self._times:
+            return None
+        index = bisect.bisect_left(self._times, stat_time)
+        if index == 0:
+            return self[0]
+        if index == len(self._times):
+            return self[-1]
+        before = self._times[index - 1]
+        after = self._times[index]
+        if stat_time - before <= after - stat_time:
+            return self[index - 1]
+        return self[index]
+
+    def gaps(self,
+             interval: float,
+             start: Union[float, None] = None,
+             end: Union[float, None] = None) -> List[Tuple[float, float]]:
+        """Finds runs of missing buckets as (first_missing, next_present) time pairs.
+
+        Buckets are expected every interval seconds. When start or end are given, missing
+        buckets before the first or after the last are reported too; end is exclusive.
+        """
+        lower, upper = self._bounds(start, end)
+        times = self._times[lower:upper]
+        found = []
+        previous = None
+        if start is not None:
+            previous = start - interval
+        for stat_time in times:
+            if previous is not None and stat_time - previous > interval:
+                found.append((previous + interval, stat_time))
+            previous = stat_time
+        if end is not None:
+            expected = start if previous is None else previous + interval
+            if expected is not None and expected < end:
+                found.append((expected, end))
+        return found
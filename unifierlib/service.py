@@ -0,0 +1,231 @@
+"""A local JSON query service in front of one controller
+
+Tools that each log in and ask the controller the same questions multiply its
+load. A QueryService logs in once, keeps a Controller per site from for_site() on
+the shared session, and answers repeated queries from a TTL cache. Identical
+queries arriving while the first is still with the controller wait for it through
+a SingleFlight rather than asking again. make_server() exposes it over HTTP:
+
+    GET /sites                              site_info_simplified
+    GET /sites/detailed                     site_info_detailed
+    GET /s/<site>/stats/<granularity>       get_stats, ?start=&end= in epoch seconds
+    GET /s/<site>/clients                   get_clients
+    GET /s/<site>/dpi                       get_site_dpi, ?by=by_app or by_cat
+    GET /metrics                            hit ratio and controller call rate
+
+Answers the controller couldn't give are 502 and never cached.
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from functools import partial
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from types import SimpleNamespace
+from typing import Union, Any, Callable, Hashable, Tuple
+from urllib.parse import urlsplit, parse_qs
+
+from unifierlib.controller import Controller
+from unifierlib.controller import DAILY_STAT_URL, HOURLY_STAT_URL, MINUTELY_STAT_URL
+from unifierlib.singleflight import SingleFlight
+
+CACHE_TTL = 60.0
+CACHE_ENTRIES = 1024
+DEFAULT_PORT = 8089
+# The Controller methods fetching each granularity's default window
+WINDOW_FETCHERS = {DAILY_STAT_URL: "get_daily_stats",
+                   HOURLY_STAT_URL: "get_hourly_stats",
+                   MINUTELY_STAT_URL: "get_minutely_stats"}
+DPI_TYPES = ("by_app", "by_cat")
+
+class QueryError(Exception):
+    """Raised for queries the service can't answer, with the HTTP status to send"""
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+class TTLCache:
+    """A least recently used cache whose entries expire ttl seconds after being stored"""
+    def __init__(self, ttl: float = CACHE_TTL, max_entries: int = CACHE_ENTRIES,
+                 clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """(True, value) for a fresh entry, (False, None) otherwise"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires, value = entry
+            if expires <= self._clock():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def put(self, key: Hashable, value: Any):
+        """Stores value, evicting the least recently used entry when full"""
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+class QueryService:
+    """Answers queries for any site from a cache, asking the controller at most once"""
+    def __init__(self, controller: Controller, ttl: float = CACHE_TTL,
+                 max_entries: int = CACHE_ENTRIES):
+        self._controller = controller
+        self._cache = TTLCache(ttl, max_entries)
+        self._flights = SingleFlight()
+        self._sites = {}
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._metrics = SimpleNamespace(queries=0, hits=0, misses=0, controller_calls=0,
+                                        failures=0)
+
+    def site(self, site: str) -> Controller:
+        """The pooled Controller for site, sharing the one session"""
+        with self._lock:
+            controller = self._sites.get(site)
+            if controller is None:
+                controller = self._sites[site] = self._controller.for_site(site)
+            return controller
+
+    @property
+    def metrics(self) -> SimpleNamespace:
+        """Queries, cache hits and misses, and controller calls per minute"""
+        with self._lock:
+            metrics = SimpleNamespace(**vars(self._metrics))
+            metrics.sites = len(self._sites)
+        minutes = max(time.monotonic() - self._started, 1e-9) / 60
+        metrics.hit_ratio = metrics.hits / metrics.queries if metrics.queries else 0.0
+        metrics.controller_calls_per_minute = metrics.controller_calls / minutes
+        metrics.coalesced = self._flights.metrics.coalesced
+        metrics.cached = len(self._cache)
+        return metrics
+
+    def _count(self, **increments):
+        with self._lock:
+            for name, increment in increments.items():
+                setattr(self._metrics, name, getattr(self._metrics, name) + increment)
+
+    def query(self, key: Hashable, fetch: Callable[[], Any]) -> Any:
+        """The cached answer for key, fetched once when it isn't cached"""
+        self._count(queries=1)
+        hit, value = self._cache.get(key)
+        if hit:
+            self._count(hits=1)
+            return value
+        self._count(misses=1)
+        return self._flights.do(key, self._fetch, key, fetch)
+
+    def _fetch(self, key: Hashable, fetch: Callable[[], Any]) -> Any:
+        # A waiter may have been beaten to it by a flight that just finished
+        hit, value = self._cache.get(key)
+        if hit:
+            return value
+        self._count(controller_calls=1)
+        value = fetch()
+        if value is None or (isinstance(value, dict) and "meta" in value):
+            self._count(failures=1)
+            raise QueryError("The controller didn't answer", 502)
+        self._cache.put(key, value)
+        return value
+
+    def sites(self, detailed: bool = False) -> Any:
+        """The controller's sites"""
+        if detailed:
+            return self.query(("sites", True), self._controller.site_info_detailed)
+        return self.query(("sites", False), self._controller.site_info_simplified)
+
+    def stats(self, site: str, granularity: str,
+              start: Union[float, None] = None, end: Union[float, None] = None) -> Any:
+        """A site's stats, the default window when start or end is missing"""
+        if granularity not in WINDOW_FETCHERS:
+            raise QueryError(f"Unknown granularity {granularity}", 404)
+        controller = self.site(site)
+        if start is None or end is None:
+            fetch = partial(getattr(controller, WINDOW_FETCHERS[granularity]), start, end)
+        else:
+            fetch = partial(controller.get_stats, granularity, start, end)
+        return self.query(("stats", site, granularity, start, end), fetch)
+
+    def clients(self, site: str) -> Any:
+        """A site's connected clients"""
+        return self.query(("clients", site), self.site(site).get_clients)
+
+    def dpi(self, site: str, by: str = "by_app") -> Any:
+        """A site's DPI traffic"""
+        if by not in DPI_TYPES:
+            raise QueryError(f"Unknown DPI type {by}")
+        return self.query(("dpi", site, by), partial(self.site(site).get_site_dpi, by))
+
+    def handle(self, path: str, query: dict) -> Any:
+        """The answer for a GET of path with its parsed query string"""
+        parts = [part for part in path.split("/") if part]
+        if parts == ["sites"]:
+            return self.sites()
+        if parts == ["sites", "detailed"]:
+            return self.sites(detailed=True)
+        if parts == ["metrics"]:
+            return vars(self.metrics)
+        if len(parts) >= 3 and parts[0] == "s":
+            site, resource = parts[1], parts[2:]
+            if resource[0] == "stats" and len(resource) == 2:
+                return self.stats(site, resource[1],
+                                  _number(query, "start"), _number(query, "end"))
+            if resource == ["clients"]:
+                return self.clients(site)
+            if resource == ["dpi"]:
+                return self.dpi(site, (query.get("by") or ["by_app"])[0])
+        raise QueryError(f"Nothing at {path}", 404)
+
+def _number(query: dict, name: str) -> Union[float, None]:
+    values = query.get(name)
+    if not values:
+        return None
+    try:
+        return float(values[0])
+    except ValueError as err:
+        raise QueryError(f"{name} must be a number of seconds") from err
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """Serves the QueryService of its server as JSON"""
+    server_version = "unifier-query"
+
+    def do_GET(self): # pylint: disable=invalid-name
+        """Answers one query"""
+        parts = urlsplit(self.path)
+        try:
+            status, body = 200, self.server.service.handle(parts.path, parse_qs(parts.query))
+        except QueryError as err:
+            status, body = err.status, {"error": str(err)}
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args): # pylint: disable=redefined-builtin
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+def make_server(service: QueryService, host: str = "127.0.0.1", port: int = DEFAULT_PORT,
+                quiet: bool = False) -> ThreadingHTTPServer:
+    """A server answering each request on its own thread; call serve_forever() on it"""
+    server = ThreadingHTTPServer((host, port), QueryHandler)
+    server.daemon_threads = True
+    server.service = service
+    server.quiet = quiet
+    return server
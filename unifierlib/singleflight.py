@@ -0,0 +1,64 @@
+"""Coalescing of identical concurrent calls"""
+
+import threading
+from types import SimpleNamespace
+from typing import Any, Callable, Hashable
+
+class _Call:
+    """One in-flight call and the outcome its waiters will share"""
+    __slots__ = ("done", "result", "exception")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.exception = None
+
+class SingleFlight:
+    """Runs at most one call per key at a time.
+
+    Callers arriving while a call for the same key is running wait for it and get its
+    result (or its exception) instead of making their own call. Nothing is cached once
+    the call completes.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._calls = 0
+        self._coalesced = 0
+
+    def do(self, key: Hashable, func: Callable, *args, **kwargs) -> Any:
+        """Calls func(*args, **kwargs) unless a call for key is already running"""
+        with self._lock:
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._in_flight[key] = call
+                self._calls += 1
+            else:
+                self._coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.exception is not None:
+                raise call.exception
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+        except BaseException as exc:
+            call.exception = exc
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            call.done.set()
+        return call.result
+
+    @property
+    def metrics(self) -> SimpleNamespace:
+        """Calls made, calls coalesced into another and calls currently running"""
+        with self._lock:
+            return SimpleNamespace(calls=self._calls,
+                                   coalesced=self._coalesced,
+                                   in_flight=len(self._in_flight))
@@ -0,0 +1,156 @@
+"""Client-side rate limiting and adaptive concurrency for controller calls
+
+Small controllers (a Cloud Key for instance) slow to a crawl or start failing when
+they are sent too much at once. A token bucket caps the request rate, and an AIMD
+limit on requests in flight backs off sharply when latency or errors climb and creeps
+back up while the controller keeps up.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+from typing import Callable, Union
+
+class TokenBucket:
+    """Allows rate requests a second on average with bursts of up to burst"""
+    def __init__(self,
+                 rate: float,
+                 burst: Union[float, None] = None,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._tokens = self.burst
+        self._updated = clock()
+        self.waited = 0.0
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens: float = 1.0):
+        """Takes tokens, blocking until the bucket would have refilled enough.
+
+        Tokens are reserved up front, letting the bucket go into debt, so each caller
+        sleeps exactly once and waiting callers are served in the order they arrived.
+        """
+        with self._lock:
+            self._refill()
+            self._tokens -= tokens
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            self.waited += delay
+        if delay > 0:
+            self._sleep(delay)
+
+class AdaptiveConcurrency:
+    """Additive-increase/multiplicative-decrease limit on calls in flight.
+
+    Each call slower than target_latency, or failing, cuts the limit by backoff, at most
+    once per limit's worth of completions so a burst of failures from one window only
+    counts once. Every success adds 1/limit, which grows the limit by one per window.
+    """
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self,
+                 initial: int = 4,
+                 minimum: int = 1,
+                 maximum: int = 32,
+                 target_latency: float = 2.0,
+                 backoff: float = 0.5):
+        if not minimum <= initial <= maximum:
+            raise ValueError("initial must be between minimum and maximum")
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.backoff = backoff
+        self._limit = float(initial)
+        self._in_flight = 0
+        self._since_decrease = 0
+        self._condition = threading.Condition()
+        self.increases = 0
+        self.decreases = 0
+
+    @property
+    def limit(self) -> int:
+        """The current number of calls allowed in flight"""
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        """The calls currently in flight"""
+        return self._in_flight
+
+    def acquire(self):
+        """Blocks until a call may start"""
+        with self._condition:
+            while self._in_flight >= int(self._limit):
+                self._condition.wait()
+            self._in_flight += 1
+
+    def release(self, latency: float, error: bool = False):
+        """Records a finished call and adjusts the limit"""
+        with self._condition:
+            self._in_flight -= 1
+            self._since_decrease += 1
+            if error or latency > self.target_latency:
+                if self._since_decrease >= int(self._limit):
+                    self._limit = max(float(self.minimum), self._limit * self.backoff)
+                    self._since_decrease = 0
+                    self.decreases += 1
+            elif self._limit < self.maximum:
+                self._limit = min(float(self.maximum), self._limit + 1.0 / self._limit)
+                self.increases += 1
+            self._condition.notify_all()
+
+class Throttle:
+    """Rate limit and adaptive concurrency applied together, either may be left off"""
+    def __init__(self,
+                 rate: Union[float, None] = None,
+                 burst: Union[float, None] = None,
+                 max_concurrency: Union[int, None] = None,
+                 target_latency: float = 2.0):
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.concurrency = None
+        if max_concurrency:
+            self.concurrency = AdaptiveConcurrency(initial=min(4, max_concurrency),
+                                                   maximum=max_concurrency,
+                                                   target_latency=target_latency)
+
+    @contextmanager
+    def request(self):
+        """Waits for a token and a slot, yields an outcome to flag errors on.
+
+        Exceptions raised inside the block count as errors.
+        """
+        if self.bucket:
+            self.bucket.acquire()
+        if self.concurrency:
+            self.concurrency.acquire()
+        outcome = SimpleNamespace(error=False)
+        started = time.monotonic()
+        try:
+            yield outcome
+        except BaseException:
+            outcome.error = True
+            raise
+        finally:
+            if self.concurrency:
+                self.concurrency.release(time.monotonic() - started, outcome.error)
+
+    @property
+    def metrics(self) -> SimpleNamespace:
+        """The current limit and activity of the throttle"""
+        concurrency = self.concurrency
+        return SimpleNamespace(
+            rate=self.bucket.rate if self.bucket else None,
+            waited=self.bucket.waited if self.bucket else 0.0,
+            limit=concurrency.limit if concurrency else None,
+            in_flight=concurrency.in_flight if concurrency else None,
+            increases=concurrency.increases if concurrency else 0,
+            decreases=concurrency.decreases if concurrency else 0)
@@ -1,9 +1,11 @@
 """A collection of utility functions"""
 
 import json
-import time
 from typing import Union, Tuple, MutableMapping
 
+from unifierlib.windows import format_time, TimeZone
+from unifierlib.profiling import phase
+
 WAN_TX_KEY = "wan-tx_bytes"
 WAN_RX_KEY = "wan-rx_bytes"
 TIME_KEY = "time"
@@ -81,8 +83,9 @@ class HumanizedByte:
 def summarize_stats(stats: dict,
                     time_fmt: str,
                     do_json=False,
-                    do_list=False):
-    """Collects and summarizes statistics"""
+                    do_list=False,
+                    tz: TimeZone = None):
+    """Collects and summarizes statistics, listing times on the wall clock of tz"""
     if not stats:
         return
     total_tx = 0
@@ -90,26 +93,32 @@ def summarize_stats(stats: dict,
     for stat_entry in stats:
         total_tx += stat_entry[WAN_TX_KEY]
         total_rx += stat_entry[WAN_RX_KEY]
+
+    if not do_json:
+        if do_list:
+            with phase("format"):
+                for stat_entry in stats:
+                    t_x = stat_entry[WAN_TX_KEY]
+                    r_x = stat_entry[WAN_RX_KEY]
+                    total_i = HumanizedByte(t_x + r_x)
+                    t_x = HumanizedByte(t_x)
+                    r_x = HumanizedByte(r_x)
+                    time_str = format_time(stat_entry["time"], time_fmt, tz)
+                    print(f"{time_str}: Up: {t_x}; Down: {r_x}; Total: {total_i}")
+        show_totals(total_tx, total_rx)
+    else:
+        with phase("format"):
+            print(json.dumps(stats))
+
+def show_totals(total_tx: float, total_rx: float):
+    """Prints the upload, download and combined totals"""
     total = total_rx + total_tx
 
     total_tx = HumanizedByte(total_tx)
     total_rx = HumanizedByte(total_rx)
     total = HumanizedByte(total)
 
-    if not do_json:
-        if do_list:
-            for stat_entry in stats:
-                t_x = stat_entry[WAN_TX_KEY]
-                r_x = stat_entry[WAN_RX_KEY]
-                total_i = HumanizedByte(t_x + r_x)
-                t_x = HumanizedByte(t_x)
-                r_x = HumanizedByte(r_x)
-                time_str = time.strftime(time_fmt,
-                                         time.gmtime(stat_entry["time"]))
-                print(f"{time_str}: Up: {t_x}; Down: {r_x}; Total: {total_i}")
-        print(f'Total: Up: {total_tx}; Down: {total_rx}; Total: {total}')
-    else:
-        print(json.dumps(stats))
+    print(f'Total: Up: {total_tx}; Down: {total_rx}; Total: {total}')
 
 def reorganize_site_data(data: MutableMapping) -> Union[None, MutableMapping]:
     """Attempts to reorganize the site data in a more helpful way, as a dict by name of the site"""
@@ -0,0 +1,144 @@
+"""Time zone aware stat windows and bucket alignment
+
+The controller buckets its reports on the site's wall clock: daily buckets start at
+the site's local midnight and hourly ones on its local hours. Windows and bucket
+boundaries are therefore worked out in the site's time zone, not the collector's.
+A tz of None means the collector's local time, which is what everything used before
+sites had a time zone.
+"""
+
+import bisect
+import datetime
+import time
+from typing import Union, List, Sequence, Tuple
+
+try:
+    import zoneinfo
+    HAVE_ZONEINFO = True
+except ImportError:
+    # Before Python 3.9 the same module comes from backports.zoneinfo
+    try:
+        from backports import zoneinfo
+        HAVE_ZONEINFO = True
+    except ImportError:
+        HAVE_ZONEINFO = False
+
+try:
+    import numpy
+    HAVE_NUMPY = True
+except ImportError:
+    HAVE_NUMPY = False
+
+HOUR = 3600
+DAY = 86400
+# Below this many times the per-time bisect beats converting to arrays
+NUMPY_THRESHOLD = 4096
+
+TimeZone = Union[datetime.tzinfo, None]
+
+class WindowError(ValueError):
+    """Raised for time zones that can't be resolved"""
+
+def get_timezone(name: Union[str, None]) -> TimeZone:
+    """Resolves an IANA time zone name such as "Europe/Berlin", None stays None"""
+    if not name:
+        return None
+    if name.upper() in ("UTC", "Z", "ETC/UTC"):
+        return datetime.timezone.utc
+    if not HAVE_ZONEINFO:
+        raise WindowError(f"No time zone database to resolve {name}")
+    try:
+        return zoneinfo.ZoneInfo(name)
+    except (zoneinfo.ZoneInfoNotFoundError, ValueError) as err:
+        raise WindowError(f"Unknown time zone {name}") from err
+
+def to_local(stat_time: float, tz: TimeZone = None) -> datetime.datetime:
+    """The wall clock time at stat_time in tz, naive for the collector's time"""
+    return datetime.datetime.fromtimestamp(stat_time, tz)
+
+def utc_offset(stat_time: float, tz: TimeZone = None) -> float:
+    """Seconds tz is ahead of UTC at stat_time"""
+    if tz is None:
+        return time.localtime(stat_time).tm_gmtoff
+    return to_local(stat_time, tz).utcoffset().total_seconds()
+
+def format_time(stat_time: float, time_fmt: str, tz: TimeZone = None) -> str:
+    """Formats stat_time as the wall clock in tz"""
+    return to_local(stat_time, tz).strftime(time_fmt)
+
+def midnight(day: datetime.date, tz: TimeZone = None) -> float:
+    """The time of the first instant of day in tz"""
+    return datetime.datetime(day.year, day.month, day.day, tzinfo=tz).timestamp()
+
+def align(stat_time: float, interval: float, tz: TimeZone = None) -> float:
+    """The start of the bucket of interval seconds holding stat_time.
+
+    Daily buckets start at local midnight, shorter ones on multiples of the interval
+    in local time, which only differs from UTC for zones off by a part of an hour.
+    """
+    if interval >= DAY:
+        return midnight(to_local(stat_time, tz).date(), tz)
+    return stat_time - (stat_time + utc_offset(stat_time, tz)) % interval
+
+def bucket_boundaries(interval: float,
+                      start: float,
+                      end: float,
+                      tz: TimeZone = None) -> List[float]:
+    """The bucket start times with start <= time < end.
+
+    Days across a DST change are 23 or 25 hours long, so daily boundaries step a
+    calendar day at a time; the others step a fixed interval.
+    """
+    if interval < DAY:
+        first = align(start, interval, tz)
+        if first < start:
+            first += interval
+        count = max(0, int(-(-(end - first) // interval)))
+        return [first + index * interval for index in range(count)]
+
+    day = to_local(start, tz).date()
+    if midnight(day, tz) < start:
+        day += datetime.timedelta(1)
+    boundaries = []
+    while midnight(day, tz) < end:
+        boundaries.append(midnight(day, tz))
+        day += datetime.timedelta(1)
+    return boundaries
+
+def assign_buckets(times: Sequence[float], boundaries: Sequence[float]) -> List[int]:
+    """Maps each time to the index of the last boundary at or before it, or -1.
+
+    The times need not be sorted. Large inputs go through numpy's searchsorted when
+    it is installed.
+    """
+    if HAVE_NUMPY and len(times) >= NUMPY_THRESHOLD:
+        indexes = numpy.searchsorted(numpy.asarray(boundaries, dtype=float),
+                                     numpy.asarray(times, dtype=float),
+                                     side="right") - 1
+        return indexes.tolist()
+    boundaries = list(boundaries)
+    return [bisect.bisect_right(boundaries, stat_time) - 1 for stat_time in times]
+
+def default_window(interval: float,
+                   start: Union[float, None] = None,
+                   end: Union[float, None] = None,
+                   tz: TimeZone = None) -> Tuple[float, float]:
+    """The window the get_*_stats methods ask for, in seconds.
+
+    end defaults to now and is cut back to the start of its local hour. Without a
+    usable start, daily stats go back to the start of the month, hourly ones a week
+    and 5-minute ones a day, all on the local calendar.
+    """
+    if not end or end <= 0.0:
+        end = time.time()
+    end = align(end, HOUR, tz)
+    if start and start < end:
+        return start, end
+
+    local_end = to_local(end, tz)
+    if interval >= DAY:
+        start = midnight(local_end.date().replace(day=1), tz)
+    else:
+        days = 7 if interval >= HOUR else 1
+        start = (local_end - datetime.timedelta(days)).timestamp()
+    return start, end
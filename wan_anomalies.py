@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""Script to flag unusual WAN traffic on the sites of the local controller"""
+
+import json
+
+try:
+    from dotenv import load_dotenv
+    HAVE_DOT_ENV = True
+except ImportError:
+    HAVE_DOT_ENV = False
+
+import click
+
+from cli_lib import prompt_for_missing, profiled
+from unifierlib import Controller
+from unifierlib.anomaly import AnomalyDetector, detect, ALPHA, THRESHOLD
+from unifierlib.utility import HumanizedByte
+from unifierlib.windows import format_time
+
+if HAVE_DOT_ENV:
+    load_dotenv()
+
+def show_anomaly(anomaly):
+    """Prints one unusual bucket"""
+    direction = "Up" if anomaly.metric == "tx" else "Down"
+    print(f"{anomaly.site} {format_time(anomaly.time, '%Y-%m-%d %H:00')}: "
+          f"{direction}: {HumanizedByte(anomaly.value)}, "
+          f"expected {HumanizedByte(anomaly.expected)} ({anomaly.score:+.1f} sd)")
+
+@click.command()
+@click.option("--host", "-H", "host",
+              envvar="UNIFI_HOST",
+              help="Hostname or IP address of the controller")
+@click.option("--port", "-p", "port",
+              envvar='UNIFI_PORT',
+              default=8443,
+              show_default=True,
+              help="Port number where the controller is hosting the API")
+@click.option("--user", "-u", "user",
+              envvar='UNIFI_USER',
+              help="Username with privileges to the API")
+@click.option("--password", "--pass", "--pwd", "-P", "password",
+              envvar='UNIFI_PASSWD',
+              help="Password for the user")
+@click.option("--site", "-s", "sites",
+              multiple=True,
+              help="Site to watch, repeat for more; every site when not given")
+@click.option("--state", "-f", "state_path",
+              envvar="UNIFI_ANOMALY_STATE",
+              default="wan_baselines.json",
+              show_default=True,
+              type=click.Path(dir_okay=False),
+              help="File the baselines are kept in between runs")
+@click.option("--alpha", "-a", "alpha",
+              type=click.FloatRange(min=0, max=1, min_open=True),
+              help=f"Weight of each new hour in the baselines  [default: {ALPHA}]")
+@click.option("--threshold", "-t", "threshold",
+              type=click.FloatRange(min=0, min_open=True),
+              help=f"Standard deviations that count as unusual  [default: {THRESHOLD}]")
+@click.option("--json", "-j", "do_json",
+              default=False, is_flag=True,
+              help="Show the anomalies in JSON format")
+@click.option("--profile", "profile",
+              default=False, is_flag=True,
+              help="Print time, CPU and allocations per phase and the slowest functions to stderr")
+@click.option("--profile-stacks", "profile_stacks",
+              type=click.Path(dir_okay=False),
+              help="Write folded stacks for a flame graph to this file")
+def main(host, port, user, password, sites, state_path, alpha, threshold, do_json,
+         profile, profile_stacks):
+    """Flag hours of unusual WAN traffic against each site's usual week."""
+    with profiled(profile, profile_stacks):
+        host, user, password = prompt_for_missing(host, user, password)
+        controller = Controller(host,
+                                port,
+                                user,
+                                password,
+                                ssl_verify=False)
+        if not controller.logged_in:
+            return
+
+        settings = {name: value for name, value in
+                    (("alpha", alpha), ("threshold", threshold)) if value is not None}
+        detector = AnomalyDetector.load(state_path, **settings)
+        anomalies = detect(controller, detector, sites=list(sites) or None)
+        detector.save(state_path)
+        if do_json:
+            print(json.dumps([vars(anomaly) for anomaly in anomalies]))
+            return
+        for anomaly in anomalies:
+            show_anomaly(anomaly)
+
+if __name__ == "__main__":
+    #pylint: disable=no-value-for-parameter
+    main()